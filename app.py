@@ -2,18 +2,30 @@ import os
 import json
 import logging
 from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
-from flask import session
-import socket
+from flask import session, Response, stream_with_context, g
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
 import sys
 from pathlib import Path
+from urllib.parse import urlparse
 
 sys.path.append(str(Path(__file__).parent))
 sys.path.append(str(Path(__file__).parent / 'app'))
 
-from cloudflare_tunnel_api import TunnelManager, CloudflareTunnelAPI
-from cloudflare_config import CloudflareConfig
+from cloudflare_tunnel_api import invalidate_metadata_cache, metadata_cache, set_rate_limiter_factory
+from cloudflare_tunnel_api import set_invalidation_publisher, drop_cached
+from cloudflare_tunnel_api import DEFAULT_SHARED_TUNNEL_NAME, read_cache, inflight_requests
 from tunnel_process_manager import TunnelProcessManager
+from jobs import JobManager
+from tunnel_registry import TunnelRegistry
+from config_service import ConfigService
+from metrics import REGISTRY, relabel_exposition, family_names
+from resource_sampler import ResourceSampler
+from tunnel_daemon import TunnelDaemonClient, RemoteJobManager
+from network_info import NetworkInfoService, is_local_address
+from rate_limiter import request_priority, BACKGROUND
 
 app = Flask(__name__, template_folder='.')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -21,36 +33,106 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-producti
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-tunnel_manager = TunnelProcessManager()
+# Set by create_app(): a local TunnelProcessManager, or a client for the shared tunnel daemon
+tunnel_manager = None
+resource_sampler = None
+job_manager = JobManager()
+tunnel_registry = TunnelRegistry(os.environ.get('TUNNEL_REGISTRY_PATH', str(Path(__file__).parent / 'tunnels.db')))
+# Opt-in: pidfiles and log files that let a restarted manager adopt the cloudflared processes still running.
+# Tunnels then run detached and outlive the app; without it they are children that stop with it.
+TUNNEL_STATE_DIR = os.environ.get('TUNNEL_STATE_DIR')
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time spent handling dashboard/API requests', ['endpoint', 'method', 'status'])
+
+# cloudflared families re-exported on /metrics, labelled with the tunnel they came from
+CLOUDFLARED_METRIC_PREFIXES = ('cloudflared_tunnel_', 'quic_client_')
+
+# Parallel deletes per cleanup job; kept low so bulk cleanup stays inside Cloudflare's rate limit
+CLEANUP_CONCURRENCY = int(os.environ.get('CLEANUP_CONCURRENCY', 4))
+
+# Parallel tunnel creates per batch deploy, and the most subdomains one batch may hold
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+MAX_BATCH_ITEMS = 500
+
+LOG_STREAM_KEEPALIVE = 15  # seconds between SSE comments on an idle stream
+
+# 'dedicated': one tunnel and cloudflared process per subdomain
+# 'shared': every subdomain is an ingress rule on one tunnel served by a single connector
+TUNNEL_MODE = os.environ.get('TUNNEL_MODE', 'dedicated')
+SHARED_TUNNEL_NAME = os.environ.get('SHARED_TUNNEL_NAME', DEFAULT_SHARED_TUNNEL_NAME)
+
+# Shared by every CloudflareTunnelAPI so the keep-alive pool outlives a single request
+HTTP_CLIENT_OPTIONS = {
+    'pool_size': int(os.environ.get('CLOUDFLARE_HTTP_POOL_SIZE', 10)),
+    'timeout': (5, float(os.environ.get('CLOUDFLARE_HTTP_TIMEOUT', 30))),
+    'max_retries': int(os.environ.get('CLOUDFLARE_HTTP_MAX_RETRIES', 3)),
+    # Per-token request budget; 0 turns the client-side limiter off
+    'rate_limit': int(os.environ.get('CLOUDFLARE_RATE_LIMIT', 1200)),
+    'rate_period': float(os.environ.get('CLOUDFLARE_RATE_PERIOD', 300)),
+    # Tunnel lists/details and DNS lookups are served from cache for the fresh TTL, then served
+    # stale (while refreshing in the background) up to the stale TTL; 0 for both disables caching
+    'cache_fresh_ttl': float(os.environ.get('CLOUDFLARE_CACHE_FRESH_TTL', 15)),
+    'cache_stale_ttl': float(os.environ.get('CLOUDFLARE_CACHE_STALE_TTL', 300)),
+}
+
+# Credentials saved from /config live here (owner-only) and are picked up again on restart or edit
+config_service = ConfigService(
+    os.environ.get('DPLOYME_CONFIG_PATH', str(Path(__file__).parent / 'cloudflare_config.json')),
+    registry=tunnel_registry,
+    client_options=HTTP_CLIENT_OPTIONS,
+    manager_options={'mode': TUNNEL_MODE, 'shared_tunnel_name': SHARED_TUNNEL_NAME}
+)
+
+# Addresses are discovered once and refreshed in the background (or on netlink events on Linux)
+network_info = NetworkInfoService(refresh_interval=float(os.environ.get('NETWORK_REFRESH_INTERVAL', 60)))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Label by route template, not path, so tunnel IDs don't explode the series count
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(endpoint=endpoint, method=request.method,
+                                    status=response.status_code).observe(time.perf_counter() - started)
+    return response
 
 
 def get_local_ip():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        local_ip = s.getsockname()[0]
-        s.close()
-        return local_ip
-    except Exception:
-        return "192.168.1.100"
+    return network_info.get_primary_ip()
+
+
+def sse_event(data, event_id=None, event=None):
+    message = ''
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    if event:
+        message += f'event: {event}\n'
+    for line in str(data).splitlines() or ['']:
+        message += f'data: {line}\n'
+    return message + '\n'
 
 
 def load_config():
     try:
-        config = CloudflareConfig.from_env()
-        if not config.validate():
-            return None
-        return config
+        return config_service.get_config()
     except Exception as e:
         logger.error(f"Failed to load config: {e}")
         return None
 
 
+def create_api(api_token, zone_id, account_id):
+    return config_service.create_api(api_token, zone_id, account_id)
+
+
 def get_tunnel_manager():
-    config = load_config()
-    if not config:
-        return None
-    return TunnelManager(config.api_token, config.zone_id, config.account_id)
+    return config_service.get_tunnel_manager()
 
 
 @app.route('/')
@@ -77,8 +159,7 @@ def get_config_status():
     
     if config:
         try:
-            manager = get_tunnel_manager()
-            api = CloudflareTunnelAPI(config.api_token, config.zone_id, config.account_id)
+            api = config_service.get_api(config)
             valid = api.verify_credentials()
             zone_name = api._get_zone_name() if valid else None
         except Exception as e:
@@ -94,6 +175,7 @@ def get_config_status():
         'valid': valid,
         'zone_name': zone_name,
         'local_ip': local_ip,
+        'tunnel_mode': TUNNEL_MODE,
         'has_api_token': bool(config.api_token if config else False),
         'has_zone_id': bool(config.zone_id if config else False),
         'has_account_id': bool(config.account_id if config else False)
@@ -107,14 +189,177 @@ def list_tunnels():
         return jsonify({'error': 'Configuration not available'}), 400
     
     try:
-        api = CloudflareTunnelAPI(load_config().api_token, load_config().zone_id, load_config().account_id)
-        tunnels = api.list_tunnels()
+        tunnels = manager.tunnel_api.list_tunnels()
         return jsonify({'tunnels': tunnels})
     except Exception as e:
         logger.error(f"Error listing tunnels: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tunnels/overview', methods=['GET'])
+def tunnels_overview():
+    config = load_config()
+    if not config:
+        return jsonify({'error': 'Configuration not available'}), 400
+    
+    try:
+        api = config_service.get_api(config)
+        tunnels = api.list_tunnels()
+        statuses = tunnel_manager.get_all_statuses()
+        resources = resource_sampler.get_all_summaries()
+        
+        overview = []
+        for tunnel in tunnels:
+            process_status = statuses.get(tunnel['id']) or {'running': False, 'status': 'stopped'}
+            if tunnel['id'] in resources:
+                process_status = {**process_status, 'resources': resources[tunnel['id']]}
+            overview.append({**tunnel, 'process': process_status})
+        
+        return jsonify({
+            'tunnels': overview,
+            'total': len(overview),
+            'running_count': sum(1 for t in overview if t['process']['running'])
+        })
+    except Exception as e:
+        logger.error(f"Error building tunnel overview: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def run_create_tunnel(job, manager, subdomain, port, service_url, auto_start):
+    def on_step(step, state, elapsed):
+        job.emit('step', f'{step} {state}', step=step, state=state, elapsed=elapsed)
+    
+    setup_info = manager.provision(subdomain, port, f'{subdomain}-tunnel', service_url=service_url, on_step=on_step)
+    tunnel_info = setup_info['tunnel']
+    tunnel_id = tunnel_info['id']
+    
+    result = {
+        'tunnel': tunnel_info,
+        'dns': setup_info['dns'],
+        'subdomain': setup_info['subdomain'],
+        'service_url': service_url,
+        'cloudflared_command': f'cloudflared tunnel --token {tunnel_info.get("token", "TOKEN_NOT_AVAILABLE")}',
+        'timings': setup_info['timings'],
+        'setup_complete': True,
+        'shared': setup_info.get('shared', False),
+        'auto_started': False
+    }
+    
+    if auto_start and tunnel_info.get('token'):
+        start_result = start_cloudflared(tunnel_info, subdomain, setup_info.get('shared', False))
+        result['auto_started'] = start_result['success']
+        result['start_result'] = start_result
+        job.emit('step', 'cloudflared started' if start_result['success'] else 'cloudflared failed to start',
+                 step='start', state='succeeded' if start_result['success'] else 'failed')
+    
+    return result
+
+
+def start_cloudflared(tunnel_info, subdomain, shared):
+    tunnel_id = tunnel_info['id']
+    if shared and tunnel_manager.get_tunnel_status(tunnel_id)['running']:
+        # The shared connector picks up new ingress rules without a restart
+        return {'success': True, 'tunnel_id': tunnel_id, 'message': 'Shared connector already running'}
+    return tunnel_manager.start_tunnel(
+        tunnel_info['token'], 
+        tunnel_id, 
+        tunnel_info.get('name') or f'{subdomain}-tunnel'
+    )
+
+
+def run_create_batch(job, manager, items, auto_start):
+    started = time.perf_counter()
+    job.update_progress(total=len(items), succeeded=0, failed=0)
+    
+    def on_item(result):
+        job.increment('succeeded' if result['success'] else 'failed')
+        job.emit('item', f"{result['hostname']} {'ready' if result['success'] else 'failed'}",
+                 subdomain=result['subdomain'], success=result['success'], error=result.get('error'))
+    
+    results = manager.provision_batch(items, concurrency=BATCH_CONCURRENCY, on_item=on_item)
+    
+    for result in results:
+        result['auto_started'] = False
+        if auto_start and result['success'] and result['tunnel'].get('token'):
+            start_result = start_cloudflared(result['tunnel'], result['subdomain'], manager.mode == 'shared')
+            result['auto_started'] = start_result['success']
+            result['start_result'] = start_result
+    
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed': round(time.perf_counter() - started, 3)
+    }
+
+
+def run_delete_tunnel(job, api, tunnel_id):
+    if not api.delete_tunnel(tunnel_id):
+        raise Exception('Failed to delete tunnel')
+    tunnel_registry.remove_tunnel(tunnel_id)
+    return {'message': 'Tunnel deleted successfully', 'tunnel_id': tunnel_id}
+
+
+def run_repoint_ingress(job, api, old_ip, new_ip):
+    """Move every ingress rule whose service_url pointed at old_ip over to new_ip"""
+    with request_priority(BACKGROUND):
+        return repoint_ingress(job, api, old_ip, new_ip)
+
+
+def repoint_ingress(job, api, old_ip, new_ip):
+    bindings = [b for b in network_info.bindings(tunnel_registry) if b['ip'] == old_ip]
+    job.update_progress(total=len(bindings), repointed=0, failed=0)
+    repointed, failed = [], []
+    
+    for binding in bindings:
+        parsed = urlparse(binding['service_url'])
+        service_url = parsed._replace(netloc=parsed.netloc.replace(old_ip, new_ip, 1)).geturl()
+        try:
+            api.add_ingress_rule(binding['tunnel_id'], binding['hostname'], service_url)
+            tunnel_registry.record(binding['subdomain'], service_url=service_url)
+            repointed.append({'hostname': binding['hostname'], 'service_url': service_url})
+            job.increment('repointed')
+        except Exception as e:
+            logger.error(f"Failed to re-point {binding['hostname']} to {service_url}: {e}")
+            failed.append({'hostname': binding['hostname'], 'error': str(e)})
+            job.increment('failed')
+    
+    return {'old_ip': old_ip, 'new_ip': new_ip, 'repointed': repointed, 'failed': failed}
+
+
+def repoint_on_address_change(old, new):
+    if old['primary_ip'] is None or old['primary_ip'] == new['primary_ip']:
+        return
+    if not is_local_address(new['primary_ip']):
+        logger.warning(f"Not re-pointing ingress to {new['primary_ip']}: it is not assigned to a local interface")
+        return
+    api = config_service.get_api()
+    if api is None:
+        logger.warning(f"Primary IP changed to {new['primary_ip']} but no Cloudflare config to re-point ingress")
+        return
+    # Every worker notices the change; the first to report it runs the re-point and the rest get its job
+    job_manager.submit('repoint_ingress', run_repoint_ingress, api, old['primary_ip'], new['primary_ip'],
+                       params={'old_ip': old['primary_ip'], 'new_ip': new['primary_ip']},
+                       dedupe_key=f"repoint_ingress:{old['primary_ip']}->{new['primary_ip']}")
+
+
+def run_cleanup_subdomain(job, manager, subdomain):
+    with request_priority(BACKGROUND):
+        if not manager.cleanup(subdomain):
+            raise Exception('Failed to cleanup subdomain')
+    return {'message': f'Cleaned up subdomain: {subdomain}'}
+
+
+def job_accepted(job):
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('get_job_status', job_id=job.id),
+        'events_url': url_for('stream_job_events', job_id=job.id)
+    }), 202
+
+
 @app.route('/api/tunnels', methods=['POST'])
 def create_tunnel():
     manager = get_tunnel_manager()
@@ -137,59 +382,47 @@ def create_tunnel():
         else:
             service_url = f'http://localhost:{port}'
         
-        config = load_config()
-        api = CloudflareTunnelAPI(config.api_token, config.zone_id, config.account_id)
-        
-        tunnel_info = api.create_tunnel(f'{subdomain}-tunnel')
-        tunnel_id = tunnel_info['id']
-        
-        zone_name = api._get_zone_name()
-        hostname = f'{subdomain}.{zone_name}'
-        
-        route_data = {
-            'config': {
-                'ingress': [
-                    {
-                        'hostname': hostname,
-                        'service': service_url
-                    },
-                    {
-                        'service': 'http_status:404'
-                    }
-                ]
-            }
-        }
-        
-        route_url = f'{api.base_url}/accounts/{api.account_id}/cfd_tunnel/{tunnel_id}/configurations'
-        import requests
-        route_response = requests.put(route_url, json=route_data, headers=api.headers)
-        route_response.raise_for_status()
-        
-        dns_info = api.create_dns_record(subdomain, tunnel_id)
+        job = job_manager.submit('create', run_create_tunnel, manager, subdomain, port, service_url, auto_start,
+                                 params={'subdomain': subdomain, 'port': port, 'service_url': service_url})
+        return job_accepted(job)
         
-        result = {
-            'tunnel': tunnel_info,
-            'dns': dns_info,
-            'subdomain': hostname,
-            'service_url': service_url,
-            'cloudflared_command': f'cloudflared tunnel --token {tunnel_info.get("token", "TOKEN_NOT_AVAILABLE")}',
-            'setup_complete': True,
-            'auto_started': False
-        }
-        
-        if auto_start and tunnel_info.get('token'):
-            start_result = tunnel_manager.start_tunnel(
-                tunnel_info['token'], 
-                tunnel_id, 
-                f'{subdomain}-tunnel'
-            )
-            result['auto_started'] = start_result['success']
-            result['start_result'] = start_result
+    except Exception as e:
+        logger.error(f"Error creating tunnel: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/tunnels/batch', methods=['POST'])
+def create_tunnels_batch():
+    manager = get_tunnel_manager()
+    if not manager:
+        return jsonify({'error': 'Configuration not available'}), 400
+    
+    data = request.get_json() or {}
+    items = data.get('items')
+    use_local_ip = data.get('use_local_ip', True)
+    auto_start = data.get('auto_start', True)
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list of {subdomain, port}'}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+    if not all(isinstance(item, dict) and item.get('subdomain') and item.get('port') for item in items):
+        return jsonify({'error': 'Subdomain and port are required for every item'}), 400
+    subdomains = [item['subdomain'] for item in items]
+    if len(set(subdomains)) != len(subdomains):
+        return jsonify({'error': 'Subdomains in a batch must be unique'}), 400
+    
+    try:
+        host = get_local_ip() if use_local_ip else 'localhost'
+        batch = [{'subdomain': item['subdomain'], 'port': item['port'],
+                  'service_url': f'http://{host}:{item["port"]}'} for item in items]
         
-        return jsonify(result)
+        job = job_manager.submit('create_batch', run_create_batch, manager, batch, auto_start,
+                                 params={'count': len(batch), 'subdomains': subdomains})
+        return job_accepted(job)
         
     except Exception as e:
-        logger.error(f"Error creating tunnel: {e}")
+        logger.error(f"Error creating tunnel batch: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -200,14 +433,8 @@ def delete_tunnel(tunnel_id):
         return jsonify({'error': 'Configuration not available'}), 400
     
     try:
-        config = load_config()
-        api = CloudflareTunnelAPI(config.api_token, config.zone_id, config.account_id)
-        success = api.delete_tunnel(tunnel_id)
-        
-        if success:
-            return jsonify({'message': 'Tunnel deleted successfully'})
-        else:
-            return jsonify({'error': 'Failed to delete tunnel'}), 500
+        job = job_manager.submit('delete', run_delete_tunnel, manager.tunnel_api, tunnel_id, params={'tunnel_id': tunnel_id})
+        return job_accepted(job)
             
     except Exception as e:
         logger.error(f"Error deleting tunnel: {e}")
@@ -227,12 +454,9 @@ def cleanup_subdomain():
         return jsonify({'error': 'Subdomain is required'}), 400
     
     try:
-        success = manager.cleanup(subdomain)
-        
-        if success:
-            return jsonify({'message': f'Cleaned up subdomain: {subdomain}'})
-        else:
-            return jsonify({'error': 'Failed to cleanup subdomain'}), 500
+        job = job_manager.submit('cleanup_subdomain', run_cleanup_subdomain, manager, subdomain,
+                                 params={'subdomain': subdomain})
+        return job_accepted(job)
             
     except Exception as e:
         logger.error(f"Error cleaning up subdomain: {e}")
@@ -271,13 +495,15 @@ def save_config():
         return jsonify({'error': 'All fields are required'}), 400
     
     try:
-        api = CloudflareTunnelAPI(api_token, zone_id, account_id)
+        # Re-check the submitted credentials instead of trusting an earlier cached verdict
+        invalidate_metadata_cache(api_token, zone_id)
+        
+        api = create_api(api_token, zone_id, account_id)
         if api.verify_credentials():
             zone_name = api._get_zone_name()
             
-            os.environ['CLOUDFLARE_API_TOKEN'] = api_token
-            os.environ['CLOUDFLARE_ZONE_ID'] = zone_id
-            os.environ['CLOUDFLARE_ACCOUNT_ID'] = account_id
+            # Persists across restarts; clients for the previous credentials are dropped
+            config_service.save(api_token, zone_id, account_id)
             
             return jsonify({
                 'message': 'Configuration saved successfully',
@@ -293,28 +519,58 @@ def save_config():
 
 @app.route('/api/network-info', methods=['GET'])
 def get_network_info():
-    local_ip = get_local_ip()
+    if request.args.get('refresh') == 'true':
+        snapshot = network_info.refresh()
+    else:
+        snapshot = network_info.get_snapshot()
     
+    return jsonify({
+        'primary_ip': network_info.get_primary_ip(),
+        'interfaces': snapshot['interfaces'],
+        'updated_at': snapshot['updated_at']
+    })
+
+
+@app.route('/api/network-info/bindings', methods=['GET'])
+def get_network_bindings():
     try:
-        import netifaces
-        interfaces = []
-        for interface in netifaces.interfaces():
-            addrs = netifaces.ifaddresses(interface)
-            if netifaces.AF_INET in addrs:
-                for addr in addrs[netifaces.AF_INET]:
-                    ip = addr['addr']
-                    if not ip.startswith('127.'):
-                        interfaces.append({
-                            'interface': interface,
-                            'ip': ip,
-                            'is_primary': ip == local_ip
-                        })
-    except ImportError:
-        interfaces = [{'interface': 'auto-detected', 'ip': local_ip, 'is_primary': True}]
-    
+        return jsonify({
+            'primary_ip': network_info.get_primary_ip(),
+            'bindings': network_info.bindings(tunnel_registry)
+        })
+    except Exception as e:
+        logger.error(f"Error listing network bindings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if isinstance(tunnel_manager, TunnelDaemonClient):
+        # Process metrics live in the daemon; its families replace this process's empty copies
+        daemon_body = tunnel_manager.render_metrics()
+        body = REGISTRY.render(exclude=family_names(daemon_body)) + daemon_body
+    else:
+        body = REGISTRY.render()
+    body += relabel_exposition(tunnel_manager.scrape_cloudflared_metrics(), 'tunnel_id', CLOUDFLARED_METRIC_PREFIXES)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/rate-limit', methods=['GET'])
+def get_rate_limit_stats():
+    api = config_service.get_api()
+    if api is None:
+        return jsonify({'error': 'Configuration not available'}), 400
+    if api.rate_limiter is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **api.rate_limiter.stats()})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
     return jsonify({
-        'primary_ip': local_ip,
-        'interfaces': interfaces
+        'metadata': metadata_cache.stats(),
+        'reads': read_cache.stats(),
+        'coalesced': inflight_requests.stats()
     })
 
 
@@ -325,8 +581,13 @@ def start_tunnel(tunnel_id):
         return jsonify({'error': 'Configuration not available'}), 400
     
     try:
-        api = CloudflareTunnelAPI(config.api_token, config.zone_id, config.account_id)
-        tunnel_info = api.get_tunnel_info(tunnel_id)
+        # Tunnels we created carry their token in the registry, which saves a Cloudflare round-trip
+        entries = tunnel_registry.find_by_tunnel_id(tunnel_id)
+        if entries and entries[0]['token']:
+            tunnel_info = {'name': entries[0]['tunnel_name'], 'token': entries[0]['token']}
+        else:
+            api = config_service.get_api(config)
+            tunnel_info = api.get_tunnel_info(tunnel_id)
         
         if not tunnel_info:
             return jsonify({'error': 'Tunnel not found'}), 404
@@ -338,7 +599,7 @@ def start_tunnel(tunnel_id):
         result = tunnel_manager.start_tunnel(
             tunnel_token, 
             tunnel_id, 
-            tunnel_info.get('name', f'tunnel-{tunnel_id}')
+            tunnel_info.get('name') or f'tunnel-{tunnel_id}'
         )
         
         return jsonify(result)
@@ -363,6 +624,9 @@ def stop_tunnel(tunnel_id):
 def get_tunnel_status(tunnel_id):
     try:
         status = tunnel_manager.get_tunnel_status(tunnel_id)
+        resources = resource_sampler.get_summary(tunnel_id)
+        if resources:
+            status['resources'] = resources
         return jsonify(status)
         
     except Exception as e:
@@ -370,18 +634,100 @@ def get_tunnel_status(tunnel_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tunnels/<tunnel_id>/resources', methods=['GET'])
+def get_tunnel_resources(tunnel_id):
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'tunnel_id': tunnel_id,
+        'sampling': resource_sampler.available,
+        'interval': resource_sampler.interval,
+        'summary': resource_sampler.get_summary(tunnel_id),
+        'history': resource_sampler.get_history(tunnel_id, limit)
+    })
+
+
+@app.route('/api/tunnels/resources/top', methods=['GET'])
+def get_top_tunnel_resources():
+    metric = request.args.get('metric', 'rss')
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        return jsonify({'metric': metric, 'tunnels': resource_sampler.top(metric, limit)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
 @app.route('/api/tunnels/<tunnel_id>/logs', methods=['GET'])
 def get_tunnel_logs(tunnel_id):
     try:
         lines = request.args.get('lines', 50, type=int)
-        logs = tunnel_manager.get_tunnel_logs(tunnel_id, lines)
-        return jsonify({'logs': logs})
+        since = request.args.get('since', type=int)
+        
+        if since is None:
+            logs = tunnel_manager.get_tunnel_logs(tunnel_id, lines)
+            return jsonify({'logs': logs, 'last_seq': tunnel_manager.get_last_log_seq(tunnel_id)})
+        
+        # Incremental read: pass the returned last_seq back as ?since= to page forward
+        entries = tunnel_manager.get_logs_since(tunnel_id, since, lines if lines > 0 else None)
+        return jsonify({
+            'logs': [line for _, line in entries],
+            'last_seq': entries[-1][0] if entries else since
+        })
         
     except Exception as e:
         logger.error(f"Error getting tunnel logs: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tunnels/<tunnel_id>/logs/stream', methods=['GET'])
+def stream_tunnel_logs(tunnel_id):
+    # EventSource sends Last-Event-ID on reconnect; ?since= lets a client resume explicitly
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    tail = request.args.get('tail', 100, type=int)
+    
+    def generate():
+        # Subscribe before reading the backlog so no line falls between the two
+        subscriber = tunnel_manager.subscribe_logs(tunnel_id)
+        try:
+            backlog = tunnel_manager.get_logs_since(tunnel_id, since or 0)
+            if since is None and tail >= 0:
+                backlog = backlog[-tail:] if tail else []
+            
+            last_seq = since or 0
+            # Lines older than the buffer's oldest were evicted (line/byte cap) before this client resumed
+            if since is not None and backlog and backlog[0][0] > since + 1:
+                yield sse_event(backlog[0][0] - since - 1, event='dropped')
+            for seq, line in backlog:
+                yield sse_event(line, event_id=seq)
+                last_seq = seq
+            
+            while True:
+                try:
+                    seq, line = subscriber.get(timeout=LOG_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    if not tunnel_manager.get_tunnel_status(tunnel_id)['running']:
+                        yield sse_event('tunnel stopped', event='end')
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+                
+                if seq <= last_seq:
+                    continue
+                if last_seq and seq > last_seq + 1:
+                    yield sse_event(seq - last_seq - 1, event='dropped')
+                yield sse_event(line, event_id=seq)
+                last_seq = seq
+        finally:
+            tunnel_manager.unsubscribe_logs(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/tunnels/running', methods=['GET'])
 def list_running_tunnels():
     try:
@@ -404,7 +750,55 @@ def stop_all_tunnels():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/tunnels/cleanup', methods=['POST'])
+def run_bulk_cleanup(job, api, tunnels):
+    """Delete tunnels and the CNAME records pointing at them on a bounded pool"""
+    job.update_progress(total=len(tunnels), deleted=0, failed=0, dns_deleted=0, remaining=len(tunnels))
+    with request_priority(BACKGROUND):
+        cname_records = api.get_tunnel_cname_records()
+    errors = []
+    
+    def cleanup_one(tunnel):
+        with request_priority(BACKGROUND):
+            cleanup_tunnel(tunnel)
+    
+    def cleanup_tunnel(tunnel):
+        tunnel_id = tunnel['id']
+        tunnel_name = tunnel.get('name', 'Unknown')
+        try:
+            tunnel_manager.stop_tunnel(tunnel_id)
+            
+            if not api.delete_tunnel(tunnel_id):
+                errors.append(f'Failed to delete tunnel: {tunnel_name}')
+                job.increment('failed')
+                return
+            
+            for record in cname_records.get(tunnel_id, []):
+                if api.delete_dns_record(record['id']):
+                    job.increment('dns_deleted')
+            tunnel_registry.remove_tunnel(tunnel_id)
+            
+            job.increment('deleted')
+            logger.info(f'Cleaned up tunnel: {tunnel_name} ({tunnel_id})')
+        except Exception as e:
+            errors.append(f'Error deleting tunnel {tunnel_name}: {str(e)}')
+            job.increment('failed')
+        finally:
+            job.increment('remaining', -1)
+    
+    with ThreadPoolExecutor(max_workers=CLEANUP_CONCURRENCY) as executor:
+        list(executor.map(cleanup_one, tunnels))
+    
+    progress = job.to_dict()['progress']
+    return {
+        'message': f'Cleaned up {progress["deleted"]} tunnels',
+        'deleted_count': progress['deleted'],
+        'dns_deleted_count': progress['dns_deleted'],
+        'errors': errors
+    }
+
+
+# Shares its path with the per-subdomain cleanup above, which Flask matched first, so it lives at /cleanup-all
+@app.route('/api/tunnels/cleanup-all', methods=['POST'])
 def cleanup_old_tunnels():
     config = load_config()
     if not config:
@@ -417,47 +811,132 @@ def cleanup_old_tunnels():
         if not confirm:
             return jsonify({'error': 'Confirmation required'}), 400
         
-        api = CloudflareTunnelAPI(config.api_token, config.zone_id, config.account_id)
-        tunnels = api.list_tunnels()
+        # The shared connector and tunnels still routing registered hostnames serve live subdomains even
+        # when their process is down here; deleting them needs an explicit include_in_use
+        include_in_use = data.get('include_in_use', False)
+        
+        manager = config_service.get_tunnel_manager(config)
+        api = manager.tunnel_api
+        tunnels = api.list_tunnels(cached=False)
         
         running_tunnels = tunnel_manager.list_running_tunnels()
         running_tunnel_ids = {t['tunnel_id'] for t in running_tunnels}
-        
-        deleted_count = 0
-        errors = []
-        
+        routed_tunnel_ids = {entry['tunnel_id'] for entry in tunnel_registry.list_all() if entry.get('hostname')}
+        stopped_tunnels, in_use = [], []
         for tunnel in tunnels:
-            tunnel_id = tunnel['id']
-            tunnel_name = tunnel.get('name', 'Unknown')
-            
-            if tunnel_id in running_tunnel_ids:
+            if tunnel['id'] in running_tunnel_ids:
                 continue
-            
-            try:
-                tunnel_manager.stop_tunnel(tunnel_id)
-                
-                if api.delete_tunnel(tunnel_id):
-                    deleted_count += 1
-                    logger.info(f'Cleaned up tunnel: {tunnel_name} ({tunnel_id})')
-                else:
-                    errors.append(f'Failed to delete tunnel: {tunnel_name}')
-            except Exception as e:
-                errors.append(f'Error deleting tunnel {tunnel_name}: {str(e)}')
+            shared = manager.is_shared({'tunnel_name': tunnel.get('name'), 'tunnel_id': tunnel['id']})
+            if not include_in_use and (shared or tunnel['id'] in routed_tunnel_ids):
+                in_use.append(tunnel)
+            else:
+                stopped_tunnels.append(tunnel)
+        if in_use:
+            logger.info(f"Cleanup skipping {len(in_use)} stopped tunnel(s) that still route live hostnames")
         
-        return jsonify({
-            'success': True,
-            'message': f'Cleaned up {deleted_count} tunnels',
-            'deleted_count': deleted_count,
-            'errors': errors
-        })
+        job = job_manager.submit('cleanup', run_bulk_cleanup, api, stopped_tunnels,
+                                 params={'tunnel_count': len(stopped_tunnels), 'skipped_in_use': len(in_use)})
+        
+        return job_accepted(job)
         
     except Exception as e:
         logger.error(f"Error during cleanup: {e}")
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'jobs': [job.to_dict() for job in job_manager.list_jobs(limit)],
+        'stats': job_manager.stats()
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    def generate():
+        last_seq = since
+        while True:
+            events = job.events_since(last_seq, timeout=LOG_STREAM_KEEPALIVE)
+            for event in events:
+                yield sse_event(json.dumps(event), event_id=event['seq'], event=event['type'])
+                last_seq = event['seq']
+            
+            if job.done and not job.events_since(last_seq):
+                yield sse_event(json.dumps(job.to_dict()), event='done')
+                return
+            if not events:
+                yield ': keepalive\n\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def create_app(daemon_socket=None):
+    """Pick the tunnel process backend and start background services; call once, in the serving process.
+    
+    With a daemon socket (argument or TUNNEL_DAEMON_SOCKET) cloudflared processes are owned by
+    tunnel_daemon.py and survive restarts of the web process. Job state and the rate-limit bucket then
+    live in the daemon and cache invalidations go through it, so any number of workers can share it;
+    otherwise this process keeps all of them itself.
+    """
+    global tunnel_manager, resource_sampler, job_manager
+    if tunnel_manager is not None:
+        return app
+    
+    daemon_socket = daemon_socket or os.environ.get('TUNNEL_DAEMON_SOCKET')
+    if daemon_socket:
+        tunnel_manager = TunnelDaemonClient(daemon_socket)
+        resource_sampler = tunnel_manager.resources
+        job_manager = RemoteJobManager(tunnel_manager)
+        # Cloudflare's budget is per token, not per worker, so every worker queues on the daemon's bucket
+        set_rate_limiter_factory(tunnel_manager.rate_limiter)
+        # Writes through any worker drop the cached copies every worker holds
+        set_invalidation_publisher(tunnel_manager.publish_invalidation)
+        tunnel_manager.follow_invalidations(drop_cached)
+        logger.info(f"Using tunnel daemon at {daemon_socket}")
+    else:
+        tunnel_manager = TunnelProcessManager(state_dir=TUNNEL_STATE_DIR)
+        # The debug reloader's watcher process runs this too; only the process serving requests may adopt
+        if TUNNEL_STATE_DIR and (os.environ.get('FLASK_DEBUG', 'False').lower() != 'true'
+                                 or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+            adoption = tunnel_manager.adopt_running_tunnels()
+            if adoption.get('adopted'):
+                logger.info(f"Adopted {len(adoption['adopted'])} running tunnel(s)")
+        resource_sampler = ResourceSampler(tunnel_manager, interval=float(os.environ.get('RESOURCE_SAMPLE_INTERVAL', 5)))
+        resource_sampler.start()
+        REGISTRY.add_collector(tunnel_manager.collect_metrics)
+        REGISTRY.add_collector(resource_sampler.collect_metrics)
+    
+    network_info.on_change(repoint_on_address_change)
+    network_info.start()
+    return app
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    create_app()
     
     print(f"🚀 Starting Cloudflare Tunnel Manager")
     print(f"🌐 Access the web interface at: http://localhost:{port}")
@@ -0,0 +1,332 @@
+"""A local stand-in for the parts of the Cloudflare API this project uses.
+
+Serves /user/tokens/verify, /zones, /dns_records, /cfd_tunnel, /configurations and
+/token from memory, with configurable latency, error rate and page size, and counts
+every call so benchmarks can assert how many requests an operation costs.
+
+Run it on its own and point the app at it:
+
+    python benchmarks/fake_cloudflare.py --port 8787 --latency 0.05
+    CLOUDFLARE_API_BASE_URL=http://127.0.0.1:8787/client/v4 python app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/client/v4'
+DEFAULT_ZONE_NAME = 'example.com'
+
+ROUTES = [
+    ('verify', re.compile(r'/user/tokens/verify')),
+    ('zone', re.compile(r'/zones/(?P<zone>[^/]+)')),
+    ('dns_records', re.compile(r'/zones/(?P<zone>[^/]+)/dns_records')),
+    ('dns_batch', re.compile(r'/zones/(?P<zone>[^/]+)/dns_records/batch')),
+    ('dns_record', re.compile(r'/zones/(?P<zone>[^/]+)/dns_records/(?P<record>[^/]+)')),
+    ('tunnels', re.compile(r'/accounts/(?P<account>[^/]+)/cfd_tunnel')),
+    ('tunnel', re.compile(r'/accounts/(?P<account>[^/]+)/cfd_tunnel/(?P<tunnel>[^/]+)')),
+    ('tunnel_token', re.compile(r'/accounts/(?P<account>[^/]+)/cfd_tunnel/(?P<tunnel>[^/]+)/token')),
+    ('configurations', re.compile(r'/accounts/(?P<account>[^/]+)/cfd_tunnel/(?P<tunnel>[^/]+)/configurations')),
+]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeCloudflare:
+    """In-memory Cloudflare API served over HTTP on a background thread"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, max_per_page: int = 50, zone_name: str = DEFAULT_ZONE_NAME,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_per_page = max_per_page
+        self.zone_name = zone_name
+        self.tunnels = {}         # tunnel_id -> tunnel
+        self.dns_records = {}     # record_id -> record
+        self.configurations = {}  # tunnel_id -> config
+        self.calls = Counter()    # (method, route) -> count
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    def start(self) -> 'FakeCloudflare':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-cloudflare', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeCloudflare':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def seed_tunnels(self, count: int, prefix: str = 'seed', with_dns: bool = True) -> List[Dict[str, Any]]:
+        """Create tunnels (and their CNAMEs) directly in the store, without counting calls"""
+        with self._lock:
+            tunnels = []
+            for index in range(count):
+                tunnel = self._new_tunnel(f'{prefix}-{index}-tunnel')
+                tunnels.append(tunnel)
+                if with_dns:
+                    self._new_dns_record({'type': 'CNAME', 'name': f'{prefix}-{index}',
+                                          'content': f'{tunnel["id"]}.cfargotunnel.com', 'proxied': True})
+            return tunnels
+
+    # -- request handling --
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Without this, delayed ACKs add ~40ms to every keep-alive round-trip
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake._handle(self, 'GET')
+
+            def do_POST(self):
+                fake._handle(self, 'POST')
+
+            def do_PUT(self):
+                fake._handle(self, 'PUT')
+
+            def do_PATCH(self):
+                fake._handle(self, 'PATCH')
+
+            def do_DELETE(self):
+                fake._handle(self, 'DELETE')
+
+        return Handler
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        parsed = urlparse(handler.path)
+        path = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else parsed.path
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+
+        route, params = self._match(path)
+        with self._lock:
+            self.calls[(method, route or 'unknown')] += 1
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if route is None:
+            status, payload = 404, self._error(7000, f'No route for {method} {path}')
+        elif self.error_rate and self._random.random() < self.error_rate:
+            status, payload = 500, self._error(10000, 'Injected failure')
+        else:
+            try:
+                with self._lock:
+                    status, payload = getattr(self, f'_route_{route}')(method, params, query, body)
+            except KeyError as e:
+                status, payload = 400, self._error(1001, f'Missing field {e}')
+
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    @staticmethod
+    def _match(path: str) -> Tuple[Optional[str], Dict[str, str]]:
+        for name, pattern in ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                return name, match.groupdict()
+        return None, {}
+
+    @staticmethod
+    def _ok(result: Any, **extra) -> Tuple[int, Dict[str, Any]]:
+        return 200, {'success': True, 'errors': [], 'messages': [], 'result': result, **extra}
+
+    @staticmethod
+    def _error(code: int, message: str) -> Dict[str, Any]:
+        return {'success': False, 'errors': [{'code': code, 'message': message}], 'messages': [], 'result': None}
+
+    def _not_found(self, what: str) -> Tuple[int, Dict[str, Any]]:
+        return 404, self._error(1003, f'{what} not found')
+
+    def _page(self, items: List[Dict[str, Any]], query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        per_page = max(1, min(int(query.get('per_page', 20)), self.max_per_page))
+        page = max(1, int(query.get('page', 1)))
+        chunk = items[(page - 1) * per_page:page * per_page]
+        return self._ok(chunk, result_info={
+            'page': page,
+            'per_page': per_page,
+            'count': len(chunk),
+            'total_count': len(items),
+            'total_pages': max(1, -(-len(items) // per_page))
+        })
+
+    def _new_tunnel(self, name: str) -> Dict[str, Any]:
+        tunnel_id = str(uuid.uuid4())
+        tunnel = {
+            'id': tunnel_id,
+            'name': name,
+            'created_at': _now(),
+            'deleted_at': None,
+            'status': 'inactive',
+            'connections': [],
+            'token': f'token-{uuid.uuid4().hex}'
+        }
+        self.tunnels[tunnel_id] = tunnel
+        return tunnel
+
+    def _new_dns_record(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        name = data['name']
+        if name != self.zone_name and not name.endswith('.' + self.zone_name):
+            name = f'{name}.{self.zone_name}'
+        record = {
+            'id': uuid.uuid4().hex,
+            'type': data['type'],
+            'name': name,
+            'content': data['content'],
+            'proxied': data.get('proxied', False),
+            'ttl': data.get('ttl', 1),
+            'created_on': _now()
+        }
+        self.dns_records[record['id']] = record
+        return record
+
+    def _public_tunnel(self, tunnel: Dict[str, Any]) -> Dict[str, Any]:
+        # Like the real API, listings and lookups do not include the token
+        return {key: value for key, value in tunnel.items() if key != 'token'}
+
+    # -- routes --
+
+    def _route_verify(self, method, params, query, body):
+        return self._ok({'id': uuid.uuid4().hex, 'status': 'active'})
+
+    def _route_zone(self, method, params, query, body):
+        return self._ok({'id': params['zone'], 'name': self.zone_name, 'status': 'active'})
+
+    def _route_dns_records(self, method, params, query, body):
+        if method == 'POST':
+            return self._ok(self._new_dns_record(body))
+        records = [
+            record for record in self.dns_records.values()
+            if all(record.get(field) == query[field] for field in ('type', 'name', 'content') if field in query)
+        ]
+        return self._page(records, query)
+
+    def _route_dns_batch(self, method, params, query, body):
+        for delete in body.get('deletes') or []:
+            self.dns_records.pop(delete['id'], None)
+        posts = [self._new_dns_record(data) for data in body.get('posts') or []]
+        return self._ok({'deletes': body.get('deletes') or [], 'posts': posts})
+
+    def _route_dns_record(self, method, params, query, body):
+        record = self.dns_records.get(params['record'])
+        if record is None:
+            return self._not_found('DNS record')
+        if method == 'DELETE':
+            del self.dns_records[record['id']]
+            return self._ok({'id': record['id']})
+        return self._ok(record)
+
+    def _route_tunnels(self, method, params, query, body):
+        if method == 'POST':
+            # Creation is the one response that carries the token
+            return self._ok(self._new_tunnel(body['name']))
+        tunnels = list(self.tunnels.values())
+        if query.get('is_deleted') == 'false':
+            tunnels = [t for t in tunnels if not t['deleted_at']]
+        elif query.get('is_deleted') == 'true':
+            tunnels = [t for t in tunnels if t['deleted_at']]
+        if 'name' in query:
+            tunnels = [t for t in tunnels if t['name'] == query['name']]
+        if 'include_prefix' in query:
+            tunnels = [t for t in tunnels if t['name'].startswith(query['include_prefix'])]
+        return self._page([self._public_tunnel(t) for t in tunnels], query)
+
+    def _route_tunnel(self, method, params, query, body):
+        tunnel = self.tunnels.get(params['tunnel'])
+        if tunnel is None:
+            return self._not_found('Tunnel')
+        if method == 'DELETE':
+            tunnel['deleted_at'] = _now()
+            self.configurations.pop(tunnel['id'], None)
+        return self._ok(self._public_tunnel(tunnel))
+
+    def _route_tunnel_token(self, method, params, query, body):
+        tunnel = self.tunnels.get(params['tunnel'])
+        if tunnel is None:
+            return self._not_found('Tunnel')
+        return self._ok(tunnel['token'])
+
+    def _route_configurations(self, method, params, query, body):
+        tunnel_id = params['tunnel']
+        if tunnel_id not in self.tunnels:
+            return self._not_found('Tunnel')
+        if method == 'PUT':
+            self.configurations[tunnel_id] = body['config']
+        return self._ok({
+            'tunnel_id': tunnel_id,
+            'config': self.configurations.get(tunnel_id),
+            'version': len(self.configurations),
+            'source': 'cloudflare'
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Cloudflare API for local runs and benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--max-per-page', type=int, default=50)
+    parser.add_argument('--seed-tunnels', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeCloudflare(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, max_per_page=args.max_per_page)
+    fake.seed_tunnels(args.seed_tunnels)
+    print(f'Fake Cloudflare API on {fake.base_url} (Ctrl+C to stop)')
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Stand-in for the cloudflared binary, for exercising TunnelProcessManager at scale.
+
+Accepts the arguments the manager passes (tunnel [--metrics ADDR] --token TOKEN) and
+prints cloudflared-style log lines. Behaviour comes from FAKE_CLOUDFLARED_* environment
+variables, overridable per process by a token of the form "key=value,key=value":
+
+    rate     log lines per second after startup (default 1)
+    crash    exit with code 1 after this many seconds
+    hang     1 to ignore SIGTERM, so stopping has to fall back to SIGKILL
+    metrics  1 to serve a minimal /metrics page on the --metrics address
+
+Point the manager at it with CLOUDFLARED_PATH=benchmarks/fake_cloudflared.py.
+"""
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+DEFAULTS = {'rate': '1', 'crash': '', 'hang': '0', 'metrics': '0'}
+
+LOCATIONS = ('fra08', 'ams01', 'lhr12', 'cdg03')
+
+
+def log(level: str, message: str):
+    stamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    sys.stdout.write(f'{stamp} {level} {message}\n')
+    sys.stdout.flush()
+
+
+def parse_args(argv):
+    options = {'metrics': None, 'token': ''}
+    args = iter(argv)
+    for arg in args:
+        if arg == '--metrics':
+            options['metrics'] = next(args, None)
+        elif arg == '--token':
+            options['token'] = next(args, '')
+    return options
+
+
+def settings(token: str):
+    values = {key: os.environ.get(f'FAKE_CLOUDFLARED_{key.upper()}', default) for key, default in DEFAULTS.items()}
+    for pair in token.split(','):
+        key, _, value = pair.partition('=')
+        if key in values:
+            values[key] = value
+    return values
+
+
+def serve_metrics(address: str, started: float, counters: dict):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body = (
+                '# HELP cloudflared_tunnel_total_requests Amount of requests proxied through all the tunnels\n'
+                '# TYPE cloudflared_tunnel_total_requests counter\n'
+                f'cloudflared_tunnel_total_requests {counters["requests"]}\n'
+                '# HELP cloudflared_tunnel_ha_connections Number of active ha connections\n'
+                '# TYPE cloudflared_tunnel_ha_connections gauge\n'
+                'cloudflared_tunnel_ha_connections 4\n'
+                '# HELP process_start_time_seconds Start time of the process\n'
+                '# TYPE process_start_time_seconds gauge\n'
+                f'process_start_time_seconds {started}\n'
+            ).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    host, _, port = address.rpartition(':')
+    server = HTTPServer((host or '127.0.0.1', int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def main():
+    options = parse_args(sys.argv[1:])
+    config = settings(options['token'])
+    started = time.time()
+    counters = {'requests': 0}
+
+    if config['hang'] == '1':
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if options['metrics'] and config['metrics'] == '1':
+        serve_metrics(options['metrics'], started, counters)
+
+    connector_id = uuid.uuid4()
+    log('INF', 'Starting tunnel tunnelID=' + str(uuid.uuid5(uuid.NAMESPACE_URL, options['token'])))
+    log('INF', 'Version 2024.1.5 (Checksum fake)')
+    log('INF', f'Generated Connector ID: {connector_id}')
+    if options['metrics']:
+        log('INF', f'Starting metrics server on {options["metrics"]}/metrics')
+    for index in range(4):
+        log('INF', f'Registered tunnel connection connIndex={index} connection={uuid.uuid4()} event=0 '
+                   f'ip=198.41.192.{index + 7} location={random.choice(LOCATIONS)} protocol=quic')
+
+    rate = float(config['rate'] or 0)
+    crash_at = started + float(config['crash']) if config['crash'] else None
+    interval = 1 / rate if rate > 0 else 1.0
+
+    while True:
+        if crash_at is not None and time.time() >= crash_at:
+            log('ERR', 'Serve tunnel error error="connection with edge closed" connIndex=0')
+            sys.exit(1)
+        if rate > 0:
+            counters['requests'] += 1
+            log('INF', f'Request served originService=http://localhost:8080 '
+                       f'path=/api/{counters["requests"]} status=200 connIndex={counters["requests"] % 4}')
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
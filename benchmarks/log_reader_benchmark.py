@@ -0,0 +1,97 @@
+"""Thread count, RSS and log throughput of TunnelProcessManager at different tunnel counts.
+
+Each "tunnel" is benchmarks/fake_cloudflared.py logging at a fixed rate, started through
+the manager as if it were cloudflared. Compares the multiplexed reader with the
+one-thread-per-process fallback:
+
+    python benchmarks/log_reader_benchmark.py --counts 10 100 500 --duration 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from tunnel_process_manager import TunnelProcessManager  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+FAKE_CLOUDFLARED = os.path.join(HERE, 'fake_cloudflared.py')
+
+
+def rss_mb() -> float:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run(count: int, duration: float, multiplex: bool) -> dict:
+    manager = TunnelProcessManager(multiplex_logs=multiplex, cloudflared_path=FAKE_CLOUDFLARED,
+                                   cloudflared_metrics=False)
+    baseline_threads = threading.active_count()
+    baseline_rss = rss_mb()
+
+    started = time.perf_counter()
+    for index in range(count):
+        result = manager.start_tunnel(f'bench-{index}', f'bench-{index}')
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    start_time = time.perf_counter() - started
+
+    time.sleep(1)  # let every child get going before measuring
+    lines_before = sum(buffer.last_seq for buffer in manager.tunnel_logs.values())
+    time.sleep(duration)
+    lines_after = sum(buffer.last_seq for buffer in manager.tunnel_logs.values())
+
+    report = {
+        'mode': 'multiplexed' if multiplex else 'thread-per-process',
+        'tunnels': count,
+        'threads': threading.active_count(),
+        'extra_threads': threading.active_count() - baseline_threads,
+        'rss_mb': round(rss_mb(), 1),
+        'rss_delta_mb': round(rss_mb() - baseline_rss, 1),
+        'lines_per_sec': round((lines_after - lines_before) / duration),
+        'start_s': round(start_time, 2)
+    }
+
+    manager.stop_all_tunnels()
+    manager.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to measure throughput over')
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between lines per child')
+    parser.add_argument('--mode', choices=['multiplexed', 'thread', 'both'], default='both')
+    args = parser.parse_args()
+
+    if os.name == 'nt':
+        sys.exit('The fake cloudflared is a script with a shebang, so this benchmark needs a Unix host')
+
+    os.environ['FAKE_CLOUDFLARED_RATE'] = str(1 / args.interval)
+
+    modes = {'multiplexed': [True], 'thread': [False], 'both': [True, False]}[args.mode]
+    header = f'{"mode":<20} {"tunnels":>7} {"threads":>7} {"+thr":>5} {"rss MB":>7} {"+rss":>6} {"lines/s":>8} {"start s":>7}'
+    print(header)
+    print('-' * len(header))
+    for multiplex in modes:
+        for count in args.counts:
+            r = run(count, args.duration, multiplex)
+            print(f'{r["mode"]:<20} {r["tunnels"]:>7} {r["threads"]:>7} {r["extra_threads"]:>5} '
+                  f'{r["rss_mb"]:>7} {r["rss_delta_mb"]:>6} {r["lines_per_sec"]:>8} {r["start_s"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
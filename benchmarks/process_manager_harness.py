@@ -0,0 +1,151 @@
+"""Scale harness for TunnelProcessManager using the fake cloudflared binary.
+
+For each tunnel count it starts every tunnel concurrently, lets them log for a while
+(some crashing so the supervisor restarts them), stops and restarts a slice of them,
+then stops everything, reporting:
+
+    start p50/p95 and wall time, restarts seen, threads, RSS, log buffer memory,
+    captured lines/s, stop+start cycle latency and stop_all_tunnels wall time
+
+    python benchmarks/process_manager_harness.py --counts 10 100 300 --rate 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from run_benchmarks import percentile  # noqa: E402
+from tunnel_process_manager import TunnelProcessManager  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+FAKE_CLOUDFLARED = os.path.join(HERE, 'fake_cloudflared.py')
+
+
+def rss_mb() -> float:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def run(count: int, args) -> dict:
+    manager = TunnelProcessManager(cloudflared_path=args.cloudflared, restart_backoff=0.2,
+                                   stop_timeout=args.stop_timeout)
+    baseline_threads = threading.active_count()
+    crashing = int(count * args.crash_fraction)
+    hanging = int(count * args.hang_fraction)
+
+    def token(index):
+        options = [f'rate={args.rate}']
+        if index < crashing:
+            options.append(f'crash={args.crash_after}')
+        elif index < crashing + hanging:
+            options.append('hang=1')
+        return ','.join(options)
+
+    def start(index):
+        return timed(manager.start_tunnel, token(index), f'scale-{index}', f'scale-{index}')
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        started = time.perf_counter()
+        starts = list(executor.map(start, range(count)))
+        start_wall = time.perf_counter() - started
+    failures = [result['error'] for _, result in starts if not result['success']]
+    if failures:
+        raise RuntimeError(f'{len(failures)} tunnels failed to start: {failures[0]}')
+    start_latencies = [elapsed for elapsed, _ in starts]
+
+    time.sleep(1)  # startup banners
+    lines_before = sum(buffer.last_seq for buffer in manager.tunnel_logs.values())
+    time.sleep(args.duration)
+    lines_after = sum(buffer.last_seq for buffer in manager.tunnel_logs.values())
+
+    statuses = manager.get_all_statuses()
+    threads = threading.active_count()
+    log_bytes = sum(buffer.size for buffer in manager.tunnel_logs.values())
+    log_lines = sum(len(buffer) for buffer in manager.tunnel_logs.values())
+    restarts = sum(status.get('restart_count', 0) for status in statuses.values())
+
+    # Stop and start a slice of the healthy tunnels concurrently
+    cycle_ids = list(range(crashing + hanging, count))[:max(1, count // 10)]
+
+    def cycle(index):
+        stop_elapsed, _ = timed(manager.stop_tunnel, f'scale-{index}')
+        start_elapsed, _ = start(index)
+        return stop_elapsed + start_elapsed
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        cycles = list(executor.map(cycle, cycle_ids))
+
+    stop_all_wall, stop_result = timed(manager.stop_all_tunnels)
+    manager.shutdown()
+
+    return {
+        'tunnels': count,
+        'start_p50_ms': round(percentile(start_latencies, 50) * 1000, 1),
+        'start_p95_ms': round(percentile(start_latencies, 95) * 1000, 1),
+        'start_wall_s': round(start_wall, 2),
+        'restarts': restarts,
+        'threads': threads,
+        'extra_threads': threads - baseline_threads,
+        'rss_mb': round(rss_mb(), 1),
+        'log_kb': round(log_bytes / 1024, 1),
+        'log_lines': log_lines,
+        'lines_per_sec': round((lines_after - lines_before) / args.duration),
+        'cycle_p95_ms': round(percentile(cycles, 95) * 1000, 1),
+        'stop_all_s': round(stop_all_wall, 2),
+        'stopped': stop_result['stopped_count']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Start, crash, restart and stop many fake cloudflared tunnels')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of steady-state logging to measure')
+    parser.add_argument('--rate', type=float, default=2.0, help='log lines per second per tunnel')
+    parser.add_argument('--concurrency', type=int, default=32, help='parallel start/stop calls')
+    parser.add_argument('--crash-fraction', type=float, default=0.05)
+    parser.add_argument('--crash-after', type=float, default=2.0)
+    parser.add_argument('--hang-fraction', type=float, default=0.0,
+                        help='tunnels that ignore SIGTERM; each costs --stop-timeout when stopped')
+    parser.add_argument('--stop-timeout', type=float, default=10.0)
+    parser.add_argument('--cloudflared', default=os.environ.get('CLOUDFLARED_PATH', FAKE_CLOUDFLARED))
+    args = parser.parse_args()
+
+    if os.name == 'nt':
+        sys.exit('The fake cloudflared is a script with a shebang, so this harness needs a Unix host')
+
+    columns = [
+        ('tunnels', 7), ('start_p50_ms', 12), ('start_p95_ms', 12), ('start_wall_s', 12), ('restarts', 8),
+        ('extra_threads', 13), ('rss_mb', 7), ('log_kb', 8), ('lines_per_sec', 13), ('cycle_p95_ms', 12),
+        ('stop_all_s', 10)
+    ]
+    header = ' '.join(f'{name:>{width}}' for name, width in columns)
+    print(header)
+    print('-' * len(header))
+    for count in args.counts:
+        result = run(count, args)
+        print(' '.join(f'{result[name]:>{width}}' for name, width in columns))
+
+
+if __name__ == '__main__':
+    main()
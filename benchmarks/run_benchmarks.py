@@ -0,0 +1,215 @@
+"""Offline benchmarks of CloudflareTunnelAPI and the Flask routes against a fake Cloudflare API.
+
+Reports p50/p95/p99 latency and Cloudflare calls per operation, and exits non-zero when
+an operation needs more API calls than its budget, so call-count regressions fail CI:
+
+    python benchmarks/run_benchmarks.py                  # defaults, no network needed
+    python benchmarks/run_benchmarks.py --latency 0.02 --tunnels 200 --json results.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_cloudflare import FakeCloudflare  # noqa: E402
+
+API_TOKEN = 'bench-token'
+ZONE_ID = 'benchzone'
+ACCOUNT_ID = 'benchaccount'
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BenchmarkSuite:
+
+    def __init__(self, fake: FakeCloudflare, iterations: int, tunnels: int):
+        self.fake = fake
+        self.iterations = iterations
+        self.tunnels = tunnels
+        self.results = []
+
+    def measure(self, name: str, operation: Callable[[int], Any], budget: Optional[float] = None,
+                setup: Optional[Callable[[int], Any]] = None, iterations: Optional[int] = None):
+        """Time operation(i) over several iterations, counting fake API calls made inside it"""
+        durations = []
+        calls = []
+        for index in range(iterations or self.iterations):
+            if setup is not None:
+                setup(index)
+            self.fake.reset_calls()
+            started = time.perf_counter()
+            operation(index)
+            durations.append(time.perf_counter() - started)
+            calls.append(self.fake.total_calls())
+
+        calls_per_op = sum(calls) / len(calls)
+        result = {
+            'name': name,
+            'iterations': len(durations),
+            'p50_ms': round(percentile(durations, 50) * 1000, 2),
+            'p95_ms': round(percentile(durations, 95) * 1000, 2),
+            'p99_ms': round(percentile(durations, 99) * 1000, 2),
+            'calls_per_op': round(calls_per_op, 2),
+            'max_calls': max(calls),
+            'budget': budget,
+            'over_budget': budget is not None and max(calls) > budget
+        }
+        self.results.append(result)
+        return result
+
+    def run_api(self):
+        from cloudflare_tunnel_api import CloudflareTunnelAPI, invalidate_metadata_cache
+
+        api = CloudflareTunnelAPI(API_TOKEN, ZONE_ID, ACCOUNT_ID, base_url=self.fake.base_url,
+                                  rate_limit=int(os.environ['CLOUDFLARE_RATE_LIMIT']))
+        pages = math.ceil(self.tunnels / self.fake.max_per_page)
+
+        self.measure('api.verify_credentials (cold)', lambda i: api.verify_credentials(), budget=2,
+                     setup=lambda i: invalidate_metadata_cache(API_TOKEN))
+        self.measure('api.verify_credentials (cached)', lambda i: api.verify_credentials(), budget=0)
+
+        created = []
+        self.measure('api.setup_subdomain_tunnel',
+                     lambda i: created.append(api.setup_subdomain_tunnel(f'api-{i}', 3000 + i)), budget=3)
+        self.measure('api.get_tunnel_info',
+                     lambda i: api.get_tunnel_info(created[i % len(created)]['tunnel']['id']), budget=1)
+        self.measure('api.verify_setup', lambda i: api.verify_setup(f'api-{i}'), budget=2)
+        self.measure('api.cleanup_subdomain_tunnel', lambda i: api.cleanup_subdomain_tunnel(f'api-{i}'), budget=4)
+
+        self.fake.seed_tunnels(self.tunnels, prefix='list')
+        self.measure(f'api.list_tunnels ({self.tunnels} tunnels)', lambda i: api.list_tunnels(), budget=pages)
+        self.measure(f'api.get_tunnel_cname_records ({self.tunnels} records)',
+                     lambda i: api.get_tunnel_cname_records(), budget=pages)
+
+    def run_routes(self):
+        import app as dashboard
+
+        client = dashboard.create_app().test_client()
+
+        def wait_for_job(response):
+            job_id = response.get_json()['job_id']
+            while True:
+                job = dashboard.job_manager.get(job_id)
+                if job.done:
+                    if job.status != 'succeeded':
+                        raise RuntimeError(f'Job {job.kind} failed: {job.error}')
+                    return job
+                time.sleep(0.002)
+
+        def create(i):
+            response = client.post('/api/tunnels', json={
+                'subdomain': f'route-{i}', 'port': 4000 + i, 'use_local_ip': False, 'auto_start': False
+            })
+            wait_for_job(response)
+
+        existing = sum(1 for t in self.fake.tunnels.values() if not t['deleted_at'])
+        pages = math.ceil((existing + self.iterations) / self.fake.max_per_page)
+
+        self.measure('POST /api/tunnels (until job done)', create, budget=3)
+
+        batch_size = 20
+
+        def create_batch(i):
+            items = [{'subdomain': f'batch-{i}-{n}', 'port': 5000 + n} for n in range(batch_size)]
+            wait_for_job(client.post('/api/tunnels/batch', json={
+                'items': items, 'use_local_ip': False, 'auto_start': False
+            }))
+
+        self.measure(
+            f'POST /api/tunnels/batch ({batch_size} subdomains)', create_batch,
+            # a tunnel create and an ingress PUT per subdomain, then one batch DNS request
+            budget=2 * batch_size + 1, iterations=min(self.iterations, 5)
+        )
+        pages = math.ceil((existing + self.iterations + batch_size * min(self.iterations, 5)) / self.fake.max_per_page)
+        self.measure('GET /api/tunnels', lambda i: client.get('/api/tunnels'), budget=pages)
+        self.measure('GET /api/tunnels/overview', lambda i: client.get('/api/tunnels/overview'), budget=pages)
+
+        def seed_for_cleanup(i):
+            for tunnel in self.fake.tunnels.values():
+                tunnel['deleted_at'] = tunnel['deleted_at'] or 'bench'
+            self.fake.dns_records.clear()
+            self.fake.seed_tunnels(self.tunnels, prefix=f'cleanup{i}')
+
+        cleanup_pages = math.ceil(self.tunnels / self.fake.max_per_page)
+        self.measure(
+            f'POST /api/tunnels/cleanup-all ({self.tunnels} tunnels)',
+            lambda i: wait_for_job(client.post('/api/tunnels/cleanup-all', json={'confirm': True})),
+            # one listing, one CNAME scan, then a tunnel delete and a CNAME delete per tunnel
+            budget=2 * cleanup_pages + 2 * self.tunnels,
+            setup=seed_for_cleanup, iterations=min(self.iterations, 3)
+        )
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f'{"operation":<48} {"n":>4} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"calls/op":>9} {"budget":>7}'
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        budget = '-' if r['budget'] is None else f'{r["budget"]:g}'
+        flag = '  OVER BUDGET' if r['over_budget'] else ''
+        print(f'{r["name"]:<48} {r["iterations"]:>4} {r["p50_ms"]:>9} {r["p95_ms"]:>9} {r["p99_ms"]:>9} '
+              f'{r["calls_per_op"]:>9} {budget:>7}{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tunnel manager against a fake Cloudflare API')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--tunnels', type=int, default=120, help='tunnels seeded for list/cleanup benchmarks')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the fake API adds to each response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--max-per-page', type=int, default=50)
+    parser.add_argument('--skip-routes', action='store_true', help='only benchmark CloudflareTunnelAPI')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help="client-side requests per 5 minutes; off by default since one run exceeds Cloudflare's 1200")
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    with FakeCloudflare(latency=args.latency, jitter=args.jitter, max_per_page=args.max_per_page, seed=1) as fake:
+        # The app reads its configuration from the environment when imported
+        state_dir = tempfile.mkdtemp(prefix='dployme-bench-')
+        os.environ.update({
+            'CLOUDFLARE_API_BASE_URL': fake.base_url,
+            'CLOUDFLARE_API_TOKEN': API_TOKEN,
+            'CLOUDFLARE_ZONE_ID': ZONE_ID,
+            'CLOUDFLARE_ACCOUNT_ID': ACCOUNT_ID,
+            'CLOUDFLARE_RATE_LIMIT': str(args.rate_limit),
+            'TUNNEL_REGISTRY_PATH': os.path.join(state_dir, 'tunnels.db'),
+            # A saved cloudflare_config.json would otherwise take precedence over the fake credentials
+            'DPLOYME_CONFIG_PATH': os.path.join(state_dir, 'cloudflare_config.json'),
+            # Exercise adoption in isolation instead of scanning for a developer's own tunnels
+            'TUNNEL_STATE_DIR': os.path.join(state_dir, 'tunnel-state')
+        })
+
+        suite = BenchmarkSuite(fake, args.iterations, args.tunnels)
+        suite.run_api()
+        if not args.skip_routes:
+            suite.run_routes()
+
+    print_report(suite.results)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(suite.results, output, indent=2)
+
+    over = [r['name'] for r in suite.results if r['over_budget']]
+    if over:
+        print(f'\n{len(over)} operation(s) exceeded their Cloudflare call budget: {", ".join(over)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire after a time-to-live"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, optionally overriding the default TTL"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._evict_expired()
+                if len(self._entries) >= self.max_entries:
+                    # Drop the entry closest to expiry
+                    oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                    del self._entries[oldest]
+            self._entries[key] = (expires_at, value)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches the predicate"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+
+class StaleWhileRevalidateCache:
+    """Read-through cache that answers from a stale entry while it reloads in the background.
+
+    An entry is served as-is for fresh_ttl seconds. Until stale_ttl it is still served,
+    but the first such read schedules one background reload; after that, reads block on
+    the loader. Invalidating while a load is in flight keeps that load's result out of the cache.
+    """
+
+    def __init__(self, fresh_ttl: float = 15, stale_ttl: float = 300, max_entries: int = 1024,
+                 refresh_workers: int = 2):
+        self.logger = logging.getLogger(__name__)
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (fresh_until, stale_until, value)
+        self._refreshing = set()
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any], fresh_ttl: Optional[float] = None,
+                    stale_ttl: Optional[float] = None, refresh: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the cached value for key, calling load() on a miss.
+
+        refresh, if given, is used instead of load for background reloads. Exceptions from
+        load propagate and nothing is cached.
+        """
+        fresh_ttl = self.fresh_ttl if fresh_ttl is None else fresh_ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        if fresh_ttl <= 0 and stale_ttl <= 0:
+            return load()
+
+        now = time.monotonic()
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[2]
+            if entry is not None and entry[1] > now:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._executor.submit(self._refresh, key, refresh or load, fresh_ttl, stale_ttl, generation)
+                return entry[2]
+            self.misses += 1
+
+        value = load()
+        self._store(key, value, fresh_ttl, stale_ttl, generation)
+        return value
+
+    def set(self, key: Hashable, value: Any, fresh_ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        """Store a value we already know to be current, e.g. the result of our own write"""
+        with self._lock:
+            generation = self._generation
+        self._store(key, value, self.fresh_ttl if fresh_ttl is None else fresh_ttl,
+                    self.stale_ttl if stale_ttl is None else stale_ttl, generation)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches the predicate"""
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.stale_hits) / total, 3) if total else 0.0,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'refreshing': len(self._refreshing),
+                'fresh_ttl': self.fresh_ttl,
+                'stale_ttl': self.stale_ttl
+            }
+
+    def _refresh(self, key: Hashable, load: Callable[[], Any], fresh_ttl: float, stale_ttl: float,
+                 generation: int):
+        try:
+            value = load()
+        except Exception as e:
+            # Keep serving the stale copy; the next stale read retries
+            self.logger.warning(f'Background cache refresh failed: {e}')
+            with self._lock:
+                self.refresh_errors += 1
+            return
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+        with self._lock:
+            self.refreshes += 1
+        self._store(key, value, fresh_ttl, stale_ttl, generation)
+
+    def _store(self, key: Hashable, value: Any, fresh_ttl: float, stale_ttl: float, generation: int):
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return  # a write invalidated the cache while this value was being loaded
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                for stale_key in [k for k, entry in self._entries.items() if entry[1] <= now]:
+                    del self._entries[stale_key]
+                if len(self._entries) >= self.max_entries:
+                    oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                    del self._entries[oldest]
+            self._entries[key] = (now + fresh_ttl, now + max(stale_ttl, fresh_ttl), value)
+
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one in-flight call and its result"""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (func(), shared), joining an identical call already running if there is one.
+
+        shared is True when the result came from another caller's call; exceptions are shared too.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'calls': self.calls,
+                'shared': self.shared,
+                'dedupe_rate': round(self.shared / (self.calls + self.shared), 3) if self.calls + self.shared else 0.0
+            }
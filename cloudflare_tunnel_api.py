@@ -1,24 +1,304 @@
 import requests
 import json
 import logging
+import os
+import re
+import tempfile
+import threading
+import time
 import uuid
-from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple, Union
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from cache import TTLCache, StaleWhileRevalidateCache, SingleFlight
+from metrics import REGISTRY, timed
+from provisioning import ProvisioningPipeline, ProvisioningError
+from rate_limiter import RateLimiter, DEFAULT_RATE_LIMIT, DEFAULT_RATE_PERIOD, BACKGROUND, request_priority
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+DEFAULT_BASE_URL = 'https://api.cloudflare.com/client/v4'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+MAX_BACKOFF = 30
+
+DEFAULT_PER_PAGE = 100
+DNS_BATCH_SIZE = 200  # record changes per batch request accepted on every Cloudflare plan
+BATCH_CONCURRENCY = 8
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+METADATA_TTL = 300
+INVALID_CREDENTIALS_TTL = 30
+DEFINITIVE_CREDENTIAL_ERRORS = (400, 401, 403)
+
+# Zone info and credential checks keyed by (api_token, zone_id, kind), shared by all clients
+metadata_cache = TTLCache(ttl=METADATA_TTL)
+
+READ_FRESH_TTL = 15
+READ_STALE_TTL = 300
+
+# Tunnel lists, tunnel details and DNS lookups keyed by (api_token, account_id or zone_id, kind, ...);
+# served stale while a background refresh runs, and invalidated by our own writes
+read_cache = StaleWhileRevalidateCache(fresh_ttl=READ_FRESH_TTL, stale_ttl=READ_STALE_TTL)
+
+# publisher(cache_name, prefix) hears of every invalidation, so processes sharing an account can repeat it
+_invalidation_publisher = None
+
+# Identical GETs issued while one is already in flight wait for it instead of hitting the API again
+inflight_requests = SingleFlight()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Cloudflare's budget is per API token, so every client for a token draws from one bucket
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+# factory(api_token, rate_limit, rate_period) -> limiter; None builds an in-process RateLimiter
+_rate_limiter_factory = None
+
+# Name of the tunnel whose single connector serves every subdomain in shared mode
+DEFAULT_SHARED_TUNNEL_NAME = 'dployme-shared'
+
+# Ingress edits are read-modify-write, and finding-or-creating the shared tunnel is check-then-act,
+# so both are serialised: a thread lock within this process and, where flock exists, a lock file
+# shared with any other process using the same account
+_named_locks = {}
+_named_locks_guard = threading.Lock()
+INGRESS_LOCK_DIR = os.environ.get('DPLOYME_LOCK_DIR', tempfile.gettempdir())
+
+
+@contextmanager
+def _cross_process_lock(name: str):
+    with _named_locks_guard:
+        lock = _named_locks.setdefault(name, threading.Lock())
+    
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        path = os.path.join(INGRESS_LOCK_DIR, f"dployme-{re.sub(r'[^A-Za-z0-9-]', '_', name)}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+
+def _ingress_lock(tunnel_id: str):
+    return _cross_process_lock(f'ingress-{tunnel_id}')
+
+
+API_CALL_SECONDS = REGISTRY.histogram(
+    'cloudflare_api_call_duration_seconds', 'Duration of CloudflareTunnelAPI operations', ['operation'])
+API_CALL_ERRORS = REGISTRY.counter(
+    'cloudflare_api_call_errors_total', 'CloudflareTunnelAPI operations that raised', ['operation'])
+API_HTTP_REQUESTS = REGISTRY.counter(
+    'cloudflare_api_http_requests_total', 'HTTP requests sent to the Cloudflare API', ['method', 'status'])
+API_HTTP_RETRIES = REGISTRY.counter(
+    'cloudflare_api_http_retries_total', 'Cloudflare API requests that were retried', ['method'])
+API_HTTP_COALESCED = REGISTRY.counter(
+    'cloudflare_api_http_coalesced_total', 'Cloudflare GETs answered by an identical request already in flight')
+
+
+def _instrumented(func):
+    return timed(API_CALL_SECONDS, API_CALL_ERRORS, operation=func.__name__)(func)
+
+
+def get_shared_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Return a process-wide keep-alive session for the given pool size"""
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[pool_size] = session
+        return session
+
+
+def get_rate_limiter(api_token: str, rate_limit: int = DEFAULT_RATE_LIMIT,
+                     rate_period: float = DEFAULT_RATE_PERIOD) -> Optional[RateLimiter]:
+    """Return the process-wide limiter for an API token, or None when rate_limit is 0"""
+    if not rate_limit:
+        return None
+    key = (api_token, rate_limit, rate_period)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            if _rate_limiter_factory is not None:
+                limiter = _rate_limiter_factory(api_token, rate_limit, rate_period)
+            else:
+                limiter = RateLimiter(rate_limit, rate_period)
+            _rate_limiters[key] = limiter
+        return limiter
+
+
+def set_invalidation_publisher(publisher: Optional[Callable[[str, List[Any]], Any]]):
+    """Report every cache invalidation to publisher(cache_name, prefix) after applying it here"""
+    global _invalidation_publisher
+    _invalidation_publisher = publisher
+
+
+def drop_cached(cache_name: str, prefix) -> int:
+    """Forget entries of the 'reads' or 'metadata' cache whose key starts with prefix, in this process only.
+
+    None in the prefix matches any value at that position.
+    """
+    cache = read_cache if cache_name == 'reads' else metadata_cache
+    prefix = tuple(prefix)
+    return cache.invalidate_where(
+        lambda key: len(key) >= len(prefix) and all(p is None or k == p for k, p in zip(key, prefix))
+    )
+
+
+def _invalidate(cache_name: str, prefix: Tuple) -> int:
+    dropped = drop_cached(cache_name, prefix)
+    publisher = _invalidation_publisher
+    if publisher is not None:
+        try:
+            publisher(cache_name, list(prefix))
+        except Exception as e:
+            # Other processes then serve what they cached until it expires
+            logging.getLogger(__name__).warning(f'Could not share cache invalidation: {e}')
+    return dropped
+
+
+def set_rate_limiter_factory(factory: Optional[Callable[[str, int, float], Any]]):
+    """Build limiters with factory(api_token, rate_limit, rate_period), e.g. to share one bucket between processes"""
+    global _rate_limiter_factory
+    with _rate_limiters_lock:
+        _rate_limiter_factory = factory
+        _rate_limiters.clear()
 
 
 class CloudflareTunnelAPI:
     
-    def __init__(self, api_token: str, zone_id: str, account_id: str):
+    def __init__(self, api_token: str, zone_id: str, account_id: str,
+                 session: Optional[requests.Session] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 base_url: Optional[str] = None,
+                 rate_limit: int = DEFAULT_RATE_LIMIT,
+                 rate_period: float = DEFAULT_RATE_PERIOD,
+                 cache_fresh_ttl: float = READ_FRESH_TTL,
+                 cache_stale_ttl: float = READ_STALE_TTL):
         self.api_token = api_token
         self.zone_id = zone_id
         self.account_id = account_id
-        self.base_url = 'https://api.cloudflare.com/client/v4'
+        # Overridable so benchmarks can run against a local stand-in for the API
+        self.base_url = (base_url or os.environ.get('CLOUDFLARE_API_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
         self.headers = {
             'Authorization': f'Bearer {api_token}',
             'Content-Type': 'application/json'
         }
+        self.session = session or get_shared_session(pool_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = get_rate_limiter(api_token, rate_limit, rate_period)
+        self.cache_fresh_ttl = cache_fresh_ttl
+        self.cache_stale_ttl = cache_stale_ttl
         self.logger = logging.getLogger(__name__)
     
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        method = method.upper()
+        kwargs.setdefault('headers', self.headers)
+        kwargs.setdefault('timeout', self.timeout)
+        
+        if method != 'GET' or kwargs.get('stream'):
+            return self._send(method, url, **kwargs)
+        
+        # The response body is fully read, so followers can share the leader's Response object
+        params = kwargs.get('params') or {}
+        key = (self.api_token, url, tuple(sorted((name, str(value)) for name, value in params.items())))
+        return self._coalesced(key, lambda: self._send(method, url, **kwargs))
+    
+    def _coalesced(self, key: Tuple, func: Callable[[], Any]) -> Any:
+        result, shared = inflight_requests.do(key, func)
+        if shared:
+            API_HTTP_COALESCED.inc()
+        return result
+    
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            response = None
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                API_HTTP_REQUESTS.labels(method=method, status=response.status_code).inc()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                API_HTTP_REQUESTS.labels(method=method, status='error').inc()
+                # A POST may have reached Cloudflare, so only replay idempotent calls
+                if attempt >= self.max_retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                self.logger.warning(f'{method} {url} failed ({e}), retrying')
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                # 429 means the request was rejected before processing, so it is always safe to replay
+                if response.status_code != 429 and method not in IDEMPOTENT_METHODS:
+                    return response
+                self.logger.warning(f'{method} {url} returned {response.status_code}, retrying')
+            
+            API_HTTP_RETRIES.labels(method=method).inc()
+            delay = self._retry_delay(attempt, response)
+            if response is not None and response.status_code == 429 and self.rate_limiter is not None:
+                # Other callers on this token would only collect 429s too; the retry itself waits in acquire()
+                self.rate_limiter.penalize(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+    
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), MAX_BACKOFF)
+                except ValueError:
+                    try:
+                        delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                        return min(max(delay, 0), MAX_BACKOFF)
+                    except (TypeError, ValueError):
+                        pass
+        return min(self.backoff_factor * (2 ** attempt), MAX_BACKOFF)
+    
+    def _cached_read(self, key: Tuple, fetch: Callable[[], Any]) -> Any:
+        """Serve fetch() through the read cache; background refreshes yield to interactive calls"""
+        def load():
+            # Concurrent misses share one fetch, including every page of a multi-page list
+            return self._coalesced(('read',) + key, fetch)
+        
+        def refresh():
+            with request_priority(BACKGROUND):
+                return load()
+        
+        return read_cache.get_or_load(key, load, self.cache_fresh_ttl, self.cache_stale_ttl, refresh=refresh)
+    
+    def _invalidate_reads(self, kind: str, *key):
+        """Drop cached reads of one kind after a write, all of them when no key is given"""
+        scope = self.zone_id if kind == 'dns_name' else self.account_id
+        _invalidate('reads', (self.api_token, scope, kind) + key)
+    
+    @_instrumented
     def create_tunnel(self, tunnel_name: str, secret: Optional[str] = None) -> Dict[str, Any]:
         if not secret:
             secret = str(uuid.uuid4()).replace('-', '')
@@ -31,13 +311,15 @@ class CloudflareTunnelAPI:
         }
         
         try:
-            response = requests.post(url, json=data, headers=self.headers)
+            response = self._request('POST', url, json=data)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
                 tunnel_info = result['result']
                 self.logger.info(f'Created tunnel: {tunnel_name} with ID: {tunnel_info["id"]}')
+                self._invalidate_reads('tunnels')
+                read_cache.set((self.api_token, self.account_id, 'tunnel', tunnel_info['id']), tunnel_info)
                 return tunnel_info
             else:
                 raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
@@ -46,9 +328,12 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error creating tunnel: {e}')
             raise Exception(f'Failed to create tunnel: {e}')
     
-    def create_tunnel_route(self, tunnel_id: str, subdomain: str, localhost_port: int) -> Dict[str, Any]:
+    @_instrumented
+    def create_tunnel_route(self, tunnel_id: str, subdomain: str, localhost_port: int,
+                            service_url: Optional[str] = None) -> Dict[str, Any]:
         zone_name = self._get_zone_name()
         hostname = f'{subdomain}.{zone_name}'
+        service_url = service_url or f'http://localhost:{localhost_port}'
         
         url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}/configurations'
         
@@ -57,7 +342,7 @@ class CloudflareTunnelAPI:
                 'ingress': [
                     {
                         'hostname': hostname,
-                        'service': f'http://localhost:{localhost_port}'
+                        'service': service_url
                     },
                     {
                         'service': 'http_status:404'
@@ -67,12 +352,13 @@ class CloudflareTunnelAPI:
         }
         
         try:
-            response = requests.put(url, json=data, headers=self.headers)
+            response = self._request('PUT', url, json=data)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
-                self.logger.info(f'Created route for {hostname} -> localhost:{localhost_port}')
+                self.logger.info(f'Created route for {hostname} -> {service_url}')
+                self._invalidate_reads('tunnel', tunnel_id)
                 return result['result']
             else:
                 raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
@@ -81,6 +367,93 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error creating tunnel route: {e}')
             raise Exception(f'Failed to create tunnel route: {e}')
     
+    @_instrumented
+    def get_tunnel_configuration(self, tunnel_id: str) -> Dict[str, Any]:
+        url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}/configurations'
+        
+        try:
+            response = self._request('GET', url)
+            response.raise_for_status()
+            
+            result = response.json()
+            if result.get('success'):
+                return (result.get('result') or {}).get('config') or {}
+            else:
+                raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
+        
+        except requests.RequestException as e:
+            self.logger.error(f'Error getting tunnel configuration: {e}')
+            raise Exception(f'Failed to get tunnel configuration: {e}')
+    
+    @_instrumented
+    def add_ingress_rule(self, tunnel_id: str, hostname: str, service_url: str) -> Dict[str, Any]:
+        """Route hostname through the tunnel, keeping every other ingress rule in place"""
+        result = self._update_ingress(tunnel_id, self._merge_routes({hostname: service_url}))
+        self.logger.info(f'Added route for {hostname} -> {service_url} on tunnel {tunnel_id}')
+        return {**result, 'tunnel_id': tunnel_id, 'hostname': hostname}
+    
+    @_instrumented
+    def add_ingress_rules(self, tunnel_id: str, routes: Dict[str, str]) -> Dict[str, Any]:
+        """Route several hostname -> service_url pairs through the tunnel in one configuration update"""
+        result = self._update_ingress(tunnel_id, self._merge_routes(routes))
+        self.logger.info(f'Added {len(routes)} routes on tunnel {tunnel_id}')
+        return {**result, 'tunnel_id': tunnel_id, 'hostnames': list(routes)}
+    
+    @_instrumented
+    def remove_ingress_rule(self, tunnel_id: str, hostname: str) -> Dict[str, Any]:
+        """Stop routing hostname through the tunnel, keeping every other ingress rule in place"""
+        return self.remove_ingress_rules(tunnel_id, [hostname])
+    
+    @_instrumented
+    def remove_ingress_rules(self, tunnel_id: str, hostnames: List[str]) -> Dict[str, Any]:
+        hostnames = set(hostnames)
+        result = self._update_ingress(
+            tunnel_id, lambda ingress: [rule for rule in ingress if rule.get('hostname') not in hostnames]
+        )
+        self.logger.info(f'Removed route for {", ".join(sorted(hostnames))} from tunnel {tunnel_id}')
+        return result
+    
+    def _merge_routes(self, routes: Dict[str, str]) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        def merge(ingress):
+            rules = [rule for rule in ingress if rule.get('hostname') not in routes]
+            index = self._catch_all_index(rules)
+            rules[index:index] = [{'hostname': hostname, 'service': service} for hostname, service in routes.items()]
+            return rules
+        return merge
+    
+    def _update_ingress(self, tunnel_id: str, change: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]) -> Dict[str, Any]:
+        with _ingress_lock(tunnel_id):
+            config = self.get_tunnel_configuration(tunnel_id)
+            ingress = change(list(config.get('ingress') or []))
+            if not ingress or ingress[-1].get('hostname'):
+                # cloudflared rejects an ingress list without a final catch-all rule
+                ingress.append({'service': 'http_status:404'})
+            config['ingress'] = ingress
+            
+            url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}/configurations'
+            try:
+                response = self._request('PUT', url, json={'config': config})
+                response.raise_for_status()
+                
+                result = response.json()
+                if result.get('success'):
+                    self._invalidate_reads('tunnel', tunnel_id)
+                    return result['result']
+                else:
+                    raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
+            
+            except requests.RequestException as e:
+                self.logger.error(f'Error updating tunnel ingress: {e}')
+                raise Exception(f'Failed to update tunnel ingress: {e}')
+    
+    @staticmethod
+    def _catch_all_index(rules: List[Dict[str, Any]]) -> int:
+        for index, rule in enumerate(rules):
+            if not rule.get('hostname') and not rule.get('path'):
+                return index
+        return len(rules)
+    
+    @_instrumented
     def create_dns_record(self, subdomain: str, tunnel_id: str) -> Dict[str, Any]:
         zone_name = self._get_zone_name()
         hostname = f'{subdomain}.{zone_name}'
@@ -97,13 +470,14 @@ class CloudflareTunnelAPI:
         }
         
         try:
-            response = requests.post(url, json=data, headers=self.headers)
+            response = self._request('POST', url, json=data)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
                 dns_record = result['result']
                 self.logger.info(f'Created DNS record: {hostname} -> {tunnel_hostname}')
+                self._invalidate_reads('dns_name', hostname)
                 return dns_record
             else:
                 raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
@@ -112,62 +486,241 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error creating DNS record: {e}')
             raise Exception(f'Failed to create DNS record: {e}')
     
-    def setup_subdomain_tunnel(self, subdomain: str, localhost_port: int, tunnel_name: Optional[str] = None) -> Dict[str, Any]:
+    @_instrumented
+    def create_dns_records_batch(self, targets: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Create proxied CNAMEs for (subdomain, tunnel_id) pairs in one batch request.
+        
+        Cloudflare applies a batch atomically, so either every record is created or none is.
+        Records come back in the order they were given.
+        """
+        if len(targets) > DNS_BATCH_SIZE:
+            raise ValueError(f'At most {DNS_BATCH_SIZE} DNS records per batch, got {len(targets)}')
+        zone_name = self._get_zone_name()
+        
+        url = f'{self.base_url}/zones/{self.zone_id}/dns_records/batch'
+        
+        data = {
+            'posts': [
+                {
+                    'type': 'CNAME',
+                    'name': subdomain,
+                    'content': f'{tunnel_id}.cfargotunnel.com',
+                    'ttl': 1,
+                    'proxied': True
+                }
+                for subdomain, tunnel_id in targets
+            ]
+        }
+        
+        try:
+            response = self._request('POST', url, json=data)
+            response.raise_for_status()
+            
+            result = response.json()
+            if result.get('success'):
+                records = (result.get('result') or {}).get('posts') or []
+                self.logger.info(f'Created {len(records)} DNS records in one batch')
+                for subdomain, _ in targets:
+                    self._invalidate_reads('dns_name', f'{subdomain}.{zone_name}')
+                return records
+            else:
+                raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
+        
+        except requests.RequestException as e:
+            self.logger.error(f'Error creating DNS records: {e}')
+            raise Exception(f'Failed to create DNS records: {e}')
+    
+    @_instrumented
+    def setup_subdomain_tunnel(self, subdomain: str, localhost_port: int, tunnel_name: Optional[str] = None,
+                               service_url: Optional[str] = None,
+                               on_step: Optional[Callable[[str, str, Optional[float]], None]] = None) -> Dict[str, Any]:
         if not tunnel_name:
             tunnel_name = f'{subdomain}-tunnel-{int(datetime.now().timestamp())}'
+        service_url = service_url or f'http://localhost:{localhost_port}'
+        
+        # Once the tunnel ID is known, the ingress config and the CNAME are independent
+        pipeline = ProvisioningPipeline(listener=on_step)
+        pipeline.add_step('zone', lambda r: self._get_zone_name())
+        pipeline.add_step(
+            'tunnel', lambda r: self.create_tunnel(tunnel_name),
+            rollback=lambda tunnel_info: self.delete_tunnel(tunnel_info['id'])
+        )
+        pipeline.add_step(
+            'route', lambda r: self.create_tunnel_route(r['tunnel']['id'], subdomain, localhost_port, service_url),
+            depends_on=('tunnel', 'zone')
+        )
+        pipeline.add_step(
+            'dns', lambda r: self.create_dns_record(subdomain, r['tunnel']['id']),
+            depends_on=('tunnel', 'zone'),
+            rollback=lambda dns_record: self.delete_dns_record(dns_record['id'])
+        )
         
         try:
-            tunnel_info = self.create_tunnel(tunnel_name)
-            tunnel_id = tunnel_info['id']
-            
-            route_info = self.create_tunnel_route(tunnel_id, subdomain, localhost_port)
-            
-            dns_info = self.create_dns_record(subdomain, tunnel_id)
+            outcome = pipeline.run()
+        except ProvisioningError as e:
+            self.logger.error(f'Error setting up subdomain tunnel: {e} (rolled back: {e.rolled_back})')
+            raise Exception(f'Failed to setup subdomain tunnel: {e}')
+        
+        results = outcome['results']
+        tunnel_info = results['tunnel']
+        setup_info = {
+            'tunnel': tunnel_info,
+            'route': results['route'],
+            'dns': results['dns'],
+            'subdomain': f'{subdomain}.{results["zone"]}',
+            'localhost_port': localhost_port,
+            'service_url': service_url,
+            'tunnel_token': tunnel_info.get('token'),
+            'timings': outcome['timings'],
+            'setup_complete': True
+        }
+        
+        self.logger.info(f'Successfully setup subdomain tunnel: {subdomain} -> {service_url} in {outcome["timings"]["total"]}s')
+        return setup_info
+    
+    @_instrumented
+    def ensure_shared_tunnel(self, tunnel_name: str = DEFAULT_SHARED_TUNNEL_NAME) -> Dict[str, Any]:
+        """Find or create the tunnel that shared mode routes every subdomain through"""
+        cache_key = (self.api_token, self.zone_id, 'shared_tunnel', tunnel_name)
+        tunnel_info = metadata_cache.get(cache_key)
+        if tunnel_info is not None:
+            return tunnel_info
+        
+        # Concurrent first setups, in this process or another, must not each create their own "shared" tunnel
+        with _cross_process_lock(f'shared-{self.account_id}-{tunnel_name}'):
+            tunnel_info = metadata_cache.get(cache_key)
+            if tunnel_info is not None:
+                return tunnel_info
             
-            setup_info = {
-                'tunnel': tunnel_info,
-                'route': route_info,
-                'dns': dns_info,
-                'subdomain': f'{subdomain}.{self._get_zone_name()}',
-                'localhost_port': localhost_port,
-                'tunnel_token': tunnel_info.get('token'),
-                'setup_complete': True
-            }
+            # Another process may have created it since this one cached the tunnel list
+            drop_cached('reads', (self.api_token, self.account_id, 'tunnels'))
+            tunnel_info = self.find_tunnel(lambda t: t.get('name') == tunnel_name, name=tunnel_name)
+            if tunnel_info is None:
+                tunnel_info = self.create_tunnel(tunnel_name)
+            elif not tunnel_info.get('token'):
+                tunnel_info = {**tunnel_info, 'token': self.get_tunnel_token(tunnel_info['id'])}
             
-            self.logger.info(f'Successfully setup subdomain tunnel: {subdomain} -> localhost:{localhost_port}')
-            return setup_info
+            metadata_cache.set(cache_key, tunnel_info)
+            return tunnel_info
+    
+    @_instrumented
+    def setup_shared_subdomain(self, subdomain: str, localhost_port: int,
+                               shared_tunnel_name: str = DEFAULT_SHARED_TUNNEL_NAME,
+                               service_url: Optional[str] = None,
+                               on_step: Optional[Callable[[str, str, Optional[float]], None]] = None) -> Dict[str, Any]:
+        """Like setup_subdomain_tunnel, but adds the hostname to the shared tunnel's ingress"""
+        service_url = service_url or f'http://localhost:{localhost_port}'
         
-        except Exception as e:
-            self.logger.error(f'Error setting up subdomain tunnel: {e}')
-            try:
-                if 'tunnel_id' in locals():
-                    self.delete_tunnel(tunnel_id)
-            except:
-                pass
+        pipeline = ProvisioningPipeline(listener=on_step)
+        pipeline.add_step('zone', lambda r: self._get_zone_name())
+        pipeline.add_step('tunnel', lambda r: self.ensure_shared_tunnel(shared_tunnel_name))
+        pipeline.add_step(
+            'route', lambda r: self.add_ingress_rule(r['tunnel']['id'], f'{subdomain}.{r["zone"]}', service_url),
+            depends_on=('tunnel', 'zone'),
+            rollback=lambda route: self.remove_ingress_rule(route['tunnel_id'], route['hostname'])
+        )
+        pipeline.add_step(
+            'dns', lambda r: self.create_dns_record(subdomain, r['tunnel']['id']),
+            depends_on=('tunnel', 'zone'),
+            rollback=lambda dns_record: self.delete_dns_record(dns_record['id'])
+        )
+        
+        try:
+            outcome = pipeline.run()
+        except ProvisioningError as e:
+            self.logger.error(f'Error setting up shared subdomain: {e} (rolled back: {e.rolled_back})')
             raise Exception(f'Failed to setup subdomain tunnel: {e}')
+        
+        results = outcome['results']
+        tunnel_info = results['tunnel']
+        setup_info = {
+            'tunnel': tunnel_info,
+            'route': results['route'],
+            'dns': results['dns'],
+            'subdomain': f'{subdomain}.{results["zone"]}',
+            'localhost_port': localhost_port,
+            'service_url': service_url,
+            'tunnel_token': tunnel_info.get('token'),
+            'timings': outcome['timings'],
+            'shared': True,
+            'setup_complete': True
+        }
+        
+        self.logger.info(f'Added {subdomain} -> {service_url} to shared tunnel {tunnel_info["id"]} '
+                         f'in {outcome["timings"]["total"]}s')
+        return setup_info
     
-    def list_tunnels(self) -> List[Dict[str, Any]]:
+    def iter_tunnels(self, per_page: int = DEFAULT_PER_PAGE, is_deleted: Optional[bool] = False,
+                     name: Optional[str] = None, existed_at: Optional[Union[str, datetime]] = None,
+                     include_prefix: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield tunnels page by page; filters are applied by the API, not locally"""
         url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel'
         
-        try:
-            response = requests.get(url, headers=self.headers)
+        params = {'per_page': per_page}
+        if is_deleted is not None:
+            params['is_deleted'] = 'true' if is_deleted else 'false'
+        if name:
+            params['name'] = name
+        if existed_at:
+            params['existed_at'] = existed_at.isoformat() if isinstance(existed_at, datetime) else existed_at
+        if include_prefix:
+            params['include_prefix'] = include_prefix
+        
+        yield from self._iter_pages(url, params)
+    
+    def _iter_pages(self, url: str, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        params = dict(params)
+        per_page = params.setdefault('per_page', DEFAULT_PER_PAGE)
+        
+        page = 1
+        while True:
+            params['page'] = page
+            response = self._request('GET', url, params=params)
             response.raise_for_status()
             
             result = response.json()
-            if result.get('success'):
-                return result.get('result', [])
+            if not result.get('success'):
+                raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
             
-            return []
+            items = result.get('result') or []
+            yield from items
+            
+            # The API may cap per_page below what we asked for, so trust total_pages when it is given
+            total_pages = (result.get('result_info') or {}).get('total_pages')
+            if (page >= total_pages) if total_pages else (len(items) < per_page):
+                return
+            page += 1
+    
+    @_instrumented
+    def list_tunnels(self, cached: bool = True, **filters) -> List[Dict[str, Any]]:
+        """All tunnels matching the filters; cached=False bypasses the read cache, e.g. before deleting"""
+        try:
+            if not cached:
+                return list(self.iter_tunnels(**filters))
+            key = (self.api_token, self.account_id, 'tunnels', tuple(sorted(filters.items())))
+            return list(self._cached_read(key, lambda: list(self.iter_tunnels(**filters))))
         
-        except requests.RequestException as e:
+        except Exception as e:
+            # Callers treat an unsuccessful API response like a network error: no tunnels (nothing is cached)
             self.logger.error(f'Error listing tunnels: {e}')
             return []
     
+    @_instrumented
+    def find_tunnel(self, predicate: Callable[[Dict[str, Any]], bool], **filters) -> Optional[Dict[str, Any]]:
+        """Return the first tunnel matching the predicate without fetching further pages"""
+        try:
+            return next((tunnel for tunnel in self.iter_tunnels(**filters) if predicate(tunnel)), None)
+        
+        except requests.RequestException as e:
+            self.logger.error(f'Error searching tunnels: {e}')
+            return None
+    
+    @_instrumented
     def get_tunnel_info(self, tunnel_id: str) -> Optional[Dict[str, Any]]:
         url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}'
         
-        try:
-            response = requests.get(url, headers=self.headers)
+        def fetch():
+            response = self._request('GET', url)
             response.raise_for_status()
             
             result = response.json()
@@ -176,20 +729,27 @@ class CloudflareTunnelAPI:
             
             return None
         
+        try:
+            return self._cached_read((self.api_token, self.account_id, 'tunnel', tunnel_id), fetch)
+        
         except requests.RequestException as e:
             self.logger.error(f'Error getting tunnel info: {e}')
             return None
     
+    @_instrumented
     def delete_tunnel(self, tunnel_id: str) -> bool:
         url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}'
         
         try:
-            response = requests.delete(url, headers=self.headers)
+            response = self._request('DELETE', url)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
                 self.logger.info(f'Deleted tunnel: {tunnel_id}')
+                self._invalidate_reads('tunnels')
+                self._invalidate_reads('tunnel', tunnel_id)
+                _invalidate('metadata', (self.api_token, self.zone_id, 'shared_tunnel'))
                 return True
             else:
                 raise Exception(f"API error: {result.get('errors', 'Unknown error')}")
@@ -198,16 +758,37 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error deleting tunnel: {e}')
             return False
     
+    @_instrumented
+    def get_dns_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        url = f'{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}'
+        
+        try:
+            response = self._request('GET', url)
+            response.raise_for_status()
+            
+            result = response.json()
+            if result.get('success'):
+                return result['result']
+            
+            return None
+        
+        except requests.RequestException as e:
+            self.logger.error(f'Error getting DNS record: {e}')
+            return None
+    
+    @_instrumented
     def delete_dns_record(self, record_id: str) -> bool:
         url = f'{self.base_url}/zones/{self.zone_id}/dns_records/{record_id}'
         
         try:
-            response = requests.delete(url, headers=self.headers)
+            response = self._request('DELETE', url)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
                 self.logger.info(f'Deleted DNS record: {record_id}')
+                # Lookups are cached by name, which we don't know here
+                self._invalidate_reads('dns_name')
                 return True
             
             return False
@@ -216,6 +797,23 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error deleting DNS record: {e}')
             return False
     
+    def iter_dns_records(self, per_page: int = DEFAULT_PER_PAGE, **filters) -> Iterator[Dict[str, Any]]:
+        """Yield the zone's DNS records matching the given API filters (type, name, content...)"""
+        url = f'{self.base_url}/zones/{self.zone_id}/dns_records'
+        yield from self._iter_pages(url, {'per_page': per_page, **filters})
+    
+    @_instrumented
+    def get_tunnel_cname_records(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Map tunnel ID -> CNAME records pointing at it, from a single scan of the zone"""
+        records_by_tunnel = {}
+        for record in self.iter_dns_records(type='CNAME'):
+            content = record.get('content', '')
+            if content.endswith('.cfargotunnel.com'):
+                tunnel_id = content[:-len('.cfargotunnel.com')]
+                records_by_tunnel.setdefault(tunnel_id, []).append(record)
+        return records_by_tunnel
+    
+    @_instrumented
     def cleanup_subdomain_tunnel(self, subdomain: str) -> bool:
         try:
             zone_name = self._get_zone_name()
@@ -225,9 +823,12 @@ class CloudflareTunnelAPI:
             for record in dns_records:
                 self.delete_dns_record(record['id'])
             
-            tunnels = self.list_tunnels()
+            # Our tunnel names start with "<subdomain>-tunnel", so let the API narrow the scan;
+            # matching the full prefix keeps "app-1" from also taking "app-10"'s tunnel
+            prefix = f'{subdomain}-tunnel'
+            tunnels = self.list_tunnels(cached=False, include_prefix=prefix)
             for tunnel in tunnels:
-                if subdomain in tunnel.get('name', ''):
+                if tunnel.get('name', '').startswith(prefix):
                     self.delete_tunnel(tunnel['id'])
             
             self.logger.info(f'Cleaned up subdomain tunnel: {subdomain}')
@@ -237,15 +838,32 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error cleaning up subdomain tunnel: {e}')
             return False
     
+    @_instrumented
     def get_tunnel_token(self, tunnel_id: str) -> Optional[str]:
         tunnel_info = self.get_tunnel_info(tunnel_id)
-        if tunnel_info:
-            return tunnel_info.get('token')
-        return None
+        if tunnel_info and tunnel_info.get('token'):
+            return tunnel_info['token']
+        
+        # Tunnel details omit the token once created; it has its own endpoint
+        url = f'{self.base_url}/accounts/{self.account_id}/cfd_tunnel/{tunnel_id}/token'
+        try:
+            response = self._request('GET', url)
+            response.raise_for_status()
+            
+            result = response.json()
+            if result.get('success'):
+                return result['result']
+            
+            return None
+        
+        except requests.RequestException as e:
+            self.logger.error(f'Error getting tunnel token: {e}')
+            return None
     
     def generate_cloudflared_command(self, tunnel_token: str) -> str:
         return f'cloudflared tunnel --token {tunnel_token}'
     
+    @_instrumented
     def verify_setup(self, subdomain: str) -> Dict[str, Any]:
         zone_name = self._get_zone_name()
         hostname = f'{subdomain}.{zone_name}'
@@ -262,25 +880,34 @@ class CloudflareTunnelAPI:
             verification['dns_record_exists'] = True
             verification['dns_record'] = dns_records[0]
         
-        tunnels = self.list_tunnels()
-        for tunnel in tunnels:
-            if subdomain in tunnel.get('name', ''):
-                verification['tunnel_exists'] = True
-                verification['tunnel'] = tunnel
-                break
+        prefix = f'{subdomain}-tunnel'
+        tunnel = next((t for t in self.list_tunnels(include_prefix=prefix) if t.get('name', '').startswith(prefix)), None)
+        if tunnel:
+            verification['tunnel_exists'] = True
+            verification['tunnel'] = tunnel
         
         return verification
     
     def _get_zone_name(self) -> str:
+        return self._get_zone_info()['name']
+    
+    @_instrumented
+    def _get_zone_info(self) -> Dict[str, Any]:
+        cache_key = (self.api_token, self.zone_id, 'zone')
+        zone_info = metadata_cache.get(cache_key)
+        if zone_info is not None:
+            return zone_info
+        
         url = f'{self.base_url}/zones/{self.zone_id}'
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._request('GET', url)
             response.raise_for_status()
             
             result = response.json()
             if result.get('success'):
-                return result['result']['name']
+                metadata_cache.set(cache_key, result['result'])
+                return result['result']
             
             raise Exception('Failed to get zone name')
         
@@ -288,6 +915,7 @@ class CloudflareTunnelAPI:
             self.logger.error(f'Error getting zone name: {e}')
             raise Exception(f'Failed to get zone name: {e}')
     
+    @_instrumented
     def _get_dns_records_by_name(self, subdomain: str) -> List[Dict[str, Any]]:
         zone_name = self._get_zone_name()
         hostname = f'{subdomain}.{zone_name}'
@@ -295,8 +923,8 @@ class CloudflareTunnelAPI:
         url = f'{self.base_url}/zones/{self.zone_id}/dns_records'
         params = {'name': hostname}
         
-        try:
-            response = requests.get(url, params=params, headers=self.headers)
+        def fetch():
+            response = self._request('GET', url, params=params)
             response.raise_for_status()
             
             result = response.json()
@@ -305,37 +933,69 @@ class CloudflareTunnelAPI:
             
             return []
         
+        try:
+            return list(self._cached_read((self.api_token, self.zone_id, 'dns_name', hostname), fetch))
+        
         except requests.RequestException as e:
             self.logger.error(f'Error getting DNS records: {e}')
             return []
     
+    @_instrumented
     def verify_credentials(self) -> bool:
+        cache_key = (self.api_token, self.zone_id, 'credentials')
+        cached = metadata_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         url = f'{self.base_url}/user/tokens/verify'
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._request('GET', url)
             response.raise_for_status()
             
             result = response.json()
+            valid = False
             if result.get('success'):
                 zone_url = f'{self.base_url}/zones/{self.zone_id}'
-                zone_response = requests.get(zone_url, headers=self.headers)
+                zone_response = self._request('GET', zone_url)
                 zone_response.raise_for_status()
                 
                 zone_result = zone_response.json()
-                return zone_result.get('success', False)
-            
-            return False
+                valid = zone_result.get('success', False)
+                if valid:
+                    metadata_cache.set((self.api_token, self.zone_id, 'zone'), zone_result['result'])
         
+        except requests.HTTPError as e:
+            self.logger.error(f'Error verifying credentials: {e}')
+            # Only a rejected or malformed token is definitive; 408/429 and 5xx may be transient and are not cached
+            if e.response is not None and e.response.status_code in DEFINITIVE_CREDENTIAL_ERRORS:
+                metadata_cache.set(cache_key, False, ttl=INVALID_CREDENTIALS_TTL)
+            return False
         except requests.RequestException as e:
             self.logger.error(f'Error verifying credentials: {e}')
             return False
+        
+        metadata_cache.set(cache_key, valid, ttl=None if valid else INVALID_CREDENTIALS_TTL)
+        return valid
+
+
+def invalidate_metadata_cache(api_token: Optional[str] = None, zone_id: Optional[str] = None) -> int:
+    """Forget cached zone/credential lookups and reads, optionally only for one token and/or zone"""
+    # Reads are keyed by account as well as zone, so they are dropped for the whole token
+    _invalidate('reads', (api_token,))
+    return _invalidate('metadata', (api_token, zone_id))
 
 
 class TunnelManager:
     
-    def __init__(self, api_token: str, zone_id: str, account_id: str):
-        self.tunnel_api = CloudflareTunnelAPI(api_token, zone_id, account_id)
+    def __init__(self, api_token: str, zone_id: str, account_id: str, registry=None, mode: str = 'dedicated',
+                 shared_tunnel_name: str = DEFAULT_SHARED_TUNNEL_NAME, **client_options):
+        if mode not in ('dedicated', 'shared'):
+            raise ValueError(f'Unknown tunnel mode: {mode}')
+        self.tunnel_api = CloudflareTunnelAPI(api_token, zone_id, account_id, **client_options)
+        self.registry = registry
+        self.mode = mode
+        self.shared_tunnel_name = shared_tunnel_name
         self.logger = logging.getLogger(__name__)
     
     def quick_setup(self, subdomain: str, port: int) -> Dict[str, Any]:
@@ -343,7 +1003,7 @@ class TunnelManager:
             if not self.tunnel_api.verify_credentials():
                 raise Exception('Invalid API credentials')
             
-            setup_info = self.tunnel_api.setup_subdomain_tunnel(subdomain, port)
+            setup_info = self.provision(subdomain, port)
             
             if setup_info.get('tunnel', {}).get('token'):
                 setup_info['cloudflared_command'] = self.tunnel_api.generate_cloudflared_command(
@@ -356,11 +1016,176 @@ class TunnelManager:
             self.logger.error(f'Quick setup failed: {e}')
             raise
     
+    def provision(self, subdomain: str, port: int, tunnel_name: Optional[str] = None, service_url: Optional[str] = None,
+                  on_step: Optional[Callable[[str, str, Optional[float]], None]] = None) -> Dict[str, Any]:
+        """Route a subdomain to a local port using this manager's mode, and record it"""
+        if self.mode == 'shared':
+            setup_info = self.tunnel_api.setup_shared_subdomain(subdomain, port, self.shared_tunnel_name,
+                                                                service_url=service_url, on_step=on_step)
+        else:
+            setup_info = self.tunnel_api.setup_subdomain_tunnel(subdomain, port, tunnel_name,
+                                                                service_url=service_url, on_step=on_step)
+        self.record_setup(subdomain, setup_info)
+        return setup_info
+    
+    def provision_batch(self, items: List[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY,
+                        on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """Provision many {subdomain, port, service_url} items as one batch, and record them.
+        
+        The zone is looked up once, tunnels are created in parallel (or, in shared mode, every
+        hostname goes into one ingress update), and CNAMEs go through the batch DNS endpoint.
+        Returns one result per item, in order. A failed item is rolled back without stopping
+        the others; on_item is called as each item succeeds or fails.
+        """
+        zone_name = self.tunnel_api._get_zone_name()
+        results = [{
+            'subdomain': item['subdomain'],
+            'port': item['port'],
+            'hostname': f'{item["subdomain"]}.{zone_name}',
+            'service_url': item.get('service_url') or f'http://localhost:{item["port"]}',
+            'success': False
+        } for item in items]
+        
+        def fail(result, step, error):
+            result.update(error=str(error), failed_step=step)
+            self.logger.error(f'Batch provisioning of {result["subdomain"]} failed at {step}: {error}')
+            if on_item:
+                on_item(result)
+        
+        if self.mode == 'shared':
+            try:
+                tunnel_info = self.tunnel_api.ensure_shared_tunnel(self.shared_tunnel_name)
+                self.tunnel_api.add_ingress_rules(tunnel_info['id'], {r['hostname']: r['service_url'] for r in results})
+            except Exception as e:
+                for result in results:
+                    fail(result, 'route', e)
+                return results
+            for result in results:
+                result['tunnel'] = tunnel_info
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [(executor.submit(self._create_routed_tunnel, result), result) for result in results]
+                for future, result in futures:
+                    try:
+                        result['tunnel'] = future.result()
+                    except Exception as e:
+                        fail(result, 'tunnel', e)
+        
+        ready = [result for result in results if 'tunnel' in result]
+        for start in range(0, len(ready), DNS_BATCH_SIZE):
+            chunk = ready[start:start + DNS_BATCH_SIZE]
+            try:
+                records = self.tunnel_api.create_dns_records_batch(
+                    [(result['subdomain'], result['tunnel']['id']) for result in chunk]
+                )
+            except Exception as e:
+                self._rollback_batch(chunk, concurrency)
+                for result in chunk:
+                    fail(result, 'dns', e)
+                continue
+            
+            for result, record in zip(chunk, records):
+                result.update(dns=record, success=True)
+                self.record_setup(result['subdomain'], {
+                    'tunnel': result['tunnel'],
+                    'dns': record,
+                    'subdomain': result['hostname'],
+                    'service_url': result['service_url']
+                })
+                if on_item:
+                    on_item(result)
+        
+        return results
+    
+    def _create_routed_tunnel(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        # Same naming as setup_subdomain_tunnel: a leftover tunnel from an earlier deploy must not clash,
+        # and the '{subdomain}-tunnel' prefix lookups still find it
+        tunnel_info = self.tunnel_api.create_tunnel(f'{result["subdomain"]}-tunnel-{int(datetime.now().timestamp())}')
+        try:
+            self.tunnel_api.create_tunnel_route(tunnel_info['id'], result['subdomain'], result['port'],
+                                                result['service_url'])
+        except Exception:
+            self.tunnel_api.delete_tunnel(tunnel_info['id'])
+            raise
+        return tunnel_info
+    
+    def _rollback_batch(self, results: List[Dict[str, Any]], concurrency: int):
+        """Undo the tunnel/ingress half of items whose DNS records could not be created"""
+        if self.mode == 'shared':
+            try:
+                self.tunnel_api.remove_ingress_rules(results[0]['tunnel']['id'], [r['hostname'] for r in results])
+            except Exception as e:
+                self.logger.error(f'Error rolling back batch ingress rules: {e}')
+            return
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda result: self.tunnel_api.delete_tunnel(result['tunnel']['id']), results))
+    
+    def record_setup(self, subdomain: str, setup_info: Dict[str, Any]):
+        """Remember what setup_subdomain_tunnel created so later lookups skip account scans"""
+        if self.registry is None:
+            return
+        tunnel_info = setup_info['tunnel']
+        self.registry.record(
+            subdomain,
+            hostname=setup_info['subdomain'],
+            tunnel_id=tunnel_info['id'],
+            tunnel_name=tunnel_info.get('name'),
+            dns_record_id=(setup_info.get('dns') or {}).get('id'),
+            service_url=setup_info.get('service_url'),
+            token=tunnel_info.get('token')
+        )
+    
     def status_check(self, subdomain: str) -> Dict[str, Any]:
-        return self.tunnel_api.verify_setup(subdomain)
+        entry = self.registry.get(subdomain) if self.registry else None
+        if not entry:
+            return self.tunnel_api.verify_setup(subdomain)
+        
+        verification = {
+            'subdomain': entry['hostname'],
+            'dns_record_exists': False,
+            'tunnel_exists': False,
+            'accessible': False
+        }
+        
+        if entry['dns_record_id']:
+            dns_record = self.tunnel_api.get_dns_record(entry['dns_record_id'])
+            if dns_record:
+                verification['dns_record_exists'] = True
+                verification['dns_record'] = dns_record
+        
+        tunnel = self.tunnel_api.get_tunnel_info(entry['tunnel_id'])
+        if tunnel and not tunnel.get('deleted_at'):
+            verification['tunnel_exists'] = True
+            verification['tunnel'] = tunnel
+        
+        return verification
     
     def cleanup(self, subdomain: str) -> bool:
-        return self.tunnel_api.cleanup_subdomain_tunnel(subdomain)
+        entry = self.registry.get(subdomain) if self.registry else None
+        if not entry:
+            return self.tunnel_api.cleanup_subdomain_tunnel(subdomain)
+        
+        if entry['dns_record_id']:
+            self.tunnel_api.delete_dns_record(entry['dns_record_id'])
+        
+        if self.is_shared(entry):
+            # Other subdomains still use this tunnel: only drop our ingress rule
+            try:
+                self.tunnel_api.remove_ingress_rule(entry['tunnel_id'], entry['hostname'])
+            except Exception as e:
+                self.logger.error(f'Error removing ingress rule for {subdomain}: {e}')
+                return False
+        elif not self.tunnel_api.delete_tunnel(entry['tunnel_id']):
+            return False
+        
+        self.registry.remove(subdomain)
+        self.logger.info(f'Cleaned up subdomain tunnel: {subdomain}')
+        return True
+    
+    def is_shared(self, entry: Dict[str, Any]) -> bool:
+        """Whether a registry entry routes through a tunnel that other subdomains may share"""
+        return (entry['tunnel_name'] == self.shared_tunnel_name
+                or len(self.registry.find_by_tunnel_id(entry['tunnel_id'])) > 1)
 
 
 if __name__ == '__main__':
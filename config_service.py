@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from cloudflare_config import CloudflareConfig
+from cloudflare_tunnel_api import CloudflareTunnelAPI, TunnelManager, invalidate_metadata_cache
+
+RELOAD_CHECK_INTERVAL = 2.0  # seconds between mtime checks of the config file
+
+
+class ConfigService:
+    """Single source of Cloudflare credentials for the app.
+
+    Credentials are loaded once, from the config file when it holds a valid config
+    and from the environment otherwise. Saved credentials are written back to the file,
+    which is re-read when its mtime changes. API clients and TunnelManagers are built
+    once per credential set and reused, so their connection pools survive across requests.
+    """
+
+    def __init__(self, config_path: str, registry=None, client_options: Optional[Dict[str, Any]] = None,
+                 manager_options: Optional[Dict[str, Any]] = None,
+                 reload_interval: float = RELOAD_CHECK_INTERVAL):
+        self.logger = logging.getLogger(__name__)
+        self.config_path = config_path
+        self.registry = registry
+        self.client_options = client_options or {}
+        self.manager_options = manager_options or {}
+        self.reload_interval = reload_interval
+        self._config = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._managers = {}  # (api_token, zone_id, account_id) -> TunnelManager
+        self._lock = threading.RLock()
+        self._load()
+
+    def get_config(self) -> Optional[CloudflareConfig]:
+        """The current valid config, or None when credentials are incomplete"""
+        self._maybe_reload()
+        return self._config
+
+    def get_tunnel_manager(self, config: Optional[CloudflareConfig] = None) -> Optional[TunnelManager]:
+        config = config or self.get_config()
+        if config is None:
+            return None
+        key = (config.api_token, config.zone_id, config.account_id)
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is None:
+                manager = self._managers[key] = TunnelManager(
+                    config.api_token, config.zone_id, config.account_id, registry=self.registry,
+                    **self.manager_options, **self.client_options
+                )
+            return manager
+
+    def get_api(self, config: Optional[CloudflareConfig] = None) -> Optional[CloudflareTunnelAPI]:
+        manager = self.get_tunnel_manager(config)
+        return manager.tunnel_api if manager else None
+
+    def create_api(self, api_token: str, zone_id: str, account_id: str) -> CloudflareTunnelAPI:
+        """An uncached client, e.g. for checking credentials before they are saved"""
+        return CloudflareTunnelAPI(api_token, zone_id, account_id, **self.client_options)
+
+    def save(self, api_token: str, zone_id: str, account_id: str) -> CloudflareConfig:
+        """Persist credentials to the config file (owner-only) and switch to them"""
+        config = CloudflareConfig(api_token=api_token, zone_id=zone_id, account_id=account_id)
+
+        directory = os.path.dirname(os.path.abspath(self.config_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.cloudflare_config.', dir=directory)
+        try:
+            # mkstemp creates the file 0600, so the token is never world-readable, even briefly
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config.to_dict(), f, indent=2)
+            os.replace(tmp_path, self.config_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._apply(config)
+            self._stamp = self._file_stamp()
+        return config
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self._file_stamp() != self._stamp:
+                self.logger.info(f'Config file {self.config_path} changed, reloading')
+                self._load()
+
+    def _load(self):
+        with self._lock:
+            self._stamp = self._file_stamp()
+            self._checked_at = time.monotonic()
+            config = None
+            if self._stamp is not None:
+                try:
+                    config = CloudflareConfig.from_file(self.config_path)
+                except Exception as e:
+                    self.logger.error(f'Failed to load config file {self.config_path}: {e}')
+            if config is None or not config.validate():
+                config = CloudflareConfig.from_env()
+            self._apply(config if config.validate() else None)
+
+    def _apply(self, config: Optional[CloudflareConfig]):
+        previous = self._config
+        self._config = config
+        if previous == config:
+            return
+
+        if previous is not None:
+            # Clients for replaced credentials would only hold on to pools and stale cache entries
+            key = (previous.api_token, previous.zone_id, previous.account_id)
+            self._managers.pop(key, None)
+            invalidate_metadata_cache(previous.api_token, previous.zone_id)
+
+    def _file_stamp(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.config_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime, stat.st_size)
@@ -0,0 +1,27 @@
+"""Gunicorn settings for the dashboard: gunicorn -c gunicorn.conf.py wsgi:application
+
+Run tunnel_daemon.py and set TUNNEL_DAEMON_SOCKET to serve from several workers: the daemon owns
+the cloudflared processes and keeps job state and the Cloudflare rate-limit bucket for every
+worker, and relays their cache invalidations. Without it each worker would keep all of that to
+itself, so only one worker is used.
+"""
+import multiprocessing
+import os
+
+daemon_socket = os.environ.get('TUNNEL_DAEMON_SOCKET')
+
+bind = os.environ.get('BIND', f'0.0.0.0:{os.environ.get("PORT", 5000)}')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1 if daemon_socket else 1))
+
+# Log and job event streams (SSE) hold a thread for as long as the browser watches them
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# create_app() starts background threads, which must be created in each worker, not before the fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+MAX_EVENTS_PER_JOB = 500
+DEDUPE_WINDOW = 300  # seconds a finished job still absorbs submissions with its dedupe key
+
+
+class Job:
+    """A unit of background work with progress that API clients can poll"""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None, dedupe_key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.dedupe_key = dedupe_key
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = deque(maxlen=MAX_EVENTS_PER_JOB)  # {'seq', 'time', 'type', 'message', 'data'}
+        self._event_seq = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def emit(self, event_type: str, message: str = '', **data):
+        """Append an event for watchers of this job"""
+        with self._changed:
+            self._event_seq += 1
+            self.events.append({
+                'seq': self._event_seq,
+                'time': time.time(),
+                'type': event_type,
+                'message': message,
+                'data': data
+            })
+            self._changed.notify_all()
+
+    def events_since(self, since: int = 0, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Events newer than since, waiting up to timeout for one to arrive"""
+        with self._changed:
+            if timeout and self._event_seq <= since and not self.done:
+                self._changed.wait(timeout)
+            # seqs are consecutive, so the first newer event sits at a known offset from the oldest kept one
+            first_seq = self._event_seq - len(self.events) + 1
+            return list(islice(self.events, max(0, since - first_seq + 1), None))
+
+    def set_status(self, status: str, message: str = ''):
+        now = time.time()
+        with self._lock:
+            self.status = status
+            if status == 'running':
+                self.started_at = now
+            elif status in ('succeeded', 'failed'):
+                self.finished_at = now
+        self.emit('status', message or status, status=status)
+
+    def update_progress(self, **counters):
+        with self._lock:
+            self.progress.update(counters)
+        self.emit('progress', **counters)
+
+    def increment(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.progress[counter] = self.progress.get(counter, 0) + amount
+            progress = dict(self.progress)
+        self.emit('progress', **progress)
+
+    def finish(self, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self.result = result
+            self.error = error
+        if error is None:
+            self.set_status('succeeded')
+        else:
+            self.set_status('failed', error)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'params': self.params,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobManager:
+    """Runs jobs on a bounded worker pool and keeps recent ones for status queries"""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_finished: int = 200):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}  # job_id -> Job, in submission order
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, params: Optional[Dict[str, Any]] = None,
+               dedupe_key: Optional[str] = None, **kwargs) -> Job:
+        """Queue func(job, *args, **kwargs); its return value becomes the job result.
+
+        A submission whose dedupe_key matches a job still running, or finished within
+        DEDUPE_WINDOW, returns that job instead of queueing another.
+        """
+        job, created = self.create(kind, params, dedupe_key)
+        if created:
+            self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def create(self, kind: str, params: Optional[Dict[str, Any]] = None,
+               dedupe_key: Optional[str] = None) -> Tuple[Job, bool]:
+        """Register a job that the caller runs itself; returns (job, False) for a duplicate"""
+        with self._lock:
+            if dedupe_key is not None:
+                existing = self._find_duplicate(dedupe_key)
+                if existing is not None:
+                    return existing, False
+            job = Job(kind, params, dedupe_key)
+            self._jobs[job.id] = job
+            self._prune()
+        job.emit('status', 'queued', status='queued')
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, limit: int = 50) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())[-limit:]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'workers': self.max_workers,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'succeeded': statuses.count('succeeded'),
+            'failed': statuses.count('failed')
+        }
+
+    def _run(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict):
+        job.set_status('running')
+        try:
+            result = func(job, *args, **kwargs)
+        except Exception as e:
+            self.logger.error(f'Job {job.kind} {job.id} failed: {e}')
+            job.finish(error=str(e))
+            return
+        job.finish(result)
+
+    def _find_duplicate(self, dedupe_key: str) -> Optional[Job]:
+        cutoff = time.time() - DEDUPE_WINDOW
+        for job in reversed(list(self._jobs.values())):
+            if job.dedupe_key == dedupe_key and (not job.done or job.finished_at >= cutoff):
+                return job
+        return None
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
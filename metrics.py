@@ -0,0 +1,286 @@
+import functools
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)(\s+\d+)?$')
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base for a metric family; children are keyed by their label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def _default(self):
+        # Unlabelled metrics act as their own single child
+        if self.labelnames:
+            raise ValueError(f'{self.name} requires labels {self.labelnames}')
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                samples.append((self.name + suffix, {**labels, **extra}, value))
+        return samples
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class _Value:
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def samples(self):
+        return [('', {}, self.value)]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+
+class _HistogramValue:
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append(('_bucket', {'le': _format_value(bound)}, cumulative))
+        samples.append(('_bucket', {'le': '+Inf'}, count))
+        samples.append(('_sum', {}, total))
+        samples.append(('_count', {}, count))
+        return samples
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class MetricsRegistry:
+    """Holds metric families and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, callback: Callable[[], None]):
+        """Run callback before every render, e.g. to refresh gauges from live state"""
+        with self._lock:
+            self._collectors.append(callback)
+
+    def render(self, exclude: Iterable[str] = ()) -> str:
+        """Exposition of every family except those named in exclude"""
+        exclude = set(exclude)
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = [metric for metric in self._metrics.values() if metric.name not in exclude]
+        for callback in collectors:
+            callback()
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels):
+    """Decorator observing call duration, and counting raised exceptions, under the given labels"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.labels(**labels).inc()
+                raise
+            finally:
+                histogram.labels(**labels).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def family_names(text: str) -> List[str]:
+    """Names of the metric families declared (# TYPE) in a Prometheus text exposition"""
+    return [parts[2] for parts in (line.split(None, 3) for line in text.splitlines() if line.startswith('# TYPE'))
+            if len(parts) >= 3]
+
+
+def relabel_exposition(texts: Dict[str, str], label: str, prefixes: Tuple[str, ...] = ()) -> str:
+    """Merge several Prometheus text expositions, tagging each sample with label=<key>.
+
+    Only families whose name starts with one of prefixes are kept (all when empty).
+    HELP/TYPE lines are emitted once per family, followed by its samples from every source.
+    """
+    families = {}  # name -> {'meta': [...], 'samples': [...]}, in first-seen order
+    for source, text in texts.items():
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    family = families.setdefault(parts[2], {'meta': {}, 'samples': []})
+                    family['meta'].setdefault(parts[1], line)
+                continue
+
+            match = _SAMPLE_RE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.group(1), match.group(2), match.group(3)
+            family_name = name if name in families else next(
+                (f for f in families if name.startswith(f + '_')), name
+            )
+            family = families.setdefault(family_name, {'meta': {}, 'samples': []})
+            inner = labels[1:-1] if labels else ''
+            tag = f'{label}="{_escape(source)}"'
+            family['samples'].append(f'{name}{{{tag + ("," + inner if inner else "")}}} {value}')
+
+    lines = []
+    for name, family in families.items():
+        if prefixes and not name.startswith(prefixes):
+            continue
+        lines.extend(family['meta'][key] for key in ('HELP', 'TYPE') if key in family['meta'])
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + ('\n' if lines else '')
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,200 @@
+import logging
+import select
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+try:
+    import netifaces
+except ImportError:
+    netifaces = None
+
+DEFAULT_REFRESH_INTERVAL = 60.0
+FALLBACK_IP = '192.168.1.100'  # shown while no address has ever been discovered; never stored in a snapshot
+CHANGE_DEBOUNCE = 1.0  # netlink sends bursts of messages for one change
+
+# rtnetlink multicast groups: link state, IPv4 and IPv6 address changes
+_RTMGRP_LINK = 0x1
+_RTMGRP_IPV4_IFADDR = 0x10
+_RTMGRP_IPV6_IFADDR = 0x100
+
+
+def discover_primary_ip() -> Optional[str]:
+    """Address of the interface holding the default route (no packet is actually sent); None without one"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(('8.8.8.8', 80))
+            return s.getsockname()[0]
+    except Exception:
+        return None
+
+
+def is_local_address(ip: str) -> bool:
+    """Whether ip is currently assigned to one of this host's interfaces"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind((ip, 0))
+        return True
+    except (OSError, TypeError):
+        return False
+
+
+def discover_interfaces(primary_ip: Optional[str]) -> List[Dict[str, Any]]:
+    if netifaces is None:
+        return [{'interface': 'auto-detected', 'ip': primary_ip, 'is_primary': True}] if primary_ip else []
+
+    interfaces = []
+    for interface in netifaces.interfaces():
+        addrs = netifaces.ifaddresses(interface)
+        for addr in addrs.get(netifaces.AF_INET, []):
+            ip = addr['addr']
+            if not ip.startswith('127.'):
+                interfaces.append({'interface': interface, 'ip': ip, 'is_primary': ip == primary_ip})
+    return interfaces
+
+
+class NetworkInfoService:
+    """Caches the host's addresses and refreshes them on a timer or on netlink address events"""
+
+    def __init__(self, refresh_interval: float = DEFAULT_REFRESH_INTERVAL, use_netlink: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.refresh_interval = refresh_interval
+        self.use_netlink = use_netlink
+        self._snapshot = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._netlink = None
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def get_primary_ip(self) -> str:
+        return self.get_snapshot()['primary_ip'] or FALLBACK_IP
+
+    def get_interfaces(self) -> List[Dict[str, Any]]:
+        return self.get_snapshot()['interfaces']
+
+    def interface_for(self, ip: str) -> Optional[str]:
+        for entry in self.get_interfaces():
+            if entry['ip'] == ip:
+                return entry['interface']
+        return None
+
+    def on_change(self, listener: Callable[[Dict[str, Any], Dict[str, Any]], None]):
+        """Call listener(old_snapshot, new_snapshot) when the primary IP or address set changes"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def refresh(self) -> Dict[str, Any]:
+        primary_ip = discover_primary_ip()
+        if primary_ip is None:
+            # No default route right now (often a blip): keep the last known address rather than report a change
+            previous = self._snapshot
+            primary_ip = previous['primary_ip'] if previous else None
+            self.logger.debug(f'Primary IP discovery failed, keeping {primary_ip}')
+        snapshot = {
+            'primary_ip': primary_ip,
+            'interfaces': discover_interfaces(primary_ip),
+            'updated_at': time.time()
+        }
+
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+            listeners = list(self._listeners)
+
+        if previous is not None and self._addresses(previous) != self._addresses(snapshot):
+            self.logger.info(f'Network addresses changed: primary {previous["primary_ip"]} -> {primary_ip}')
+            for listener in listeners:
+                try:
+                    listener(previous, snapshot)
+                except Exception as e:
+                    self.logger.error(f'Network change listener failed: {e}')
+        return snapshot
+
+    def bindings(self, registry) -> List[Dict[str, Any]]:
+        """Which interface/IP each registered tunnel's service_url points at"""
+        snapshot = self.get_snapshot()
+        local_ips = ({entry['ip'] for entry in snapshot['interfaces']} | {snapshot['primary_ip']}) - {None}
+        bindings = []
+        for entry in registry.list_all():
+            if not entry.get('service_url'):
+                continue
+            host = urlparse(entry['service_url']).hostname
+            loopback = host in ('localhost', '::1') or (host or '').startswith('127.')
+            bindings.append({
+                'subdomain': entry['subdomain'],
+                'hostname': entry['hostname'],
+                'tunnel_id': entry['tunnel_id'],
+                'service_url': entry['service_url'],
+                'ip': host,
+                'interface': 'lo' if loopback else self.interface_for(host),
+                'is_primary': host == snapshot['primary_ip'],
+                'reachable': loopback or host in local_ips
+            })
+        return bindings
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh()
+        if self.use_netlink:
+            self._netlink = self._open_netlink()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='network-info', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.refresh_interval)
+        if self._netlink is not None:
+            self._netlink.close()
+            self._netlink = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._netlink is not None:
+                readable, _, _ = select.select([self._netlink], [], [], self.refresh_interval)
+                if readable:
+                    self._drain_netlink()
+                    # Let the burst of messages for one change settle before re-reading
+                    if self._stop.wait(CHANGE_DEBOUNCE):
+                        break
+                    self._drain_netlink()
+            elif self._stop.wait(self.refresh_interval):
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f'Network refresh failed: {e}')
+
+    def _open_netlink(self) -> Optional[socket.socket]:
+        if not hasattr(socket, 'AF_NETLINK'):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, _RTMGRP_LINK | _RTMGRP_IPV4_IFADDR | _RTMGRP_IPV6_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except OSError as e:
+            self.logger.info(f'Netlink address events unavailable, polling every {self.refresh_interval}s: {e}')
+            return None
+
+    def _drain_netlink(self):
+        try:
+            while self._netlink.recv(65536):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    @staticmethod
+    def _addresses(snapshot: Dict[str, Any]):
+        return snapshot['primary_ip'], frozenset((e['interface'], e['ip']) for e in snapshot['interfaces'])
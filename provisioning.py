@@ -0,0 +1,127 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class ProvisioningError(Exception):
+    """Raised when a pipeline step fails; completed steps have already been rolled back"""
+
+    def __init__(self, message: str, step: str, timings: Dict[str, float], rolled_back: List[str]):
+        super().__init__(message)
+        self.step = step
+        self.timings = timings
+        self.rolled_back = rolled_back
+
+
+class ProvisioningStep:
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any],
+                 depends_on: Iterable[str] = (), rollback: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.rollback = rollback
+
+
+class ProvisioningPipeline:
+    """Runs provisioning steps as soon as their dependencies finish, in parallel where possible.
+
+    Each step function receives a dict of the results of the steps it depends on.
+    If any step fails, no new steps are started, and the steps that succeeded are
+    rolled back in reverse completion order. An optional listener is called as
+    listener(step_name, state, elapsed) for started/succeeded/failed/rolled_back.
+    """
+
+    def __init__(self, max_workers: int = 4, listener: Optional[Callable[[str, str, Optional[float]], None]] = None):
+        self.max_workers = max_workers
+        self.listener = listener
+        self.logger = logging.getLogger(__name__)
+        self._steps = {}  # name -> ProvisioningStep, in insertion order
+
+    def add_step(self, name: str, func: Callable[[Dict[str, Any]], Any],
+                 depends_on: Iterable[str] = (), rollback: Optional[Callable[[Any], Any]] = None) -> 'ProvisioningPipeline':
+        depends_on = tuple(depends_on)
+        missing = [dep for dep in depends_on if dep not in self._steps]
+        if missing:
+            raise ValueError(f'Step {name} depends on unknown steps: {", ".join(missing)}')
+        self._steps[name] = ProvisioningStep(name, func, depends_on, rollback)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """Execute all steps and return {'results': ..., 'timings': ...}"""
+        started = time.perf_counter()
+        results = {}
+        timings = {}
+        completed = []
+        failure = None
+
+        pending = dict(self._steps)
+        running = {}  # future -> step name
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if failure is None:
+                    for name, step in list(pending.items()):
+                        if all(dep in results for dep in step.depends_on):
+                            inputs = {dep: results[dep] for dep in step.depends_on}
+                            running[executor.submit(self._run_step, step, inputs)] = name
+                            del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    ok, value, elapsed = future.result()
+                    timings[name] = elapsed
+                    self._notify(name, 'succeeded' if ok else 'failed', elapsed)
+                    if ok:
+                        results[name] = value
+                        completed.append(name)
+                    elif failure is None:
+                        failure = (name, value)
+
+        timings['total'] = round(time.perf_counter() - started, 4)
+
+        if failure is not None:
+            step_name, error = failure
+            rolled_back = self._rollback(completed, results)
+            raise ProvisioningError(f'{step_name} failed: {error}', step_name, timings, rolled_back)
+
+        return {'results': results, 'timings': timings}
+
+    def _notify(self, name: str, state: str, elapsed: Optional[float] = None):
+        if self.listener is None:
+            return
+        try:
+            self.listener(name, state, elapsed)
+        except Exception as e:
+            self.logger.error(f'Provisioning listener failed: {e}')
+
+    def _run_step(self, step: ProvisioningStep, inputs: Dict[str, Any]) -> Tuple[bool, Any, float]:
+        self._notify(step.name, 'started')
+        started = time.perf_counter()
+        try:
+            value = step.func(inputs)
+            ok = True
+        except Exception as e:
+            self.logger.error(f'Provisioning step {step.name} failed: {e}')
+            value = e
+            ok = False
+        return ok, value, round(time.perf_counter() - started, 4)
+
+    def _rollback(self, completed: List[str], results: Dict[str, Any]) -> List[str]:
+        rolled_back = []
+        for name in reversed(completed):
+            step = self._steps[name]
+            if step.rollback is None:
+                continue
+            try:
+                step.rollback(results[name])
+                rolled_back.append(name)
+                self._notify(name, 'rolled_back')
+            except Exception as e:
+                self.logger.error(f'Rollback of step {name} failed: {e}')
+        return rolled_back
@@ -0,0 +1,156 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from metrics import REGISTRY
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)  # earlier entries are served first
+
+DEFAULT_RATE_LIMIT = 1200  # Cloudflare's per-token budget...
+DEFAULT_RATE_PERIOD = 300  # ...per five minutes
+DEFAULT_INTERACTIVE_RESERVE = 0.1  # share of the bucket background calls may not spend
+
+RATE_LIMIT_QUEUE_DEPTH = REGISTRY.gauge(
+    'cloudflare_rate_limit_queue_depth', 'Cloudflare requests waiting for rate limit budget', ['priority'])
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    'cloudflare_rate_limit_wait_seconds', 'Time Cloudflare requests spent waiting for rate limit budget', ['priority'],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0))
+
+_current_priority = contextvars.ContextVar('cloudflare_request_priority', default=INTERACTIVE)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+@contextmanager
+def request_priority(priority: str):
+    """Run Cloudflare calls made in this block (on this thread) at the given priority"""
+    if priority not in PRIORITIES:
+        raise ValueError(f'Unknown request priority: {priority}')
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class RateLimiter:
+    """Token bucket for one API token's request budget.
+
+    When the bucket is empty callers queue instead of failing; interactive callers are
+    served before background ones, and background callers also leave a reserve untouched
+    so a bulk cleanup can't spend the budget a dashboard click needs.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_RATE_LIMIT, period: float = DEFAULT_RATE_PERIOD,
+                 interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE):
+        self.logger = logging.getLogger(__name__)
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period  # tokens per second
+        self.reserve = capacity * interactive_reserve
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = []  # heap of (rank, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {priority: {'queued': 0, 'acquired': 0, 'waited': 0, 'wait_seconds': 0.0,
+                                  'max_wait_seconds': 0.0, 'timeouts': 0} for priority in PRIORITIES}
+
+    def acquire(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> float:
+        """Take one request's worth of budget, waiting as long as needed; returns seconds waited"""
+        priority = priority or current_priority()
+        rank = PRIORITIES.index(priority)
+        floor = 1 + (self.reserve if priority == BACKGROUND else 0)
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+
+        with self._cond:
+            entry = (rank, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            self._stats[priority]['queued'] += 1
+            RATE_LIMIT_QUEUE_DEPTH.labels(priority=priority).inc()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == entry:
+                        delay = max(self._blocked_until - now, (floor - self._tokens) / self.rate)
+                        if delay <= 0:
+                            heapq.heappop(self._waiting)
+                            self._tokens -= 1
+                            # The next caller in line may be able to go too
+                            self._cond.notify_all()
+                            break
+                    else:
+                        delay = None  # woken when the head of the queue is served
+                    if deadline is not None:
+                        if now >= deadline:
+                            self._waiting.remove(entry)
+                            heapq.heapify(self._waiting)
+                            self._stats[priority]['timeouts'] += 1
+                            self._cond.notify_all()
+                            raise RateLimitTimeout(f'No Cloudflare rate limit budget within {timeout}s')
+                        delay = deadline - now if delay is None else min(delay, deadline - now)
+                    self._cond.wait(delay)
+            finally:
+                self._stats[priority]['queued'] -= 1
+                RATE_LIMIT_QUEUE_DEPTH.labels(priority=priority).dec()
+
+            waited = time.monotonic() - started
+            stats = self._stats[priority]
+            stats['acquired'] += 1
+            if waited >= 0.001:
+                stats['waited'] += 1
+                stats['wait_seconds'] += waited
+                stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+
+        RATE_LIMIT_WAIT_SECONDS.labels(priority=priority).observe(waited)
+        if waited >= 1:
+            self.logger.info(f'{priority.capitalize()} Cloudflare request waited {waited:.1f}s for rate limit budget')
+        return waited
+
+    def penalize(self, retry_after: float):
+        """Cloudflare said the budget is spent (429): hold every caller back for retry_after seconds"""
+        with self._cond:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+            self._blocked_until = max(self._blocked_until, self._updated + retry_after)
+            self._cond.notify_all()
+        self.logger.warning(f'Cloudflare rate limit hit, pausing requests for {retry_after:.1f}s')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'capacity': self.capacity,
+                'period': self.period,
+                'available': int(self._tokens),
+                'blocked_for': round(max(self._blocked_until - now, 0), 3),
+                'priorities': {
+                    priority: {**stats, 'wait_seconds': round(stats['wait_seconds'], 3),
+                               'max_wait_seconds': round(stats['max_wait_seconds'], 3),
+                               'avg_wait_seconds': round(stats['wait_seconds'] / stats['waited'], 3)
+                               if stats['waited'] else 0.0}
+                    for priority, stats in self._stats.items()
+                }
+            }
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
@@ -0,0 +1,190 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+from metrics import REGISTRY
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_CAPACITY = 720  # one hour at the default interval
+
+FIELDS = ('timestamp', 'cpu_percent', 'rss', 'open_fds', 'threads')
+TOP_METRICS = FIELDS[1:]
+
+TUNNEL_CPU = REGISTRY.gauge('tunnel_process_cpu_percent', 'Last sampled CPU% of a cloudflared process', ['tunnel_id'])
+TUNNEL_RSS = REGISTRY.gauge('tunnel_process_rss_bytes', 'Last sampled RSS of a cloudflared process', ['tunnel_id'])
+
+
+class ResourceSeries:
+    """Fixed-size ring of samples stored column-wise in arrays of doubles"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._columns = {field: array('d', bytes(8 * capacity)) for field in FIELDS}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, cpu_percent: float, rss: float, open_fds: float, threads: float):
+        with self._lock:
+            index = self._next
+            for field, value in zip(FIELDS, (timestamp, cpu_percent, rss, open_fds, threads)):
+                self._columns[field][index] = value
+            self._next = (index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        with self._lock:
+            if not self._count:
+                return None
+            return self._row((self._next - 1) % self.capacity)
+
+    def history(self, limit: Optional[int] = None) -> List[Dict[str, float]]:
+        """Samples oldest first, at most the newest limit of them"""
+        with self._lock:
+            count = self._count if limit is None else min(limit, self._count)
+            start = (self._next - count) % self.capacity
+            return [self._row((start + offset) % self.capacity) for offset in range(count)]
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._count:
+                return None
+            latest = self._row((self._next - 1) % self.capacity)
+            if self._count == self.capacity:
+                rss, cpu = self._columns['rss'], self._columns['cpu_percent']
+            else:
+                # Before the ring wraps, only the first _count slots hold samples
+                rss, cpu = self._columns['rss'][:self._count], self._columns['cpu_percent'][:self._count]
+            return {
+                **latest,
+                'samples': self._count,
+                'max_rss': int(max(rss)),
+                'avg_cpu_percent': round(sum(cpu) / len(cpu), 2)
+            }
+
+    def _row(self, index: int) -> Dict[str, float]:
+        row = {field: self._columns[field][index] for field in FIELDS}
+        for field in ('rss', 'open_fds', 'threads'):
+            row[field] = int(row[field])
+        return row
+
+
+class ResourceSampler:
+    """Background sampler of CPU, memory, FDs and threads for every supervised cloudflared"""
+
+    def __init__(self, process_manager, interval: float = DEFAULT_INTERVAL, capacity: int = DEFAULT_CAPACITY):
+        self.logger = logging.getLogger(__name__)
+        self.process_manager = process_manager
+        self.interval = interval
+        self.capacity = capacity
+        self._series = {}     # tunnel_id -> ResourceSeries
+        self._processes = {}  # tunnel_id -> psutil.Process, kept so cpu_percent() has a baseline
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def available(self) -> bool:
+        return psutil is not None
+
+    def start(self) -> bool:
+        if psutil is None:
+            self.logger.warning('psutil not installed, tunnel resource sampling disabled')
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def sample(self):
+        """Take one sample of every running tunnel process"""
+        pids = self.process_manager.get_process_pids()
+        now = time.time()
+
+        for tunnel_id, pid in pids.items():
+            process = self._processes.get(tunnel_id)
+            if process is None or process.pid != pid:
+                try:
+                    process = self._processes[tunnel_id] = psutil.Process(pid)
+                    process.cpu_percent(None)
+                except psutil.Error:
+                    continue
+            try:
+                with process.oneshot():
+                    cpu = process.cpu_percent(None)
+                    rss = process.memory_info().rss
+                    fds = process.num_fds() if hasattr(process, 'num_fds') else process.num_handles()
+                    threads = process.num_threads()
+            except psutil.Error:
+                # Exited between listing and sampling; the reaper will notice
+                continue
+
+            with self._lock:
+                series = self._series.get(tunnel_id)
+                if series is None:
+                    series = self._series[tunnel_id] = ResourceSeries(self.capacity)
+            series.append(now, cpu, rss, fds, threads)
+
+        # Forget tunnels that are no longer supervised
+        with self._lock:
+            for tunnel_id in [t for t in self._series if t not in pids]:
+                if self.process_manager.get_tunnel_status(tunnel_id).get('status') != 'restarting':
+                    del self._series[tunnel_id]
+                    TUNNEL_CPU.remove(tunnel_id=tunnel_id)
+                    TUNNEL_RSS.remove(tunnel_id=tunnel_id)
+        for tunnel_id in [t for t in self._processes if t not in pids]:
+            del self._processes[tunnel_id]
+
+    def get_summary(self, tunnel_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            series = self._series.get(tunnel_id)
+        return series.summary() if series else None
+
+    def get_history(self, tunnel_id: str, limit: Optional[int] = None) -> List[Dict[str, float]]:
+        with self._lock:
+            series = self._series.get(tunnel_id)
+        return series.history(limit) if series else []
+
+    def get_all_summaries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            series = dict(self._series)
+        summaries = {tunnel_id: s.summary() for tunnel_id, s in series.items()}
+        return {tunnel_id: summary for tunnel_id, summary in summaries.items() if summary}
+
+    def top(self, metric: str = 'rss', limit: int = 10) -> List[Dict[str, Any]]:
+        """Tunnels with the highest latest value of metric"""
+        if metric not in TOP_METRICS and metric not in ('max_rss', 'avg_cpu_percent'):
+            raise ValueError(f'Unknown metric: {metric}')
+        ranked = heapq.nlargest(limit, self.get_all_summaries().items(), key=lambda item: item[1][metric])
+        return [{'tunnel_id': tunnel_id, **summary} for tunnel_id, summary in ranked]
+
+    def collect_metrics(self):
+        for tunnel_id, summary in self.get_all_summaries().items():
+            TUNNEL_CPU.labels(tunnel_id=tunnel_id).set(summary['cpu_percent'])
+            TUNNEL_RSS.labels(tunnel_id=tunnel_id).set(summary['rss'])
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.error(f'Resource sampling failed: {e}')
+            if self._stop.wait(self.interval):
+                break
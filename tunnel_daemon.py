@@ -0,0 +1,728 @@
+"""Runs TunnelProcessManager as a long-lived daemon, so tunnels outlive restarts of the web process.
+
+    python tunnel_daemon.py --socket /run/dployme/tunnels.sock
+    TUNNEL_DAEMON_SOCKET=/run/dployme/tunnels.sock gunicorn -c gunicorn.conf.py wsgi:application
+
+The protocol is JSON lines. A request {"id", "method", "params"} gets {"id", "result"} or
+{"id", "error"} back. "subscribe_logs" turns its connection into a stream of
+{"seq", "line"} events (plus {"keepalive": true} while idle) until the client hangs up;
+"subscribe_invalidations" likewise streams the {"cache", "prefix", "origin"} cache invalidations
+that web workers publish with "cache.invalidate".
+
+The default socket lives in $XDG_RUNTIME_DIR, or else in a private per-user directory under
+the system temp dir. Clients refuse to talk to a socket served by another user.
+
+With --state-dir, tunnels outlive the daemon: on exit they are left running (unless
+--stop-tunnels-on-exit) and the next daemon with the same --state-dir adopts them.
+Without it, tunnels are stopped with the daemon.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from jobs import JobManager
+from metrics import REGISTRY
+from rate_limiter import RateLimiter, RateLimitTimeout, current_priority
+
+
+
+def default_socket_path() -> str:
+    """Per-user socket path, so two users on one host never reach each other's daemon"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'dployme-tunnels.sock')
+    return os.path.join(tempfile.gettempdir(), f'dployme-{os.getuid()}', 'tunnels.sock')
+
+
+DEFAULT_SOCKET_PATH = default_socket_path()
+DEFAULT_TIMEOUT = 30.0  # stop_tunnel waits for the process to exit, stop_all for all of them
+SUBSCRIBE_KEEPALIVE = 5.0  # idle seconds before a stream sends a keepalive, to notice dead clients
+
+# Everything the web process may call; other attributes of the manager are not reachable over the socket
+MANAGER_METHODS = {
+    'start_tunnel', 'stop_tunnel', 'stop_all_tunnels', 'get_tunnel_status', 'get_all_statuses',
+    'list_running_tunnels', 'get_process_pids', 'get_tunnel_logs', 'get_logs_since', 'get_last_log_seq',
+    'scrape_cloudflared_metrics'
+}
+SAMPLER_METHODS = {'get_summary', 'get_history', 'get_all_summaries', 'top'}
+# Job store shared by every web worker; the workers run the jobs and report their progress here
+JOB_METHODS = {'create', 'get', 'list', 'stats', 'emit', 'set_status', 'update_progress', 'increment', 'finish',
+               'events_since'}
+MAX_EVENT_WAIT = 60.0  # longest a jobs.events_since call may block its connection
+# Per-token Cloudflare budget shared by every web worker, keyed by a hash of the token
+RATE_LIMIT_METHODS = {'acquire', 'penalize', 'stats'}
+INVALIDATION_BACKLOG = 10000  # unsent invalidations a subscriber may fall behind before it is dropped
+RESUBSCRIBE_MAX_DELAY = 30.0
+
+
+class TunnelDaemonError(Exception):
+    pass
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server.tunnel_daemon
+        for raw in self.rfile:
+            try:
+                message = json.loads(raw)
+                method, params = message['method'], message.get('params') or {}
+            except (ValueError, KeyError, TypeError) as e:
+                self._send({'id': None, 'error': f'Malformed request: {e}'})
+                continue
+
+            if method == 'subscribe_logs':
+                self._stream_logs(daemon, message.get('id'), params)
+                return
+            if method == 'subscribe_invalidations':
+                self._stream_invalidations(daemon, message.get('id'))
+                return
+
+            try:
+                response = {'id': message.get('id'), 'result': daemon.call(method, params)}
+            except Exception as e:
+                daemon.logger.error(f'{method} failed: {e}')
+                response = {'id': message.get('id'), 'error': str(e)}
+            if not self._send(response):
+                return
+
+    def _stream_logs(self, daemon, request_id, params: Dict[str, Any]):
+        subscriber = daemon.manager.subscribe_logs(params['tunnel_id'])
+        try:
+            # Acknowledge only once subscribed, so the client can read the backlog without a gap
+            if not self._send({'id': request_id, 'result': 'subscribed'}):
+                return
+            while True:
+                try:
+                    seq, line = subscriber.get(timeout=SUBSCRIBE_KEEPALIVE)
+                    event = {'seq': seq, 'line': line}
+                except queue.Empty:
+                    event = {'keepalive': True}
+                if not self._send(event):
+                    return
+        finally:
+            daemon.manager.unsubscribe_logs(subscriber)
+
+    def _stream_invalidations(self, daemon, request_id):
+        subscriber = daemon.subscribe_invalidations()
+        try:
+            if not self._send({'id': request_id, 'result': 'subscribed'}):
+                return
+            # Dropped for falling behind: hanging up makes the client resubscribe and start from empty caches
+            while daemon.is_subscribed(subscriber):
+                try:
+                    event = subscriber.get(timeout=SUBSCRIBE_KEEPALIVE)
+                except queue.Empty:
+                    event = {'keepalive': True}
+                if not self._send(event):
+                    return
+        finally:
+            daemon.unsubscribe_invalidations(subscriber)
+
+    def _send(self, message: Dict[str, Any]) -> bool:
+        try:
+            self.wfile.write(json.dumps(message).encode() + b'\n')
+            self.wfile.flush()
+            return True
+        except OSError:
+            return False
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TunnelDaemon:
+    """Serves one TunnelProcessManager (and its resource sampler) on a Unix socket"""
+
+    def __init__(self, manager, socket_path: str = DEFAULT_SOCKET_PATH, sampler=None):
+        self.logger = logging.getLogger(__name__)
+        self.manager = manager
+        self.sampler = sampler
+        self.socket_path = socket_path
+        self.jobs = JobManager()
+        self._rate_limiters = {}  # (token hash, capacity, period) -> RateLimiter
+        self._rate_limiters_lock = threading.Lock()
+        self._invalidation_subscribers = set()
+        self._invalidation_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def call(self, method: str, params: Dict[str, Any]) -> Any:
+        if method in MANAGER_METHODS:
+            return getattr(self.manager, method)(**params)
+        if method.startswith('resources.') and method[len('resources.'):] in SAMPLER_METHODS:
+            if self.sampler is None:
+                raise Exception('Resource sampling is not enabled in the tunnel daemon')
+            return getattr(self.sampler, method[len('resources.'):])(**params)
+        if method == 'resources.settings':
+            if self.sampler is None:
+                return {'available': False, 'interval': 0}
+            return {'available': self.sampler.available, 'interval': self.sampler.interval}
+        if method.startswith('jobs.') and method[len('jobs.'):] in JOB_METHODS:
+            return self._call_jobs(method[len('jobs.'):], params)
+        if method.startswith('rate_limit.') and method[len('rate_limit.'):] in RATE_LIMIT_METHODS:
+            return self._call_rate_limit(method[len('rate_limit.'):], params)
+        if method == 'cache.invalidate':
+            return self._publish_invalidation(params)
+        if method == 'render_metrics':
+            return REGISTRY.render()
+        if method == 'ping':
+            return {'pid': os.getpid(), 'running': len(self.manager.running_tunnels)}
+        raise Exception(f'Unknown method: {method}')
+
+    def _call_jobs(self, name: str, params: Dict[str, Any]) -> Any:
+        if name == 'create':
+            job, created = self.jobs.create(params['kind'], params.get('params'), params.get('dedupe_key'))
+            return {'job': job.to_dict(), 'created': created}
+        if name == 'list':
+            return [job.to_dict() for job in self.jobs.list_jobs(params.get('limit', 50))]
+        if name == 'stats':
+            return self.jobs.stats()
+
+        job = self.jobs.get(params['job_id'])
+        if job is None:
+            if name == 'get':
+                return None
+            raise Exception(f"Job {params['job_id']} not found")
+        if name == 'get':
+            return job.to_dict()
+        if name == 'events_since':
+            return job.events_since(params.get('since', 0), timeout=min(params.get('timeout') or 0, MAX_EVENT_WAIT))
+        if name == 'emit':
+            job.emit(params['event_type'], params.get('message', ''), **params.get('data', {}))
+        elif name == 'set_status':
+            job.set_status(params['status'], params.get('message', ''))
+        elif name == 'update_progress':
+            job.update_progress(**params['counters'])
+        elif name == 'increment':
+            job.increment(params['counter'], params.get('amount', 1))
+        elif name == 'finish':
+            job.finish(params.get('result'), params.get('error'))
+        return None
+
+    def _call_rate_limit(self, name: str, params: Dict[str, Any]) -> Any:
+        key = (params['key'], params['capacity'], params['period'])
+        with self._rate_limiters_lock:
+            limiter = self._rate_limiters.get(key)
+            if limiter is None:
+                limiter = self._rate_limiters[key] = RateLimiter(params['capacity'], params['period'])
+
+        if name == 'acquire':
+            try:
+                return limiter.acquire(params['priority'], timeout=params.get('timeout'))
+            except RateLimitTimeout:
+                return None
+        if name == 'penalize':
+            return limiter.penalize(params['retry_after'])
+        return limiter.stats()
+
+    def subscribe_invalidations(self) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=INVALIDATION_BACKLOG)
+        with self._invalidation_lock:
+            self._invalidation_subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe_invalidations(self, subscriber: queue.Queue):
+        with self._invalidation_lock:
+            self._invalidation_subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber: queue.Queue) -> bool:
+        with self._invalidation_lock:
+            return subscriber in self._invalidation_subscribers
+
+    def _publish_invalidation(self, params: Dict[str, Any]) -> int:
+        event = {'cache': params['cache'], 'prefix': params['prefix'], 'origin': params.get('origin')}
+        with self._invalidation_lock:
+            for subscriber in list(self._invalidation_subscribers):
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    self._invalidation_subscribers.discard(subscriber)
+            return len(self._invalidation_subscribers)
+
+    def start(self):
+        """Bind the socket and serve on a background thread"""
+        self._bind()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='tunnel-daemon', daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._bind()
+        self._server.serve_forever()
+
+    def shutdown(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if _socket_alive(self.socket_path):
+                raise Exception(f'A tunnel daemon is already listening on {self.socket_path}')
+            os.unlink(self.socket_path)  # left behind by a daemon that died
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_uid != os.getuid():
+            raise Exception(f'Socket directory {directory} is owned by another user')
+
+        # Tunnel tokens cross this socket, so it must never be reachable by other users
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(previous_umask)
+        self._server.tunnel_daemon = self
+        self.logger.info(f'Tunnel daemon listening on {self.socket_path}')
+
+
+def _socket_alive(path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+class RemoteLogSubscriber:
+    """LogSubscriber stand-in fed by a streaming connection to the daemon"""
+
+    def __init__(self, tunnel_id: str, sock: socket.socket):
+        self.tunnel_id = tunnel_id
+        self.queue = queue.Queue()
+        self._sock = sock
+        self._thread = threading.Thread(target=self._read, name=f'logs-{tunnel_id[:8]}', daemon=True)
+        self._thread.start()
+
+    def get(self, timeout: float):
+        """Wait for the next (seq, line); raises queue.Empty on timeout"""
+        return self.queue.get(timeout=timeout)
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def _read(self):
+        try:
+            for raw in self._sock.makefile('rb'):
+                event = json.loads(raw)
+                if 'seq' in event:
+                    self.queue.put((event['seq'], event['line']))
+        except (OSError, ValueError):
+            pass
+
+
+class RemoteResourceSampler:
+    """The ResourceSampler read API, answered by the sampler running inside the daemon"""
+
+    def __init__(self, client: 'TunnelDaemonClient'):
+        self._client = client
+        self._settings = None
+
+    @property
+    def available(self) -> bool:
+        return self._get_settings()['available']
+
+    @property
+    def interval(self) -> float:
+        return self._get_settings()['interval']
+
+    def get_summary(self, tunnel_id: str) -> Optional[Dict[str, Any]]:
+        return self._client.call('resources.get_summary', tunnel_id=tunnel_id)
+
+    def get_history(self, tunnel_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._client.call('resources.get_history', tunnel_id=tunnel_id, limit=limit)
+
+    def get_all_summaries(self) -> Dict[str, Dict[str, Any]]:
+        return self._client.call('resources.get_all_summaries')
+
+    def top(self, metric: str = 'rss', limit: int = 10) -> List[Dict[str, Any]]:
+        return self._client.call('resources.top', metric=metric, limit=limit)
+
+    def _get_settings(self) -> Dict[str, Any]:
+        # Fixed for the daemon's lifetime, so one round trip is enough
+        if self._settings is None:
+            self._settings = self._client.call('resources.settings')
+        return self._settings
+
+
+class RemoteRateLimiter:
+    """RateLimiter stand-in that draws on the daemon's bucket for the token, shared by every web worker"""
+
+    def __init__(self, client: 'TunnelDaemonClient', api_token: str, capacity: int, period: float):
+        self._client = client
+        self.capacity = capacity
+        self.period = period
+        self._bucket = {'key': hashlib.sha256(api_token.encode()).hexdigest(), 'capacity': capacity, 'period': period}
+
+    def acquire(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> float:
+        # The priority is a context variable of the calling thread, so it has to be resolved here
+        priority = priority or current_priority()
+        waited = self._client._call('rate_limit.acquire', {**self._bucket, 'priority': priority, 'timeout': timeout},
+                                    None if timeout is None else timeout + self._client.timeout)
+        if waited is None:
+            raise RateLimitTimeout(f'No Cloudflare rate limit budget within {timeout}s')
+        return waited
+
+    def penalize(self, retry_after: float):
+        self._client.call('rate_limit.penalize', **self._bucket, retry_after=retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._client.call('rate_limit.stats', **self._bucket)
+
+
+class RemoteJob:
+    """Job stand-in whose state is kept by the daemon, so every web worker can report on it.
+
+    status and done ask the daemon; to_dict(), result and error are as of the last of those reads.
+    """
+
+    def __init__(self, client: 'TunnelDaemonClient', state: Dict[str, Any]):
+        self._client = client
+        self._state = state
+        self.id = state['job_id']
+        self.kind = state['kind']
+        self.params = state['params']
+
+    @property
+    def status(self) -> str:
+        return self.refresh()['status']
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def result(self) -> Any:
+        return self._state['result']
+
+    @property
+    def error(self) -> Optional[str]:
+        return self._state['error']
+
+    def refresh(self) -> Dict[str, Any]:
+        state = self._client.call('jobs.get', job_id=self.id)
+        if state is not None:  # pruned from the daemon: keep the last state seen
+            self._state = state
+        return self._state
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._state
+
+    def emit(self, event_type: str, message: str = '', **data):
+        self._client.call('jobs.emit', job_id=self.id, event_type=event_type, message=message, data=data)
+
+    def events_since(self, since: int = 0, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        # The daemon holds the call open for up to timeout, so the socket may wait that much longer
+        return self._client._call('jobs.events_since', {'job_id': self.id, 'since': since, 'timeout': timeout},
+                                  (timeout or 0) + self._client.timeout)
+
+    def set_status(self, status: str, message: str = ''):
+        self._client.call('jobs.set_status', job_id=self.id, status=status, message=message)
+
+    def update_progress(self, **counters):
+        self._client.call('jobs.update_progress', job_id=self.id, counters=counters)
+
+    def increment(self, counter: str, amount: int = 1):
+        self._client.call('jobs.increment', job_id=self.id, counter=counter, amount=amount)
+
+    def finish(self, result: Any = None, error: Optional[str] = None):
+        self._client.call('jobs.finish', job_id=self.id, result=result, error=error)
+
+
+class RemoteJobManager(JobManager):
+    """JobManager for web workers sharing a daemon: jobs run on this worker's pool, but are
+    registered in the daemon so any worker can serve their status and events
+    """
+
+    def __init__(self, client: 'TunnelDaemonClient', **kwargs):
+        super().__init__(**kwargs)
+        self._client = client
+
+    def create(self, kind: str, params: Optional[Dict[str, Any]] = None,
+               dedupe_key: Optional[str] = None) -> Tuple[RemoteJob, bool]:
+        response = self._client.call('jobs.create', kind=kind, params=params, dedupe_key=dedupe_key)
+        return RemoteJob(self._client, response['job']), response['created']
+
+    def get(self, job_id: str) -> Optional[RemoteJob]:
+        state = self._client.call('jobs.get', job_id=job_id)
+        return RemoteJob(self._client, state) if state is not None else None
+
+    def list_jobs(self, limit: int = 50) -> List[RemoteJob]:
+        return [RemoteJob(self._client, state) for state in self._client.call('jobs.list', limit=limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        # Counts cover every worker; the pool size is this worker's
+        return {**self._client.call('jobs.stats'), 'workers': self.max_workers}
+
+
+class TunnelDaemonClient:
+    """TunnelProcessManager look-alike that forwards every call to the tunnel daemon.
+
+    Each thread keeps its own connection, so concurrent requests in a worker don't serialise.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = DEFAULT_TIMEOUT):
+        self.logger = logging.getLogger(__name__)
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.resources = RemoteResourceSampler(self)
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def call(self, method: str, **params) -> Any:
+        return self._call(method, params, self.timeout)
+
+    def _call(self, method: str, params: Dict[str, Any], timeout: Optional[float]) -> Any:
+        request = json.dumps({'id': next(self._ids), 'method': method, 'params': params}).encode() + b'\n'
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.sock.settimeout(timeout)
+                conn.sock.sendall(request)
+                raw = conn.reader.readline()
+                if not raw:
+                    raise ConnectionError('tunnel daemon closed the connection')
+                break
+            except OSError as e:
+                self._drop_connection()
+                # A stale connection (daemon restarted) gets one retry on a fresh one
+                if attempt:
+                    raise TunnelDaemonError(f'Tunnel daemon at {self.socket_path} unavailable: {e}')
+
+        response = json.loads(raw)
+        if 'error' in response:
+            raise TunnelDaemonError(response['error'])
+        return response['result']
+
+    def start_tunnel(self, token: str, tunnel_id: str, tunnel_name: str = None) -> Dict[str, Any]:
+        return self.call('start_tunnel', token=token, tunnel_id=tunnel_id, tunnel_name=tunnel_name)
+
+    def stop_tunnel(self, tunnel_id: str) -> Dict[str, Any]:
+        return self.call('stop_tunnel', tunnel_id=tunnel_id)
+
+    def stop_all_tunnels(self) -> Dict[str, Any]:
+        # Each hung cloudflared can take the manager's full stop timeout, so don't cap the wait
+        return self._call('stop_all_tunnels', {}, timeout=None)
+
+    def get_tunnel_status(self, tunnel_id: str) -> Dict[str, Any]:
+        return self.call('get_tunnel_status', tunnel_id=tunnel_id)
+
+    def get_all_statuses(self) -> Dict[str, Dict[str, Any]]:
+        return self.call('get_all_statuses')
+
+    def list_running_tunnels(self) -> List[Dict[str, Any]]:
+        return self.call('list_running_tunnels')
+
+    def get_process_pids(self) -> Dict[str, int]:
+        return self.call('get_process_pids')
+
+    def get_tunnel_logs(self, tunnel_id: str, lines: int = 100) -> List[str]:
+        return self.call('get_tunnel_logs', tunnel_id=tunnel_id, lines=lines)
+
+    def get_logs_since(self, tunnel_id: str, since: int, limit: Optional[int] = None) -> List[tuple]:
+        return [tuple(entry) for entry in self.call('get_logs_since', tunnel_id=tunnel_id, since=since, limit=limit)]
+
+    def get_last_log_seq(self, tunnel_id: str) -> int:
+        return self.call('get_last_log_seq', tunnel_id=tunnel_id)
+
+    def scrape_cloudflared_metrics(self, timeout: Optional[float] = None) -> Dict[str, str]:
+        return self.call('scrape_cloudflared_metrics', **({'timeout': timeout} if timeout else {}))
+
+    def render_metrics(self) -> str:
+        """The daemon's own /metrics exposition: process states, restarts, log and resource gauges"""
+        return self.call('render_metrics')
+
+    def ping(self) -> Dict[str, Any]:
+        return self.call('ping')
+
+    def rate_limiter(self, api_token: str, capacity: int, period: float) -> RemoteRateLimiter:
+        """A limiter for cloudflare_tunnel_api.set_rate_limiter_factory"""
+        return RemoteRateLimiter(self, api_token, capacity, period)
+
+    def subscribe_logs(self, tunnel_id: str) -> RemoteLogSubscriber:
+        return RemoteLogSubscriber(tunnel_id, self._subscribe('subscribe_logs', {'tunnel_id': tunnel_id}))
+
+    def unsubscribe_logs(self, subscriber: RemoteLogSubscriber):
+        subscriber.close()
+
+    def publish_invalidation(self, cache_name: str, prefix: List[Any]):
+        """Tell the other workers to drop cache entries this one just invalidated"""
+        self.call('cache.invalidate', cache=cache_name, prefix=prefix, origin=os.getpid())
+
+    def follow_invalidations(self, apply: Callable[[str, List[Any]], Any]):
+        """Call apply(cache_name, prefix) for invalidations published by other processes, from a background thread"""
+        threading.Thread(target=self._follow_invalidations, args=(apply,), name='cache-invalidations',
+                         daemon=True).start()
+
+    def _follow_invalidations(self, apply: Callable[[str, List[Any]], Any]):
+        delay = 1.0
+        while True:
+            try:
+                sock = self._subscribe('subscribe_invalidations', {})
+            except (TunnelDaemonError, OSError, ValueError) as e:
+                self.logger.warning(f'Cannot follow cache invalidations, retrying in {delay:.0f}s: {e}')
+                time.sleep(delay)
+                delay = min(delay * 2, RESUBSCRIBE_MAX_DELAY)
+                continue
+            
+            delay = 1.0
+            # Anything published while we were not subscribed is lost, so start over from empty caches
+            apply('reads', [])
+            apply('metadata', [])
+            try:
+                for raw in sock.makefile('rb'):
+                    event = json.loads(raw)
+                    if 'cache' in event and event['origin'] != os.getpid():
+                        apply(event['cache'], event['prefix'])
+            except (OSError, ValueError) as e:
+                self.logger.warning(f'Cache invalidation stream failed: {e}')
+            finally:
+                sock.close()
+
+    def _subscribe(self, method: str, params: Dict[str, Any]) -> socket.socket:
+        """Open a connection and turn it into the stream the method starts"""
+        sock = self._connect()
+        try:
+            sock.sendall(json.dumps({'id': next(self._ids), 'method': method, 'params': params}).encode() + b'\n')
+            ack = b''
+            while not ack.endswith(b'\n'):
+                chunk = sock.recv(1)
+                if not chunk:
+                    raise TunnelDaemonError(f'Tunnel daemon closed the {method} stream')
+                ack += chunk
+        except Exception:
+            sock.close()
+            raise
+        response = json.loads(ack)
+        if 'error' in response:
+            sock.close()
+            raise TunnelDaemonError(response['error'])
+        # Reads on the stream block until the next line or keepalive
+        sock.settimeout(None)
+        return sock
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise TunnelDaemonError(f'Tunnel daemon at {self.socket_path} unavailable: {e}')
+        try:
+            # Tokens are sent over this socket, so check who is listening before sending anything
+            peer_uid = _peer_uid(sock, self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise TunnelDaemonError(f'Cannot verify the tunnel daemon at {self.socket_path}: {e}')
+        if peer_uid != os.getuid():
+            sock.close()
+            raise TunnelDaemonError(f'Tunnel daemon at {self.socket_path} is run by uid {peer_uid}, '
+                                    f'not uid {os.getuid()}')
+        return sock
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = self._connect()
+            conn = self._local.conn = _Connection(sock, sock.makefile('rb'))
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.reader.close()
+            conn.sock.close()
+
+
+def _peer_uid(sock: socket.socket, path: str) -> int:
+    """uid of the process serving a connected Unix socket; the socket file's owner where SO_PEERCRED is missing"""
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _pid, uid, _gid = struct.unpack('3i', creds)
+        return uid
+    return os.stat(path).st_uid
+
+
+class _Connection:
+
+    def __init__(self, sock: socket.socket, reader):
+        self.sock = sock
+        self.reader = reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the cloudflared process manager as a shared daemon')
+    parser.add_argument('--socket', default=os.environ.get('TUNNEL_DAEMON_SOCKET', DEFAULT_SOCKET_PATH))
+    parser.add_argument('--sample-interval', type=float, default=float(os.environ.get('RESOURCE_SAMPLE_INTERVAL', 5)),
+                        help='seconds between CPU/memory samples of each cloudflared; 0 disables sampling')
+    parser.add_argument('--state-dir', default=os.environ.get('TUNNEL_STATE_DIR'),
+                        help='pidfiles and logs of running tunnels, for adopting them after a restart')
+    parser.add_argument('--stop-tunnels-on-exit', action='store_true',
+                        help='stop every tunnel on shutdown instead of leaving them for the next daemon')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from tunnel_process_manager import TunnelProcessManager
+    from resource_sampler import ResourceSampler
+
+    manager = TunnelProcessManager(state_dir=args.state_dir)
+    if args.state_dir:
+        adoption = manager.adopt_running_tunnels()
+        if adoption.get('adopted'):
+            logging.getLogger(__name__).info(f"Adopted {len(adoption['adopted'])} running tunnel(s)")
+    REGISTRY.add_collector(manager.collect_metrics)
+    sampler = None
+    if args.sample_interval > 0:
+        sampler = ResourceSampler(manager, interval=args.sample_interval)
+        sampler.start()
+        REGISTRY.add_collector(sampler.collect_metrics)
+
+    daemon = TunnelDaemon(manager, args.socket, sampler=sampler)
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    daemon.start()
+    stopping.wait()
+
+    daemon.shutdown()
+    if sampler is not None:
+        sampler.stop()
+    if args.stop_tunnels_on_exit or not args.state_dir:
+        logging.getLogger(__name__).info('Tunnel daemon stopping, shutting down tunnels')
+        manager.stop_all_tunnels()
+    else:
+        logging.getLogger(__name__).info('Tunnel daemon stopping, leaving tunnels running for the next daemon')
+    manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+import ctypes
+import logging
+import os
+import queue
+import selectors
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+
+DEFAULT_MAX_LINES = 1000
+DEFAULT_MAX_BYTES = 256 * 1024
+READ_CHUNK = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024  # longer lines are split rather than buffered without bound
+TAIL_INTERVAL = 0.25
+LOG_FILE_MAX_BYTES = 4 * 1024 * 1024  # disk space of followed log files is released every this many bytes read
+
+# fallocate(2) hole punching, so a followed log file's read prefix can be freed while its writer keeps appending
+_FALLOC_FL_KEEP_SIZE = 0x01
+_FALLOC_FL_PUNCH_HOLE = 0x02
+_HOLE_ALIGNMENT = 4096
+try:
+    _fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+except (OSError, AttributeError, TypeError):
+    _fallocate = None
+
+_clock_cache = threading.local()
+
+
+def format_timestamp(timestamp: float) -> str:
+    """HH:MM:SS for a log line, reusing the last formatted second"""
+    second = int(timestamp)
+    if getattr(_clock_cache, 'second', None) != second:
+        _clock_cache.second = second
+        _clock_cache.text = time.strftime('%H:%M:%S', time.localtime(second))
+    return _clock_cache.text
+
+
+class LogRingBuffer:
+    """Bounded per-tunnel log store with O(1) appends and sequence-numbered lines"""
+
+    def __init__(self, max_lines: int = DEFAULT_MAX_LINES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = deque(maxlen=max_lines)  # (seq, timestamp, text, size)
+        self._size = 0
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self.closed_at = None  # set when the owning process exits
+
+    def append(self, text: str, timestamp: Optional[float] = None) -> int:
+        """Store a line and return its sequence number"""
+        size = len(text.encode('utf-8', 'replace'))
+        with self._lock:
+            if len(self._entries) == self._entries.maxlen:
+                self._size -= self._entries[0][3]
+            self._last_seq += 1
+            self._entries.append((self._last_seq, timestamp or time.time(), text, size))
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._size -= self._entries.popleft()[3]
+            return self._last_seq
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Formatted lines newer than seq, oldest first, at most limit of them"""
+        with self._lock:
+            # Readers usually want the newest few lines, so walk back from the tail
+            newer = []
+            for entry in reversed(self._entries):
+                if entry[0] <= seq:
+                    break
+                newer.append(entry)
+        newer.reverse()
+        if limit is not None:
+            newer = newer[:limit]
+        return [(entry[0], self._format(entry)) for entry in newer]
+
+    def tail(self, lines: int) -> List[Tuple[int, str]]:
+        """The last N formatted lines (all of them when lines <= 0)"""
+        with self._lock:
+            if lines <= 0 or lines >= len(self._entries):
+                entries = list(self._entries)
+            else:
+                entries = list(islice(reversed(self._entries), lines))
+                entries.reverse()
+        return [(entry[0], self._format(entry)) for entry in entries]
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _format(entry: tuple) -> str:
+        return f'[{format_timestamp(entry[1])}] {entry[2]}'
+
+
+class LogSubscriber:
+    """A single consumer of a tunnel's live log lines"""
+
+    def __init__(self, tunnel_id: str, max_pending: int):
+        self.tunnel_id = tunnel_id
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+    def get(self, timeout: float) -> Tuple[int, str]:
+        """Wait for the next (seq, line); raises queue.Empty on timeout"""
+        return self.queue.get(timeout=timeout)
+
+
+class LogBroadcaster:
+    """Fans out log lines to subscribers without ever blocking the producer"""
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._subscribers = {}  # tunnel_id -> set of LogSubscriber
+        self._lock = threading.Lock()
+
+    def subscribe(self, tunnel_id: str) -> LogSubscriber:
+        subscriber = LogSubscriber(tunnel_id, self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(tunnel_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LogSubscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.tunnel_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.tunnel_id]
+
+    def publish(self, tunnel_id: str, seq: int, line: str):
+        with self._lock:
+            subscribers = list(self._subscribers.get(tunnel_id, ()))
+
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait((seq, line))
+            except queue.Full:
+                # Slow client: drop the line, the gap in seq tells the reader what it missed
+                subscriber.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers: List[LogSubscriber] = [s for subs in self._subscribers.values() for s in subs]
+        return {
+            'subscribers': len(subscribers),
+            'dropped_lines': sum(s.dropped for s in subscribers)
+        }
+
+
+class LogMultiplexer:
+    """Reads the output of many child processes from a single selector thread.
+
+    Pipes are switched to non-blocking mode and drained in chunks; complete lines
+    are passed to on_line(key, text) and on_eof(key) is called once a pipe closes.
+    Not available on Windows, where select() does not support pipes.
+    """
+
+    def __init__(self, on_line: Callable[[str, str], None], on_eof: Optional[Callable[[str], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.on_line = on_line
+        self.on_eof = on_eof
+        self._selector = selectors.DefaultSelector()
+        self._pending = []  # (fileobj, key) registrations handed over to the reader thread
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='log-multiplexer', daemon=True)
+        self._thread.start()
+
+    def register(self, key: str, fileobj):
+        """Start reading a pipe; the reader thread owns and closes it from now on"""
+        os.set_blocking(fileobj.fileno(), False)
+        with self._lock:
+            self._pending.append((fileobj, key))
+        self._wake()
+
+    @property
+    def active(self) -> int:
+        return len(self._selector.get_map()) - 1
+
+    def close(self):
+        self._closed = True
+        self._wake()
+        self._thread.join(timeout=5)
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            pass  # a wakeup is already pending
+
+    def _run(self):
+        while not self._closed:
+            for selector_key, _ in self._selector.select():
+                if selector_key.data is None:
+                    self._drain_wakeups()
+                else:
+                    self._read(selector_key)
+
+        for selector_key in list(self._selector.get_map().values()):
+            if selector_key.data is not None:
+                self._finish(selector_key)
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for fileobj, key in pending:
+            # data is [key, partial line bytes]
+            self._selector.register(fileobj, selectors.EVENT_READ, [key, b''])
+
+    def _read(self, selector_key):
+        key, partial = selector_key.data
+        try:
+            chunk = os.read(selector_key.fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.logger.error(f'Error reading logs for {key}: {e}')
+            chunk = b''
+
+        if not chunk:
+            self._finish(selector_key)
+            return
+
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        if len(partial) > MAX_LINE_BYTES:
+            lines.append(partial)
+            partial = b''
+        selector_key.data[1] = partial
+        for line in lines:
+            self._emit(key, line)
+
+    def _finish(self, selector_key):
+        key, partial = selector_key.data
+        if partial:
+            self._emit(key, partial)
+        self._selector.unregister(selector_key.fileobj)
+        try:
+            selector_key.fileobj.close()
+        except OSError:
+            pass
+        if self.on_eof is not None:
+            try:
+                self.on_eof(key)
+            except Exception as e:
+                self.logger.error(f'Log EOF handler failed for {key}: {e}')
+
+    def _emit(self, key: str, line: bytes):
+        text = line.decode('utf-8', 'replace').strip()
+        if not text:
+            return
+        try:
+            self.on_line(key, text)
+        except Exception as e:
+            self.logger.error(f'Log handler failed for {key}: {e}')
+
+
+class LogFileTailer:
+    """Follows log files written by child processes from a single polling thread.
+
+    Unlike a pipe, a file outlives the process reading it, so a restarted manager can
+    pick up a running child's output where the last one left off. Every max_bytes read,
+    the disk space of what has been read is released: on Linux by punching a hole, which
+    leaves the writer's offset alone so nothing can be lost; elsewhere by truncating, which
+    needs the writer to have the file open in append mode.
+    """
+
+    def __init__(self, on_line: Callable[[str, str], None], interval: float = TAIL_INTERVAL,
+                 max_bytes: int = LOG_FILE_MAX_BYTES):
+        self.logger = logging.getLogger(__name__)
+        self.on_line = on_line
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._files = {}  # key -> [path, file, partial line bytes, skip first line, released up to]
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='log-file-tailer', daemon=True)
+        self._thread.start()
+
+    def register(self, key: str, path: str, offset: int = 0):
+        """Follow path from offset; a non-zero offset drops the (likely partial) first line"""
+        f = open(path, 'rb')
+        if offset and hasattr(os, 'SEEK_DATA'):
+            # Skip the hole left by an earlier reader's released prefix
+            try:
+                offset = max(offset, os.lseek(f.fileno(), offset, os.SEEK_DATA))
+            except OSError:
+                pass  # no data after offset yet
+        f.seek(offset)
+        with self._lock:
+            previous = self._files.pop(key, None)
+            self._files[key] = [path, f, b'', offset > 0, offset]
+        if previous is not None:
+            previous[1].close()
+
+    def unregister(self, key: str):
+        """Read whatever is left in the file, then stop following it"""
+        with self._lock:
+            entry = self._files.pop(key, None)
+            if entry is None:
+                return
+            self._read(key, entry)
+            if entry[2]:
+                self._emit(key, entry[2])
+        entry[1].close()
+
+    @property
+    def active(self) -> int:
+        return len(self._files)
+
+    def close(self):
+        self._closed.set()
+        self._thread.join(timeout=5)
+        with self._lock:
+            entries, self._files = self._files, {}
+        for entry in entries.values():
+            entry[1].close()
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            with self._lock:
+                for key, entry in list(self._files.items()):
+                    self._read(key, entry)
+
+    def _read(self, key: str, entry: list):
+        path, f, partial, skip = entry[:4]
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < f.tell():
+                f.seek(0)  # truncated underneath us
+                entry[4] = 0
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                if len(partial) > MAX_LINE_BYTES:
+                    lines.append(partial)
+                    partial = b''
+                if skip and lines:
+                    lines.pop(0)
+                    skip = False
+                for line in lines:
+                    self._emit(key, line)
+        except OSError as e:
+            self.logger.error(f'Error reading log file {path} for {key}: {e}')
+        entry[2], entry[3] = partial, skip
+        if f.tell() - entry[4] >= self.max_bytes:
+            self._release(key, entry)
+
+    def _release(self, key: str, entry: list):
+        """Free the disk space of everything read so far (a buffered partial line is already in memory)"""
+        path, f = entry[0], entry[1]
+        read_up_to = f.tell()
+        if _punch_hole(path, read_up_to):
+            entry[4] = read_up_to
+            return
+        try:
+            if os.stat(path).st_size != read_up_to:
+                return  # unread output; try again on a later poll
+            os.truncate(path, 0)
+            f.seek(0)
+            entry[4] = 0
+        except OSError:
+            return  # e.g. the writer holds the file locked on Windows; it just keeps growing
+        # A line written between the size check and the truncate is gone; say so rather than hide the gap
+        self._emit(key, b'[log file truncated; lines written at that moment may be missing]')
+
+    def _emit(self, key: str, line: bytes):
+        text = line.decode('utf-8', 'replace').strip()
+        if not text:
+            return
+        try:
+            self.on_line(key, text)
+        except Exception as e:
+            self.logger.error(f'Log handler failed for {key}: {e}')
+
+
+def _punch_hole(path: str, length: int) -> bool:
+    """Deallocate the whole blocks within a file's first length bytes, keeping its size and contents after (Linux)"""
+    length -= length % _HOLE_ALIGNMENT
+    if _fallocate is None or length <= 0:
+        return False
+    try:
+        fd = os.open(path, os.O_WRONLY)
+    except OSError:
+        return False
+    try:
+        return _fallocate(fd, _FALLOC_FL_PUNCH_HOLE | _FALLOC_FL_KEEP_SIZE, 0, length) == 0
+    finally:
+        os.close(fd)
@@ -5,57 +5,216 @@ import logging
 from typing import Dict, Any, List, Optional
 import signal
 import os
+import json
+import socket
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+from tunnel_logs import (LogBroadcaster, LogFileTailer, LogMultiplexer, LogRingBuffer, LogSubscriber,
+                         format_timestamp)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Logs of a stopped tunnel are kept this long before their buffer is evicted
+LOG_RETENTION_SECONDS = 3600
+
+# Supervisor defaults
+REAP_INTERVAL = 0.5         # seconds between reaper sweeps
+RESTART_BACKOFF = 1.0       # first restart delay, doubled for each consecutive crash
+MAX_RESTART_BACKOFF = 60.0
+MAX_RESTARTS = 5            # restarts allowed within CRASH_LOOP_WINDOW before giving up
+CRASH_LOOP_WINDOW = 300.0
+STABLE_UPTIME = 60.0        # a process that ran this long resets the backoff
+
+METRICS_SCRAPE_TIMEOUT = 1.0
+
+# Tags on every cloudflared we start, so a later manager can recognise and adopt it
+TUNNEL_ID_ENV = 'DPLOYME_TUNNEL_ID'
+STATE_DIR_ENV = 'DPLOYME_TUNNEL_STATE_DIR'
+CREATE_TIME_TOLERANCE = 1.0  # seconds; guards against a recycled PID
+
+TUNNEL_PROCESSES = REGISTRY.gauge('tunnel_processes', 'Supervised cloudflared processes by state', ['state'])
+TUNNEL_RESTARTS = REGISTRY.counter('tunnel_process_restarts_total', 'Automatic cloudflared restarts', ['tunnel_id'])
+TUNNEL_LOG_LINES = REGISTRY.counter('tunnel_log_lines_total', 'Log lines captured from cloudflared', ['tunnel_id'])
+TUNNEL_LOG_SUBSCRIBERS = REGISTRY.gauge('tunnel_log_subscribers', 'Live log stream subscribers')
+TUNNEL_LOG_DROPPED = REGISTRY.gauge('tunnel_log_dropped_lines', 'Lines dropped for slow live log subscribers')
+TUNNEL_ADOPTED = REGISTRY.counter('tunnel_processes_adopted_total', 'Running cloudflared processes adopted at startup')
+
+
+def _free_local_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _option_value(cmdline: List[str], option: str) -> Optional[str]:
+    for i, arg in enumerate(cmdline):
+        if arg == option and i + 1 < len(cmdline):
+            return cmdline[i + 1]
+        if arg.startswith(option + '='):
+            return arg[len(option) + 1:]
+    return None
+
+
+class AdoptedProcess:
+    """Popen look-alike for a cloudflared started by an earlier manager.
+
+    It is not our child, so its exit status can't be collected: returncode is -1 once it is gone.
+    """
+    
+    def __init__(self, process):
+        self._process = process
+        self.pid = process.pid
+        self.args = process.cmdline()
+        self.stdout = None
+        self.returncode = None
+    
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            try:
+                alive = self._process.is_running() and self._process.status() != psutil.STATUS_ZOMBIE
+            except psutil.NoSuchProcess:
+                alive = False
+            if not alive:
+                self.returncode = -1
+        return self.returncode
+    
+    def wait(self, timeout: Optional[float] = None) -> int:
+        try:
+            self._process.wait(timeout)
+        except psutil.TimeoutExpired:
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        except psutil.NoSuchProcess:
+            pass
+        self.returncode = -1
+        return self.returncode
+    
+    def terminate(self):
+        self._signal(self._process.terminate)
+    
+    def kill(self):
+        self._signal(self._process.kill)
+    
+    @staticmethod
+    def _signal(send):
+        try:
+            send()
+        except psutil.NoSuchProcess:
+            pass
 
 
 class TunnelProcessManager:
     """Manages cloudflared tunnel processes"""
     
-    def __init__(self):
+    def __init__(self, log_max_lines: int = 1000, log_max_bytes: int = 256 * 1024,
+                 log_retention: float = LOG_RETENTION_SECONDS, auto_restart: bool = True,
+                 max_restarts: int = MAX_RESTARTS, crash_loop_window: float = CRASH_LOOP_WINDOW,
+                 restart_backoff: float = RESTART_BACKOFF, reap_interval: float = REAP_INTERVAL,
+                 multiplex_logs: bool = True, cloudflared_metrics: bool = True,
+                 cloudflared_path: Optional[str] = None, stop_timeout: float = 10,
+                 state_dir: Optional[str] = None):
         self.logger = logging.getLogger(__name__)
-        self.running_tunnels = {}  # tunnel_id -> process info
-        self.tunnel_logs = {}      # tunnel_id -> log lines
+        self.running_tunnels = {}  # tunnel_id -> process info (includes tunnels waiting to restart)
+        self.tunnel_logs = {}      # tunnel_id -> LogRingBuffer
+        self.exited_tunnels = {}   # tunnel_id -> last exit info
+        self.log_broadcaster = LogBroadcaster()
+        self.log_max_lines = log_max_lines
+        self.log_max_bytes = log_max_bytes
+        self.log_retention = log_retention
+        self.auto_restart = auto_restart
+        self.max_restarts = max_restarts
+        self.crash_loop_window = crash_loop_window
+        self.restart_backoff = restart_backoff
+        self.reap_interval = reap_interval
+        self.cloudflared_metrics = cloudflared_metrics
+        self.cloudflared_path = cloudflared_path or os.environ.get('CLOUDFLARED_PATH') or 'cloudflared'
+        self.stop_timeout = stop_timeout
+        # With a state directory, cloudflared writes its output to a file there and gets a pidfile,
+        # so it outlives this manager and adopt_running_tunnels() can take it over after a restart
+        self.state_dir = os.path.abspath(state_dir) if state_dir else None
+        self._log_tailer = None
+        if self.state_dir:
+            os.makedirs(self.state_dir, mode=0o700, exist_ok=True)
+            self._log_tailer = LogFileTailer(self._handle_log_line)
+        self._lock = threading.RLock()
+        self._reaper = None
+        self._shutdown = threading.Event()
         
+        # One selector thread reads every child's output; Windows pipes can't be selected on,
+        # so there each process keeps its own reader thread
+        self._log_multiplexer = None
+        if multiplex_logs and os.name != 'nt':
+            self._log_multiplexer = LogMultiplexer(self._handle_log_line)
+    
     def start_tunnel(self, token: str, tunnel_id: str, tunnel_name: str = None) -> Dict[str, Any]:
         """Start a cloudflared tunnel process"""
         try:
-            if tunnel_id in self.running_tunnels:
-                return {
-                    'success': False,
-                    'error': f'Tunnel {tunnel_id} is already running'
+            with self._lock:
+                if tunnel_id in self.running_tunnels:
+                    return {
+                        'success': False,
+                        'error': f'Tunnel {tunnel_id} is already running'
+                    }
+                
+                # Reserve the slot, then spawn outside the lock so starts of different tunnels overlap
+                tunnel_info = self.running_tunnels[tunnel_id] = {
+                    'process': None,
+                    'token': token,
+                    'name': tunnel_name or tunnel_id,
+                    'start_time': time.time(),
+                    'command': None,
+                    'metrics_port': None,
+                    'state': 'starting',
+                    'restart_count': 0,
+                    'recent_restarts': [],
+                    'consecutive_crashes': 0,
+                    'last_exit_code': None,
+                    'next_restart_at': None,
+                    'adopted': False
                 }
             
-            # Prepare the cloudflared command
-            command = ['cloudflared', 'tunnel', '--token', token]
-            
-            # Start the process
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
-            )
+            try:
+                process, command, metrics_port = self._spawn(tunnel_id, token)
+            except Exception:
+                with self._lock:
+                    if self.running_tunnels.get(tunnel_id) is tunnel_info:
+                        del self.running_tunnels[tunnel_id]
+                raise
             
-            # Store process info
-            self.running_tunnels[tunnel_id] = {
-                'process': process,
-                'token': token,
-                'name': tunnel_name or tunnel_id,
-                'start_time': time.time(),
-                'command': ' '.join(command)
-            }
+            start_time = time.time()
+            self._write_pidfile(tunnel_id, {**tunnel_info, 'process': process, 'start_time': start_time})
             
-            # Initialize logs
-            self.tunnel_logs[tunnel_id] = []
+            with self._lock:
+                # Store process info
+                tunnel_info.update({
+                    'process': process,
+                    'start_time': start_time,
+                    'command': ' '.join(command),
+                    'metrics_port': metrics_port,
+                    'state': 'running'
+                })
+                stopped = self.running_tunnels.get(tunnel_id) is not tunnel_info
+                if not stopped:
+                    self.exited_tunnels.pop(tunnel_id, None)
+                    self._evict_stale_logs()
             
-            # Start log capture thread
-            log_thread = threading.Thread(
-                target=self._capture_logs,
-                args=(tunnel_id, process),
-                daemon=True
-            )
-            log_thread.start()
+            if stopped:
+                # stop_tunnel() ran while we were spawning; finish the stop it asked for
+                self._terminate(process)
+                with self._lock:
+                    if tunnel_id not in self.running_tunnels:
+                        self._record_exit(tunnel_id, process, tunnel_info, reason='stopped')
+                return {
+                    'success': False,
+                    'error': f'Tunnel {tunnel_id} was stopped while starting'
+                }
             
+            self._ensure_reaper()
             self.logger.info(f'Started tunnel {tunnel_id} with PID {process.pid}')
             
             return {
@@ -68,7 +227,7 @@ class TunnelProcessManager:
         except FileNotFoundError:
             return {
                 'success': False,
-                'error': 'cloudflared not found. Please install cloudflared first.'
+                'error': f'{self.cloudflared_path} not found. Please install cloudflared first.'
             }
         except Exception as e:
             self.logger.error(f'Error starting tunnel {tunnel_id}: {e}')
@@ -77,33 +236,85 @@ class TunnelProcessManager:
                 'error': str(e)
             }
     
+    def _spawn(self, tunnel_id: str, token: str):
+        """Launch cloudflared for a tunnel and start capturing its output"""
+        # Prepare the cloudflared command, giving each process its own local metrics listener
+        command = [self.cloudflared_path, 'tunnel']
+        metrics_port = None
+        if self.cloudflared_metrics:
+            metrics_port = _free_local_port()
+            command += ['--metrics', f'127.0.0.1:{metrics_port}']
+        command += ['--token', token]
+        
+        # Reuse the previous buffer so seq stays monotonic across restarts and stream clients can resume
+        self._get_log_buffer(tunnel_id).closed_at = None
+        
+        if self.state_dir:
+            # Output goes to a file instead of a pipe and the process gets its own session, so neither
+            # this manager exiting nor a Ctrl+C in its terminal takes the tunnel down
+            log_path = self._state_path(tunnel_id, '.log')
+            with open(log_path, 'ab') as log_file:
+                log_file.truncate(0)
+                os.chmod(log_path, 0o600)
+                process = subprocess.Popen(
+                    command,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    env={**os.environ, TUNNEL_ID_ENV: tunnel_id, STATE_DIR_ENV: self.state_dir},
+                    start_new_session=os.name != 'nt',
+                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
+                )
+            self._log_tailer.register(tunnel_id, log_path)
+            return process, command, metrics_port
+        
+        # Start the process (binary output: lines are decoded by the log reader)
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
+        )
+        
+        if self._log_multiplexer is not None:
+            self._log_multiplexer.register(tunnel_id, process.stdout)
+        else:
+            # Start log capture thread
+            log_thread = threading.Thread(
+                target=self._capture_logs,
+                args=(tunnel_id, process),
+                daemon=True
+            )
+            log_thread.start()
+        
+        return process, command, metrics_port
+    
     def stop_tunnel(self, tunnel_id: str) -> Dict[str, Any]:
         """Stop a specific tunnel"""
         try:
-            if tunnel_id not in self.running_tunnels:
+            # Unregister first so the reaper does not treat the exit as a crash
+            with self._lock:
+                tunnel_info = self.running_tunnels.pop(tunnel_id, None)
+            
+            if tunnel_info is None:
                 return {
                     'success': False,
                     'error': f'Tunnel {tunnel_id} is not running'
                 }
             
-            tunnel_info = self.running_tunnels[tunnel_id]
             process = tunnel_info['process']
+            if tunnel_info['state'] == 'starting':
+                # Still being spawned: start_tunnel() or the reaper sees the slot is gone and stops the process itself
+                self.logger.info(f'Stopped tunnel {tunnel_id} while it was starting')
+                return {
+                    'success': True,
+                    'message': f'Tunnel {tunnel_id} stopped successfully'
+                }
             
-            # Terminate the process
-            if os.name == 'nt':  # Windows
-                process.terminate()
-            else:  # Unix/Linux
-                process.terminate()
-            
-            # Wait for process to end
-            try:
-                process.wait(timeout=10)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                process.wait()
+            self._terminate(process)
             
             # Clean up
-            del self.running_tunnels[tunnel_id]
+            self._record_exit(tunnel_id, process, tunnel_info, reason='stopped')
             
             self.logger.info(f'Stopped tunnel {tunnel_id}')
             
@@ -119,75 +330,126 @@ class TunnelProcessManager:
                 'error': str(e)
             }
     
+    def _terminate(self, process):
+        """Ask a process to exit, killing it if it does not within stop_timeout"""
+        if process.poll() is None:
+            process.terminate()
+            
+            # Wait for process to end
+            try:
+                process.wait(timeout=self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    
     def get_tunnel_status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get status of a specific tunnel"""
-        if tunnel_id not in self.running_tunnels:
-            return {
-                'running': False,
-                'status': 'stopped'
-            }
-        
-        tunnel_info = self.running_tunnels[tunnel_id]
-        process = tunnel_info['process']
-        
-        # Check if process is still running
-        if process.poll() is None:
+        # The reaper keeps running_tunnels current, so this is a plain lookup
+        with self._lock:
+            tunnel_info = self.running_tunnels.get(tunnel_id)
+            if tunnel_info is None:
+                return self._stopped_status(tunnel_id)
+            
+            if tunnel_info['state'] == 'starting':
+                return {
+                    'running': False,
+                    'status': 'starting',
+                    'name': tunnel_info['name']
+                }
+            
+            if tunnel_info['state'] == 'restarting':
+                return {
+                    'running': False,
+                    'status': 'restarting',
+                    'name': tunnel_info['name'],
+                    'restart_count': tunnel_info['restart_count'],
+                    'last_exit_code': tunnel_info['last_exit_code'],
+                    'next_restart_in': max(0, round(tunnel_info['next_restart_at'] - time.time(), 1))
+                }
+            
             uptime = int(time.time() - tunnel_info['start_time'])
             return {
                 'running': True,
                 'status': 'running',
-                'pid': process.pid,
+                'pid': tunnel_info['process'].pid,
                 'uptime': uptime,
                 'name': tunnel_info['name'],
-                'command': tunnel_info['command']
-            }
-        else:
-            # Process has ended, clean up
-            del self.running_tunnels[tunnel_id]
-            return {
-                'running': False,
-                'status': 'stopped',
-                'exit_code': process.returncode
+                'command': tunnel_info['command'],
+                'metrics_port': tunnel_info['metrics_port'],
+                'restart_count': tunnel_info['restart_count'],
+                'last_exit_code': tunnel_info['last_exit_code'],
+                'adopted': tunnel_info['adopted']
             }
     
+    def get_all_statuses(self) -> Dict[str, Dict[str, Any]]:
+        """Get status of every known tunnel in a single sweep"""
+        with self._lock:
+            self._evict_stale_logs()
+            statuses = {}
+            for tunnel_id in list(self.running_tunnels.keys()) + list(self.exited_tunnels.keys()):
+                if tunnel_id not in statuses:
+                    statuses[tunnel_id] = self.get_tunnel_status(tunnel_id)
+            return statuses
+    
     def get_tunnel_logs(self, tunnel_id: str, lines: int = 100) -> List[str]:
         """Get recent log lines for a tunnel"""
         if tunnel_id not in self.tunnel_logs:
             return []
         
-        logs = self.tunnel_logs[tunnel_id]
-        return logs[-lines:] if lines > 0 else logs
+        return [line for _, line in self.tunnel_logs[tunnel_id].tail(lines)]
+    
+    def get_logs_since(self, tunnel_id: str, since: int, limit: Optional[int] = None) -> List[tuple]:
+        """Get (seq, line) pairs newer than the given sequence number"""
+        if tunnel_id not in self.tunnel_logs:
+            return []
+        
+        return self.tunnel_logs[tunnel_id].since(since, limit)
+    
+    def get_last_log_seq(self, tunnel_id: str) -> int:
+        buffer = self.tunnel_logs.get(tunnel_id)
+        return buffer.last_seq if buffer else 0
+    
+    def subscribe_logs(self, tunnel_id: str) -> LogSubscriber:
+        """Subscribe to log lines of a tunnel as they are captured"""
+        return self.log_broadcaster.subscribe(tunnel_id)
+    
+    def unsubscribe_logs(self, subscriber: LogSubscriber):
+        self.log_broadcaster.unsubscribe(subscriber)
     
     def list_running_tunnels(self) -> List[Dict[str, Any]]:
         """List all running tunnels"""
         running = []
         
-        # Clean up dead processes first
-        dead_tunnels = []
-        for tunnel_id, tunnel_info in self.running_tunnels.items():
-            if tunnel_info['process'].poll() is not None:
-                dead_tunnels.append(tunnel_id)
-        
-        for tunnel_id in dead_tunnels:
-            del self.running_tunnels[tunnel_id]
-        
         # Return info for running tunnels
-        for tunnel_id, tunnel_info in self.running_tunnels.items():
-            uptime = int(time.time() - tunnel_info['start_time'])
-            running.append({
-                'tunnel_id': tunnel_id,
-                'name': tunnel_info['name'],
-                'pid': tunnel_info['process'].pid,
-                'uptime': uptime,
-                'status': 'running'
-            })
+        with self._lock:
+            for tunnel_id, tunnel_info in self.running_tunnels.items():
+                if tunnel_info['state'] != 'running':
+                    continue
+                uptime = int(time.time() - tunnel_info['start_time'])
+                running.append({
+                    'tunnel_id': tunnel_id,
+                    'name': tunnel_info['name'],
+                    'pid': tunnel_info['process'].pid,
+                    'uptime': uptime,
+                    'status': 'running',
+                    'restart_count': tunnel_info['restart_count']
+                })
         
         return running
     
+    def get_process_pids(self) -> Dict[str, int]:
+        """tunnel_id -> PID of every currently running cloudflared"""
+        with self._lock:
+            return {
+                tunnel_id: info['process'].pid
+                for tunnel_id, info in self.running_tunnels.items() if info['state'] == 'running'
+            }
+    
     def stop_all_tunnels(self) -> Dict[str, Any]:
         """Stop all running tunnels"""
         results = []
-        tunnel_ids = list(self.running_tunnels.keys())
+        with self._lock:
+            tunnel_ids = list(self.running_tunnels.keys())
         
         for tunnel_id in tunnel_ids:
             result = self.stop_tunnel(tunnel_id)
@@ -203,32 +465,367 @@ class TunnelProcessManager:
             'results': results
         }
     
+    def collect_metrics(self):
+        """Refresh process gauges; meant to be registered as a metrics collector"""
+        with self._lock:
+            states = [info['state'] for info in self.running_tunnels.values()]
+            crashed = sum(1 for info in self.exited_tunnels.values() if info['reason'] == 'crash_loop')
+        TUNNEL_PROCESSES.labels(state='running').set(states.count('running'))
+        TUNNEL_PROCESSES.labels(state='restarting').set(states.count('restarting'))
+        TUNNEL_PROCESSES.labels(state='crashed').set(crashed)
+        broadcaster_stats = self.log_broadcaster.stats()
+        TUNNEL_LOG_SUBSCRIBERS.set(broadcaster_stats['subscribers'])
+        TUNNEL_LOG_DROPPED.set(broadcaster_stats['dropped_lines'])
+    
+    def scrape_cloudflared_metrics(self, timeout: float = METRICS_SCRAPE_TIMEOUT) -> Dict[str, str]:
+        """Fetch the Prometheus exposition of every running cloudflared, keyed by tunnel ID"""
+        with self._lock:
+            targets = {
+                tunnel_id: info['metrics_port'] for tunnel_id, info in self.running_tunnels.items()
+                if info['state'] == 'running' and info.get('metrics_port')
+            }
+        if not targets:
+            return {}
+        
+        def scrape(port):
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=timeout) as response:
+                    return response.read().decode('utf-8', 'replace')
+            except Exception as e:
+                self.logger.debug(f'Could not scrape cloudflared metrics on port {port}: {e}')
+                return None
+        
+        with ThreadPoolExecutor(max_workers=min(16, len(targets))) as executor:
+            texts = dict(zip(targets, executor.map(scrape, targets.values())))
+        return {tunnel_id: text for tunnel_id, text in texts.items() if text}
+    
+    def _record_exit(self, tunnel_id: str, process: subprocess.Popen, tunnel_info: Dict[str, Any] = None,
+                     reason: str = 'exited'):
+        """Remember how a tunnel process ended so status reads can report it"""
+        stopped_at = time.time()
+        self.exited_tunnels[tunnel_id] = {
+            'exit_code': process.returncode,
+            'stopped_at': stopped_at,
+            'reason': reason,
+            'restart_count': tunnel_info['restart_count'] if tunnel_info else 0
+        }
+        self._detach_log_file(tunnel_id)
+        self._remove_state_files(tunnel_id)
+        if tunnel_id in self.tunnel_logs:
+            self.tunnel_logs[tunnel_id].closed_at = stopped_at
+    
+    def _get_log_buffer(self, tunnel_id: str) -> LogRingBuffer:
+        buffer = self.tunnel_logs.get(tunnel_id)
+        if buffer is None:
+            buffer = self.tunnel_logs.setdefault(
+                tunnel_id, LogRingBuffer(self.log_max_lines, self.log_max_bytes)
+            )
+        return buffer
+    
+    def _evict_stale_logs(self):
+        """Drop log buffers, metric series and exit records of tunnels stopped longer than the retention period"""
+        cutoff = time.time() - self.log_retention
+        for tunnel_id, buffer in list(self.tunnel_logs.items()):
+            if tunnel_id in self.running_tunnels:
+                continue
+            if buffer.closed_at is not None and buffer.closed_at < cutoff:
+                del self.tunnel_logs[tunnel_id]
+                # Tunnel IDs churn with every deploy, so their metric series go with the logs
+                TUNNEL_RESTARTS.remove(tunnel_id=tunnel_id)
+                TUNNEL_LOG_LINES.remove(tunnel_id=tunnel_id)
+        for tunnel_id, exit_info in list(self.exited_tunnels.items()):
+            if tunnel_id not in self.running_tunnels and exit_info['stopped_at'] < cutoff:
+                del self.exited_tunnels[tunnel_id]
+    
+    def _stopped_status(self, tunnel_id: str) -> Dict[str, Any]:
+        status = {
+            'running': False,
+            'status': 'stopped'
+        }
+        exit_info = self.exited_tunnels.get(tunnel_id)
+        if exit_info:
+            status['exit_code'] = exit_info['exit_code']
+            status['restart_count'] = exit_info['restart_count']
+            if exit_info['reason'] == 'crash_loop':
+                status['status'] = 'crashed'
+        return status
+    
+    def shutdown(self):
+        """Stop the reaper and log reader threads; running tunnels are left alone"""
+        self._shutdown.set()
+        if self._reaper is not None:
+            self._reaper.join(timeout=self.reap_interval * 4)
+        if self._log_multiplexer is not None:
+            self._log_multiplexer.close()
+        if self._log_tailer is not None:
+            self._log_tailer.close()
+    
+    def adopt_running_tunnels(self) -> Dict[str, Any]:
+        """Take over cloudflared processes a previous manager with the same state directory left running"""
+        if not self.state_dir:
+            return {'success': False, 'error': 'No tunnel state directory configured'}
+        if psutil is None:
+            self.logger.warning('psutil not installed, running tunnels cannot be adopted')
+            return {'success': False, 'error': 'psutil is not installed'}
+        
+        # Pidfiles carry the name and restart count; the environment tag finds processes whose pidfile was lost
+        candidates = {}
+        for filename in os.listdir(self.state_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.state_dir, filename)
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+                candidates[record['tunnel_id']] = record
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning(f'Ignoring unreadable tunnel pidfile {path}: {e}')
+        
+        for process in psutil.process_iter(['pid', 'cmdline', 'create_time']):
+            cmdline = process.info['cmdline'] or []
+            if '--token' not in cmdline:
+                continue
+            try:
+                env = process.environ()
+            except psutil.Error:
+                continue
+            tunnel_id = env.get(TUNNEL_ID_ENV)
+            if tunnel_id and env.get(STATE_DIR_ENV) == self.state_dir and tunnel_id not in candidates:
+                candidates[tunnel_id] = {'tunnel_id': tunnel_id, 'pid': process.info['pid'],
+                                         'create_time': process.info['create_time']}
+        
+        adopted, stale = [], []
+        for tunnel_id, record in candidates.items():
+            with self._lock:
+                if tunnel_id in self.running_tunnels:
+                    continue
+                tunnel_info = self._adopt(tunnel_id, record)
+                if tunnel_info is None:
+                    stale.append(tunnel_id)
+                    self._remove_state_files(tunnel_id)
+                    continue
+                self.running_tunnels[tunnel_id] = tunnel_info
+                self._write_pidfile(tunnel_id, tunnel_info)
+            adopted.append({'tunnel_id': tunnel_id, 'pid': tunnel_info['process'].pid, 'name': tunnel_info['name']})
+            TUNNEL_ADOPTED.inc()
+            self.logger.info(f'Adopted running tunnel {tunnel_id} with PID {tunnel_info["process"].pid}')
+        
+        if adopted:
+            self._ensure_reaper()
+        if stale:
+            self.logger.info(f'Cleared state of {len(stale)} tunnel(s) no longer running: {", ".join(stale)}')
+        return {'success': True, 'adopted': adopted, 'stale': stale}
+    
+    def _adopt(self, tunnel_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Process info for a recorded cloudflared, or None when it is gone or its PID was reused"""
+        try:
+            process = psutil.Process(record['pid'])
+            if process.status() == psutil.STATUS_ZOMBIE:
+                return None
+            create_time = process.create_time()
+            if record.get('create_time') and abs(create_time - record['create_time']) > CREATE_TIME_TOLERANCE:
+                return None
+            cmdline = process.cmdline()
+        except (psutil.Error, KeyError, TypeError):
+            return None
+        
+        token = _option_value(cmdline, '--token')
+        if not token:
+            self.logger.warning(f'Cannot adopt tunnel {tunnel_id}: no token on the command line of PID {process.pid}')
+            return None
+        metrics = _option_value(cmdline, '--metrics')
+        
+        # Re-attach to its log file, replaying the tail that fits in the ring buffer
+        self._get_log_buffer(tunnel_id).closed_at = None
+        log_path = self._state_path(tunnel_id, '.log')
+        if os.path.exists(log_path):
+            try:
+                self._log_tailer.register(tunnel_id, log_path, max(0, os.path.getsize(log_path) - self.log_max_bytes))
+            except OSError as e:
+                self.logger.warning(f'Could not re-attach logs of tunnel {tunnel_id}: {e}')
+        
+        self.exited_tunnels.pop(tunnel_id, None)
+        return {
+            'process': AdoptedProcess(process),
+            'token': token,
+            'name': record.get('name') or tunnel_id,
+            'start_time': create_time,
+            'command': ' '.join(cmdline),
+            'metrics_port': int(metrics.rsplit(':', 1)[1]) if metrics and ':' in metrics else None,
+            'state': 'running',
+            'restart_count': record.get('restart_count', 0),
+            'recent_restarts': [],
+            'consecutive_crashes': 0,
+            'last_exit_code': None,
+            'next_restart_at': None,
+            'adopted': True
+        }
+    
+    def _state_path(self, tunnel_id: str, suffix: str) -> str:
+        return os.path.join(self.state_dir, urllib.parse.quote(tunnel_id, safe='') + suffix)
+    
+    def _write_pidfile(self, tunnel_id: str, tunnel_info: Dict[str, Any]):
+        if not self.state_dir:
+            return
+        pid = tunnel_info['process'].pid
+        create_time = tunnel_info['start_time']
+        if psutil is not None:
+            try:
+                create_time = psutil.Process(pid).create_time()
+            except psutil.Error:
+                pass
+        record = {
+            'tunnel_id': tunnel_id,
+            'pid': pid,
+            'create_time': create_time,
+            'name': tunnel_info['name'],
+            'restart_count': tunnel_info['restart_count']
+        }
+        path = self._state_path(tunnel_id, '.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(record, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            self.logger.error(f'Could not write pidfile for tunnel {tunnel_id}: {e}')
+    
+    def _remove_state_files(self, tunnel_id: str):
+        if not self.state_dir:
+            return
+        for suffix in ('.json', '.log'):
+            try:
+                os.unlink(self._state_path(tunnel_id, suffix))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.warning(f'Could not remove {suffix} state file of tunnel {tunnel_id}: {e}')
+    
+    def _detach_log_file(self, tunnel_id: str):
+        if self._log_tailer is not None:
+            self._log_tailer.unregister(tunnel_id)
+    
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._shutdown.clear()
+                self._reaper = threading.Thread(target=self._reap_loop, name='tunnel-reaper', daemon=True)
+                self._reaper.start()
+    
+    def _reap_loop(self):
+        """Single supervisor thread: notices exits and performs scheduled restarts"""
+        while not self._shutdown.wait(self.reap_interval):
+            try:
+                self._reap_once()
+            except Exception as e:
+                self.logger.error(f'Tunnel reaper error: {e}')
+    
+    def _reap_once(self):
+        now = time.time()
+        due = []
+        with self._lock:
+            for tunnel_id, tunnel_info in list(self.running_tunnels.items()):
+                if tunnel_info['state'] == 'running':
+                    process = tunnel_info['process']
+                    if process.poll() is not None:
+                        self._handle_exit(tunnel_id, tunnel_info, now)
+                elif tunnel_info['state'] == 'restarting' and now >= tunnel_info['next_restart_at']:
+                    # Claimed here, spawned below without the lock so status reads and stops don't wait on Popen
+                    tunnel_info['state'] = 'starting'
+                    due.append((tunnel_id, tunnel_info))
+        
+        for tunnel_id, tunnel_info in due:
+            self._restart(tunnel_id, tunnel_info, now)
+    
+    def _handle_exit(self, tunnel_id: str, tunnel_info: Dict[str, Any], now: float):
+        process = tunnel_info['process']
+        tunnel_info['last_exit_code'] = process.returncode
+        self.logger.warning(f'Tunnel {tunnel_id} exited with code {process.returncode}')
+        
+        if not self.auto_restart:
+            del self.running_tunnels[tunnel_id]
+            self._record_exit(tunnel_id, process, tunnel_info)
+            return
+        
+        recent = [t for t in tunnel_info['recent_restarts'] if now - t < self.crash_loop_window]
+        tunnel_info['recent_restarts'] = recent
+        if len(recent) >= self.max_restarts:
+            self.logger.error(f'Tunnel {tunnel_id} is crash-looping ({len(recent)} restarts '
+                              f'in {int(self.crash_loop_window)}s), giving up')
+            del self.running_tunnels[tunnel_id]
+            self._record_exit(tunnel_id, process, tunnel_info, reason='crash_loop')
+            return
+        
+        if now - tunnel_info['start_time'] >= STABLE_UPTIME:
+            tunnel_info['consecutive_crashes'] = 0
+        tunnel_info['consecutive_crashes'] += 1
+        delay = min(self.restart_backoff * (2 ** (tunnel_info['consecutive_crashes'] - 1)), MAX_RESTART_BACKOFF)
+        
+        tunnel_info['state'] = 'restarting'
+        tunnel_info['next_restart_at'] = now + delay
+        self._detach_log_file(tunnel_id)
+        if tunnel_id in self.tunnel_logs:
+            self.tunnel_logs[tunnel_id].closed_at = now
+        self.logger.info(f'Restarting tunnel {tunnel_id} in {delay:.1f}s')
+    
+    def _restart(self, tunnel_id: str, tunnel_info: Dict[str, Any], now: float):
+        """Respawn a tunnel claimed by _reap_once; called without the lock"""
+        try:
+            process, command, metrics_port = self._spawn(tunnel_id, tunnel_info['token'])
+        except Exception as e:
+            self.logger.error(f'Error restarting tunnel {tunnel_id}: {e}')
+            with self._lock:
+                if self.running_tunnels.get(tunnel_id) is tunnel_info:
+                    del self.running_tunnels[tunnel_id]
+                    self._record_exit(tunnel_id, tunnel_info['process'], tunnel_info, reason='restart_failed')
+                elif tunnel_id not in self.running_tunnels:
+                    self._record_exit(tunnel_id, tunnel_info['process'], tunnel_info, reason='stopped')
+            return
+        
+        restart_count = tunnel_info['restart_count'] + 1
+        self._write_pidfile(tunnel_id, {**tunnel_info, 'process': process, 'start_time': now,
+                                        'restart_count': restart_count})
+        
+        with self._lock:
+            tunnel_info.update({
+                'process': process,
+                'command': ' '.join(command),
+                'metrics_port': metrics_port,
+                'start_time': now,
+                'state': 'running',
+                'next_restart_at': None,
+                'restart_count': restart_count,
+                'adopted': False
+            })
+            tunnel_info['recent_restarts'].append(now)
+            stopped = self.running_tunnels.get(tunnel_id) is not tunnel_info
+        
+        if stopped:
+            # stop_tunnel() ran while we were spawning; finish the stop it asked for
+            self._terminate(process)
+            with self._lock:
+                if tunnel_id not in self.running_tunnels:
+                    self._record_exit(tunnel_id, process, tunnel_info, reason='stopped')
+            return
+        
+        TUNNEL_RESTARTS.labels(tunnel_id=tunnel_id).inc()
+        self.logger.info(f'Restarted tunnel {tunnel_id} with PID {process.pid} (restart #{restart_count})')
+    
+    def _handle_log_line(self, tunnel_id: str, text: str):
+        """Store a captured line and push it to live subscribers"""
+        timestamp = time.time()
+        seq = self._get_log_buffer(tunnel_id).append(text, timestamp)
+        TUNNEL_LOG_LINES.labels(tunnel_id=tunnel_id).inc()
+        self.log_broadcaster.publish(tunnel_id, seq, f'[{format_timestamp(timestamp)}] {text}')
+    
     def _capture_logs(self, tunnel_id: str, process: subprocess.Popen):
-        """Capture logs from a tunnel process"""
+        """Capture logs from a tunnel process on a dedicated thread (fallback reader)"""
         try:
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    log_entry = f"[{time.strftime('%H:%M:%S')}] {line.strip()}"
-                    
-                    if tunnel_id not in self.tunnel_logs:
-                        self.tunnel_logs[tunnel_id] = []
-                    
-                    self.tunnel_logs[tunnel_id].append(log_entry)
-                    
-                    # Keep only last 1000 lines to prevent memory issues
-                    if len(self.tunnel_logs[tunnel_id]) > 1000:
-                        self.tunnel_logs[tunnel_id] = self.tunnel_logs[tunnel_id][-1000:]
-                
-                # If process has ended, break
-                if process.poll() is not None:
-                    break
+            for line in iter(process.stdout.readline, b''):
+                text = line.decode('utf-8', 'replace').strip()
+                if text:
+                    self._handle_log_line(tunnel_id, text)
                     
         except Exception as e:
             self.logger.error(f'Error capturing logs for tunnel {tunnel_id}: {e}')
         finally:
-            # Ensure we clean up when the process ends
-            if tunnel_id in self.running_tunnels:
-                process_info = self.running_tunnels[tunnel_id]['process']
-                if process_info.poll() is not None:
-                    # Process has ended, we'll clean this up in the next status check
-                    pass
+            process.stdout.close()
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tunnels (
+    subdomain      TEXT PRIMARY KEY,
+    hostname       TEXT,
+    tunnel_id      TEXT NOT NULL,
+    tunnel_name    TEXT,
+    dns_record_id  TEXT,
+    service_url    TEXT,
+    token          TEXT,
+    created_at     REAL NOT NULL,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tunnels_tunnel_id ON tunnels (tunnel_id);
+"""
+
+FIELDS = ('hostname', 'tunnel_id', 'tunnel_name', 'dns_record_id', 'service_url', 'token')
+
+
+class TunnelRegistry:
+    """Local SQLite record of the tunnels, DNS records and tokens this app created"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        if db_path != ':memory:' and not os.path.exists(db_path):
+            # The registry holds tunnel tokens, so create it owner-only
+            os.close(os.open(db_path, os.O_CREAT | os.O_WRONLY, 0o600))
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            if db_path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+
+    def record(self, subdomain: str, **fields) -> Dict[str, Any]:
+        """Insert or update the entry for a subdomain"""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f'Unknown registry fields: {", ".join(sorted(unknown))}')
+
+        now = time.time()
+        with self._lock, self._conn:
+            existing = self._conn.execute(
+                'SELECT 1 FROM tunnels WHERE subdomain = ?', (subdomain,)
+            ).fetchone()
+            if existing:
+                if fields:
+                    assignments = ', '.join(f'{name} = ?' for name in fields)
+                    self._conn.execute(
+                        f'UPDATE tunnels SET {assignments}, updated_at = ? WHERE subdomain = ?',
+                        (*fields.values(), now, subdomain)
+                    )
+                else:
+                    self._conn.execute('UPDATE tunnels SET updated_at = ? WHERE subdomain = ?', (now, subdomain))
+            else:
+                if 'tunnel_id' not in fields:
+                    raise ValueError('tunnel_id is required for a new registry entry')
+                columns = ', '.join(('subdomain', *fields, 'created_at', 'updated_at'))
+                placeholders = ', '.join('?' * (len(fields) + 3))
+                self._conn.execute(
+                    f'INSERT INTO tunnels ({columns}) VALUES ({placeholders})',
+                    (subdomain, *fields.values(), now, now)
+                )
+        return self.get(subdomain)
+
+    def get(self, subdomain: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM tunnels WHERE subdomain = ?', (subdomain,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_tunnel_id(self, tunnel_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM tunnels WHERE tunnel_id = ? ORDER BY created_at', (tunnel_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM tunnels ORDER BY created_at').fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, subdomain: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM tunnels WHERE subdomain = ?', (subdomain,))
+        return cursor.rowcount > 0
+
+    def remove_tunnel(self, tunnel_id: str) -> int:
+        """Forget every subdomain routed through a tunnel"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM tunnels WHERE tunnel_id = ?', (tunnel_id,))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()